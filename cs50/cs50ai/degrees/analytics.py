@@ -0,0 +1,201 @@
+"""
+Whole-graph analytics with NumPy and SciPy.
+
+Usage: python analytics.py [-d DIRECTORY] [-s SOURCE] [-k SAMPLES]
+                           [-o OUTPUT_DIRECTORY] [--seed SEED]
+
+The graph's CSR arrays already are the person x movie incidence matrix
+and its transpose, so both are wrapped as scipy.sparse matrices without
+copying. Distances from one person to everyone are computed by a
+level-synchronous BFS: each level gathers the movie rows of the whole
+frontier at once, keeps the movies not seen before, then gathers their
+casts the same way. Degree statistics come straight from the offset
+arrays, and eccentricity is estimated from BFS runs at sampled people.
+
+Writes distances.csv (the degrees of separation of every person from
+SOURCE, blank when unreachable), movies_per_person.csv, cast_sizes.csv
+and eccentricity.csv to OUTPUT_DIRECTORY. Needs the in-memory graph.
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+from scipy import sparse
+
+import degrees
+
+UNREACHABLE = -1
+
+
+class Incidence:
+    """
+    The person x movie incidence matrix of a Graph and its transpose,
+    sharing the graph's index arrays.
+    """
+
+    def __init__(self, graph):
+        people, movies = graph.person_count(), graph.movie_count()
+        person_movies = np.frombuffer(graph.person_movies, dtype=np.int32)
+        movie_people = np.frombuffer(graph.movie_people, dtype=np.int32)
+        self.people = sparse.csr_matrix(
+            (
+                np.ones(len(person_movies), dtype=np.int8),
+                person_movies,
+                np.frombuffer(graph.person_offsets, dtype=np.int32),
+            ),
+            shape=(people, movies),
+        )
+        self.movies = sparse.csr_matrix(
+            (
+                np.ones(len(movie_people), dtype=np.int8),
+                movie_people,
+                np.frombuffer(graph.movie_offsets, dtype=np.int32),
+            ),
+            shape=(movies, people),
+        )
+
+    def distances(self, source):
+        """
+        Returns an array of the degrees of separation of every person
+        from person index `source`, with UNREACHABLE for people in other
+        components.
+        """
+        people, movies = self.people, self.movies
+        distances = np.full(people.shape[0], UNREACHABLE, dtype=np.int32)
+        seen_movies = np.zeros(people.shape[1], dtype=bool)
+        distances[source] = 0
+        frontier = np.array([source])
+        level = 0
+        while len(frontier):
+            level += 1
+            # Filter before de-duplicating: most gathered entries are seen
+            reached = people[frontier].indices
+            reached = np.unique(reached[~seen_movies[reached]])
+            seen_movies[reached] = True
+            cast = movies[reached].indices
+            frontier = np.unique(cast[distances[cast] == UNREACHABLE])
+            distances[frontier] = level
+        return distances
+
+
+def movies_per_person(graph):
+    return np.diff(np.frombuffer(graph.person_offsets, dtype=np.int32))
+
+
+def cast_sizes(graph):
+    return np.diff(np.frombuffer(graph.movie_offsets, dtype=np.int32))
+
+
+def summarize(values):
+    """
+    Returns count, mean, median, 90th and 99th percentiles and maximum of
+    an array of counts.
+    """
+    if not len(values):
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "median": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": int(values.max()),
+    }
+
+
+def eccentricities(graph, incidence, samples, rng, component=None):
+    """
+    Returns (person indices, eccentricities) for `samples` people drawn
+    at random from `component`, the largest component by default. The
+    largest is a lower bound on the component's diameter.
+    """
+    labels = np.frombuffer(graph.person_components, dtype=np.int32)
+    if component is None:
+        component = int(np.argmax(np.frombuffer(graph.component_sizes, np.int32)))
+    members = np.flatnonzero(labels == component)
+    chosen = rng.choice(members, size=min(samples, len(members)), replace=False)
+    return chosen, np.array([incidence.distances(p).max() for p in chosen])
+
+
+def write_distances(path, graph, distances):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["person_id", "name", "degrees"])
+        for person, distance in enumerate(distances.tolist()):
+            writer.writerow(
+                [
+                    graph.person_ids[person],
+                    graph.person_names[person],
+                    "" if distance == UNREACHABLE else distance,
+                ]
+            )
+
+
+def write_histogram(path, values, label):
+    """
+    Writes how many entries of `values` take each value, skipping values
+    no entry takes.
+    """
+    counts = np.bincount(values)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([label, "count"])
+        for value in np.flatnonzero(counts):
+            writer.writerow([int(value), int(counts[value])])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-d", "--directory", default="large")
+    parser.add_argument("-s", "--source", default="Kevin Bacon", help="name or ID")
+    parser.add_argument("-k", "--samples", type=int, default=16)
+    parser.add_argument("-o", "--output", default=".", help="directory for CSVs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    degrees.load_data(args.directory)
+    graph = degrees.graph
+    try:
+        source = graph.person_index(degrees.name_index.resolve(args.source))
+    except LookupError as e:
+        sys.exit(str(e))
+    incidence = Incidence(graph)
+    os.makedirs(args.output, exist_ok=True)
+
+    distances = incidence.distances(source)
+    write_distances(os.path.join(args.output, "distances.csv"), graph, distances)
+    reached = distances[distances != UNREACHABLE]
+    print(f"Degrees from {graph.person_names[source]}: {summarize(reached)}")
+    for level, count in enumerate(np.bincount(reached)):
+        print(f"  {level}: {count}")
+
+    movies = movies_per_person(graph)
+    casts = cast_sizes(graph)
+    write_histogram(
+        os.path.join(args.output, "movies_per_person.csv"), movies, "movies"
+    )
+    write_histogram(os.path.join(args.output, "cast_sizes.csv"), casts, "cast_size")
+    print(f"Movies per person: {summarize(movies)}")
+    print(f"Cast sizes: {summarize(casts)}")
+
+    rng = np.random.default_rng(args.seed)
+    people, eccentricity = eccentricities(graph, incidence, args.samples, rng)
+    with open(
+        os.path.join(args.output, "eccentricity.csv"),
+        "w",
+        encoding="utf-8",
+        newline="",
+    ) as f:
+        writer = csv.writer(f)
+        writer.writerow(["person_id", "eccentricity"])
+        for person, value in zip(people.tolist(), eccentricity.tolist()):
+            writer.writerow([graph.person_ids[person], value])
+    print(f"Sampled eccentricity: {summarize(eccentricity)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Budgeted, cancellable shortest-path search.
+
+`search` is a generator over the same bidirectional breadth-first search
+as degrees.shortest_path, built on the Node and QueueFrontier classes of
+util.py. It yields a Progress every `report_every` expansions, and
+checks its budget before every expansion: a deadline on the monotonic
+clock, a maximum number of expansions, and a cancellation flag such as a
+threading.Event. Its last item, which is also its return value, is an
+Outcome: the path, "not connected", "budget exceeded" or "cancelled",
+with the Progress made so far. Closing the generator stops the search
+too.
+
+Given constraints.Constraints, the search expands people through their
+raw movie lists instead of the co-star lists, as degrees.shortest_path
+does, so the budget bounds constrained queries as well.
+"""
+
+import time
+from collections import namedtuple
+
+import degrees
+from util import Node, QueueFrontier
+
+FOUND = "found"
+NOT_CONNECTED = "not connected"
+BUDGET_EXCEEDED = "budget exceeded"
+CANCELLED = "cancelled"
+
+REPORT_EVERY = 1000
+
+# `bound` is the fewest degrees a path not yet found could have
+Progress = namedtuple("Progress", "expansions reached frontier bound elapsed")
+
+# `path` is a list of (movie_id, person_id) pairs when status is FOUND
+Outcome = namedtuple("Outcome", "status path progress")
+
+
+class _Side:
+    """One direction of the search: its frontier and the Node per state."""
+
+    def __init__(self, root, allowed=None):
+        self.frontier = QueueFrontier()
+        self.reached = {root: Node(root, None, None)}
+        self.frontier.add(self.reached[root])
+        self.depth = 0
+        # Movies this side may still expand through, when constrained
+        self.unexpanded = None if allowed is None else bytearray(allowed)
+
+
+def search(
+    source,
+    target,
+    deadline=None,
+    max_expansions=None,
+    cancel=None,
+    report_every=REPORT_EVERY,
+    constraints=None,
+):
+    """
+    Yields Progress while searching from person_id `source` to
+    `target`, then yields and returns their Outcome.
+    """
+    graph = degrees.graph
+    started = time.monotonic()
+    expansions = 0
+    source, target = graph.person_index(source), graph.person_index(target)
+    allowed, blocked = None, ()
+    if constraints is not None:
+        allowed = constraints.allowed_movies(graph)
+        blocked = constraints.blocked_people(graph)
+    forward, backward = _Side(source, allowed), _Side(target, allowed)
+
+    def progress():
+        return Progress(
+            expansions,
+            len(forward.reached) + len(backward.reached),
+            len(forward.frontier) + len(backward.frontier),
+            forward.depth + backward.depth + 1,
+            time.monotonic() - started,
+        )
+
+    if source == target:
+        outcome = Outcome(FOUND, [], progress())
+        yield outcome
+        return outcome
+    if not graph.connected(source, target) or source in blocked or target in blocked:
+        outcome = Outcome(NOT_CONNECTED, None, progress())
+        yield outcome
+        return outcome
+
+    while not forward.frontier.empty() and not backward.frontier.empty():
+        if len(forward.frontier) <= len(backward.frontier):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+
+        # Expand one full level, so the first meeting is a shortest path
+        for _ in range(len(side.frontier)):
+            if cancel is not None and cancel.is_set():
+                outcome = Outcome(CANCELLED, None, progress())
+                yield outcome
+                return outcome
+            if (deadline is not None and time.monotonic() >= deadline) or (
+                max_expansions is not None and expansions >= max_expansions
+            ):
+                outcome = Outcome(BUDGET_EXCEEDED, None, progress())
+                yield outcome
+                return outcome
+
+            node = side.frontier.remove()
+            expansions += 1
+            for neighbor, movie in _steps(side, node.state, blocked):
+                if neighbor in side.reached:
+                    continue
+                child = Node(neighbor, node, movie)
+                if neighbor in other.reached:
+                    path = _join(child, other.reached[neighbor], side is forward)
+                    outcome = Outcome(FOUND, graph.path_ids(path), progress())
+                    yield outcome
+                    return outcome
+                side.reached[neighbor] = child
+                side.frontier.add(child)
+
+            if expansions % report_every == 0:
+                yield progress()
+        side.depth += 1
+
+    outcome = Outcome(NOT_CONNECTED, None, progress())
+    yield outcome
+    return outcome
+
+
+def run(
+    source, target, timeout=None, max_expansions=None, cancel=None, constraints=None
+):
+    """
+    Runs `search` to completion and returns its Outcome, giving up after
+    `timeout` seconds or `max_expansions` expansions. `constraints` is
+    passed on to `search`.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    outcome = None
+    for outcome in search(
+        source, target, deadline, max_expansions, cancel, constraints=constraints
+    ):
+        pass
+    return outcome
+
+
+def _steps(side, person, blocked):
+    """
+    Returns the (person index, movie index) steps out of `person` on
+    `side`: its co-stars, or when constrained, the people of its movies
+    that `side` has not expanded yet, outside `blocked`.
+    """
+    if side.unexpanded is None:
+        neighbors, shared = degrees.costars.of(person)
+        return zip(neighbors, shared)
+    return _constrained_steps(side.unexpanded, person, blocked)
+
+
+def _constrained_steps(unexpanded, person, blocked):
+    graph = degrees.graph
+    for movie in graph.movies_of(person):
+        if not unexpanded[movie]:
+            continue
+        unexpanded[movie] = 0
+        for neighbor in graph.stars_of(movie):
+            if neighbor not in blocked:
+                yield neighbor, movie
+
+
+def _join(node, meeting, forward):
+    """
+    Returns the (movie index, person index) path joining `node` and
+    `meeting`, two Nodes for the same person reached from either end.
+    `forward` says whether `node` was reached from the source.
+    """
+    near, far = [], []
+    while node.parent is not None:
+        near.append((node.action, node.state))
+        node = node.parent
+    near.reverse()
+    while meeting.parent is not None:
+        far.append((meeting.action, meeting.parent.state))
+        meeting = meeting.parent
+    if forward:
+        return near + far
+    # The walk runs from the target to the source
+    return _reverse(near + far, node.state)
+
+
+def _reverse(path, start):
+    """
+    Returns `path`, a (movie, person) walk from `start`, as the walk in
+    the opposite direction.
+    """
+    people = [start] + [person for _, person in path]
+    movies = [movie for movie, _ in path]
+    people.reverse()
+    movies.reverse()
+    return list(zip(movies, people[1:]))
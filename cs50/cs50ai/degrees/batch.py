@@ -0,0 +1,211 @@
+"""
+Answer many degrees-of-separation queries at once.
+
+Usage: python batch.py [-d DIRECTORY] [-w WORKERS] [-o OUTPUT]
+                       [-c MB | [-t SECONDS] [-e EXPANSIONS]] [PAIRS]
+
+PAIRS is a file (default: stdin) with one query per line: two names or
+person IDs separated by a tab, or by a comma when there is no tab.
+Results are written as JSON lines in input order. With a time or
+expansion budget, each search runs through anytime.search, constrained
+or not, and its result carries a status; a search that runs out of
+budget is reported as "budget exceeded" with the progress it made.
+Building a cached BFS tree cannot be cut short, so a budget and the tree
+cache are exclusive.
+
+The graph is loaded once in the parent. Workers are forked after the
+load and share its pages copy-on-write; a memory-mapped snapshot is
+shared through the page cache even on platforms that cannot fork.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import anytime
+import degrees
+import instrument
+from cache import TreeCache
+
+# Per-process BFS tree cache, or None to search every pair from scratch
+tree_cache = None
+
+# Per-search (timeout seconds, max expansions), or None for no budget
+budget = None
+
+
+def parse_pairs(lines):
+    """
+    Yields (source, target) queries from `lines`, skipping blank lines.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        separator = "\t" if "\t" in line else ","
+        source, _, target = line.partition(separator)
+        yield source.strip(), target.strip()
+
+
+def answer(pair, constraints=None):
+    """
+    Returns the JSON-serializable result for one (source, target) query,
+    optionally limited by constraints.Constraints.
+    """
+    source, target = pair
+    result = {"source": source, "target": target}
+    try:
+        resolve = degrees.name_index.resolve
+        source_id, target_id = resolve(source), resolve(target)
+    except LookupError as e:
+        result["error"] = str(e)
+        return result
+
+    # Building a cached tree cannot be cut short, so a budget bypasses it
+    if budget is not None:
+        outcome = anytime.run(source_id, target_id, *budget, constraints=constraints)
+        result["status"] = outcome.status
+        if outcome.status == anytime.BUDGET_EXCEEDED:
+            result["progress"] = outcome.progress._asdict()
+        path = outcome.path
+    elif tree_cache is not None and constraints is None:
+        path = tree_cache.shortest_path(source_id, target_id)
+    else:
+        path = degrees.shortest_path(source_id, target_id, constraints=constraints)
+    result["source_id"], result["target_id"] = source_id, target_id
+    result["degrees"] = None if path is None else len(path)
+    result["path"] = path
+    if instrument.active is not None:
+        result["stats"] = instrument.active.flush(source=source, target=target)
+    return result
+
+
+def _answer_with_cache_stats(pair):
+    """
+    Returns answer(pair) with this process's ID and tree cache stats.
+    """
+    return answer(pair), os.getpid(), tree_cache.stats()
+
+
+def _init_worker(directory, cache_bytes, stats_path=None, search_budget=None):
+    global tree_cache, budget
+    budget = search_budget
+    if stats_path:
+        instrument.enable(stats_path)
+    # Only needed without fork: every worker maps the same snapshot
+    if degrees.graph is None:
+        degrees.load_data(directory)
+    if cache_bytes:
+        tree_cache = TreeCache(degrees.graph, cache_bytes)
+
+
+def run(
+    pairs,
+    output,
+    directory,
+    workers=None,
+    chunksize=64,
+    cache_bytes=0,
+    stats_path=None,
+    search_budget=None,
+    cache_stats=None,
+):
+    """
+    Answers every query in `pairs`, writing one JSON line per query to
+    `output` in input order. Returns the number of queries answered.
+
+    With `cache_bytes`, each process keeps a TreeCache of that size, so
+    pairs sharing an endpoint are answered from a cached BFS tree. With
+    `stats_path`, every result carries its search stats, which are also
+    appended to that file as JSON lines. With `search_budget`, a
+    (timeout seconds, max expansions) pair, searches give up once either
+    runs out. With both `cache_bytes` and a `cache_stats` dict, the tree
+    cache stats of every process are summed into it.
+    """
+    count = 0
+    if workers == 1:
+        _init_worker(directory, cache_bytes, stats_path, search_budget)
+        for result in map(answer, pairs):
+            output.write(json.dumps(result) + "\n")
+            count += 1
+        if tree_cache is not None and cache_stats is not None:
+            cache_stats.update(tree_cache.stats())
+        return count
+
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(method)
+    initargs = (directory, cache_bytes, stats_path, search_budget)
+    # Latest stats of each worker; the counters in them are running totals
+    worker_stats = {}
+    with context.Pool(workers, _init_worker, initargs) as pool:
+        if cache_bytes:
+            results = pool.imap(_answer_with_cache_stats, pairs, chunksize)
+        else:
+            results = (
+                (result, None, None) for result in pool.imap(answer, pairs, chunksize)
+            )
+        for result, pid, stats in results:
+            output.write(json.dumps(result) + "\n")
+            count += 1
+            if pid is not None:
+                worker_stats[pid] = stats
+    if cache_stats is not None:
+        for stats in worker_stats.values():
+            for key, value in stats.items():
+                cache_stats[key] = cache_stats.get(key, 0) + value
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pairs", nargs="?", help="query file (default: stdin)")
+    parser.add_argument("-d", "--directory", default="large")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=os.cpu_count(), help="processes"
+    )
+    parser.add_argument("-o", "--output", help="JSONL file (default: stdout)")
+    parser.add_argument(
+        "-c", "--tree-cache", type=int, default=0, help="BFS tree cache MB per worker"
+    )
+    parser.add_argument("-s", "--stats", help="append per-query stats JSONL here")
+    parser.add_argument("-t", "--timeout", type=float, help="seconds per search")
+    parser.add_argument(
+        "-e", "--max-expansions", type=int, help="people expanded per search"
+    )
+    args = parser.parse_args()
+    search_budget = None
+    if args.timeout is not None or args.max_expansions is not None:
+        search_budget = (args.timeout, args.max_expansions)
+        if args.tree_cache:
+            parser.error("--tree-cache cannot be combined with a search budget")
+
+    degrees.load_data(args.directory)
+
+    pairs = open(args.pairs, encoding="utf-8") if args.pairs else sys.stdin
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    cache_stats = {}
+    try:
+        count = run(
+            parse_pairs(pairs),
+            output,
+            args.directory,
+            args.workers,
+            cache_bytes=args.tree_cache * 2**20,
+            stats_path=args.stats,
+            search_budget=search_budget,
+            cache_stats=cache_stats,
+        )
+    finally:
+        if args.pairs:
+            pairs.close()
+        if args.output:
+            output.close()
+    print(f"Answered {count} queries.", file=sys.stderr)
+    if cache_stats:
+        print(f"Tree cache: {cache_stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Benchmark load time, memory and query latency on synthetic data.
+
+Usage: python benchmark.py [--sizes N,N,...] [--queries Q] [--seed S]
+                           [--output FILE] [--baseline FILE]
+                           [--tolerance T] [--keep DIRECTORY]
+
+For each size, a seeded generator writes IMDB-shaped people.csv,
+movies.csv and stars.csv with power-law cast sizes and power-law
+popularity of people. The harness then times a CSV load, a snapshot
+write and a snapshot map, records memory, and measures shortest_path
+latency percentiles grouped by the degrees of separation of each pair.
+Results are written as JSON. Given a baseline from an earlier run, any
+timing that got more than --tolerance times slower is reported and the
+exit status is 1 (the default tolerance is 1.25). With --keep, each
+generated dataset is kept in a subdirectory of DIRECTORY named after its
+size, instead of in a temporary directory that is removed afterwards.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import degrees
+import snapshot
+
+SYLLABLES = (
+    "al an ar be bo ca da de el en er fa ga ha in is ja ka la le li lo ma me "
+    "mi mo na ne ni no ra re ri ro sa se si so ta te ti to va vi ya za"
+).split()
+
+
+def generate(directory, people, movies, seed=0):
+    """
+    Writes a synthetic dataset with `people` people and `movies` movies
+    to `directory`.
+
+    Cast sizes follow a Pareto distribution, and each cast member is
+    drawn with probability proportional to a Zipf-like popularity weight,
+    so a few people appear in many movies and most appear in one or two.
+    Some people never appear in any movie, as in the real export.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(f"{directory}/people.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        for i in range(people):
+            birth = rng.randint(1900, 2005) if rng.random() < 0.7 else ""
+            writer.writerow([i + 1, _name(rng), birth])
+
+    with open(f"{directory}/movies.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "year"])
+        for i in range(movies):
+            title = " ".join(_word(rng).capitalize() for _ in range(rng.randint(1, 4)))
+            writer.writerow([1_000_000 + i, title, rng.randint(1920, 2024)])
+
+    # Cumulative popularity weights: person k has weight (k + 10) ** -0.8
+    weights, total = [], 0.0
+    for k in range(people):
+        total += (k + 10) ** -0.8
+        weights.append(total)
+    ranking = list(range(1, people + 1))
+    rng.shuffle(ranking)
+
+    with open(f"{directory}/stars.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["person_id", "movie_id"])
+        for movie in range(movies):
+            cast = min(int(rng.paretovariate(1.2)) + 3, 60)
+            picks = rng.choices(ranking, cum_weights=weights, k=cast)
+            for person in set(picks):
+                writer.writerow([person, 1_000_000 + movie])
+
+
+def _word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def _name(rng):
+    return f"{_word(rng).capitalize()} {_word(rng).capitalize()}"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_size(directory, queries, seed):
+    """
+    Benchmarks the dataset in `directory` and returns its results.
+    """
+    result = {}
+    _, result["load_csv_s"] = timed(degrees.load_data, directory, False)
+    graph = degrees.graph
+    _, result["snapshot_write_s"] = timed(
+        snapshot.write, graph, directory, degrees.load_report
+    )
+    _, result["snapshot_load_s"] = timed(degrees.load_data, directory)
+    graph = degrees.graph
+    result["people"] = graph.person_count()
+    result["movies"] = graph.movie_count()
+    result["stars"] = len(graph.person_movies)
+    result["graph_bytes"] = graph.nbytes()
+    result["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    rng = random.Random(seed)
+    latencies = {}
+    for _ in range(queries):
+        source = graph.person_ids[rng.randrange(graph.person_count())]
+        target = graph.person_ids[rng.randrange(graph.person_count())]
+        path, elapsed = timed(degrees.shortest_path, source, target)
+        distance = "none" if path is None else str(len(path))
+        latencies.setdefault(distance, []).append(elapsed * 1000)
+
+    result["query_ms"] = {
+        distance: {
+            "count": len(values),
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+        }
+        for distance, values in sorted(latencies.items())
+    }
+    return result
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Yields a message for every timing in `results` more than `tolerance`
+    times slower than the same timing in `baseline`.
+    """
+    for size, current in results.items():
+        previous = baseline.get(size)
+        if previous is None:
+            continue
+        for key in ("load_csv_s", "snapshot_write_s", "snapshot_load_s"):
+            if current[key] > previous[key] * tolerance:
+                yield f"{size}: {key} {previous[key]:.3f} -> {current[key]:.3f}"
+        for distance, stats in current["query_ms"].items():
+            before = previous["query_ms"].get(distance)
+            if before and stats["p90"] > before["p90"] * tolerance:
+                yield (
+                    f"{size}: p90 at {distance} degrees "
+                    f"{before['p90']:.3f} -> {stats['p90']:.3f} ms"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="people per run")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--keep", help="write datasets here instead of a temp dir")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        root = args.keep or scratch
+        for size in (int(size) for size in args.sizes.split(",")):
+            directory = os.path.join(root, str(size))
+            print(f"Generating {size} people...", file=sys.stderr)
+            generate(directory, size, size // 2, args.seed)
+            print(f"Benchmarking {size} people...", file=sys.stderr)
+            results[str(size)] = run_size(directory, args.queries, args.seed)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        slower = list(regressions(results, baseline, args.tolerance))
+        for message in slower:
+            print(f"Regression: {message}", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
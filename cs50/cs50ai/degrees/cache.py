@@ -0,0 +1,168 @@
+"""
+LRU cache of single-source BFS parent trees.
+
+A tree rooted at one person answers the shortest path from that person
+to everyone else by walking parent pointers. Since the graph is
+undirected, the same tree also answers queries that end at the root.
+"""
+
+from array import array
+from collections import OrderedDict
+
+# Parent recorded for people the root cannot reach
+NO_PARENT = -1
+
+
+class BFSTree:
+    __slots__ = ("root", "parents", "movies")
+
+    def __init__(self, root, parents, movies):
+        self.root = root
+        # For each person index, the person and movie it was reached from
+        self.parents = parents
+        self.movies = movies
+
+    @classmethod
+    def build(cls, graph, root):
+        person_offsets, person_movies = graph.person_offsets, graph.person_movies
+        movie_offsets, movie_people = graph.movie_offsets, graph.movie_people
+        parents = array("i", [NO_PARENT]) * graph.person_count()
+        movies = array("i", [NO_PARENT]) * graph.person_count()
+        seen_movies = bytearray(graph.movie_count())
+        parents[root] = root
+        frontier = [root]
+        while frontier:
+            next_frontier = []
+            for person in frontier:
+                start, end = person_offsets[person], person_offsets[person + 1]
+                for movie in person_movies[start:end]:
+                    if seen_movies[movie]:
+                        continue
+                    seen_movies[movie] = 1
+                    start, end = movie_offsets[movie], movie_offsets[movie + 1]
+                    for neighbor in movie_people[start:end]:
+                        if parents[neighbor] == NO_PARENT:
+                            parents[neighbor] = person
+                            movies[neighbor] = movie
+                            next_frontier.append(neighbor)
+            frontier = next_frontier
+        return cls(root, parents, movies)
+
+    def nbytes(self):
+        return (len(self.parents) + len(self.movies)) * self.parents.itemsize
+
+    def path_to(self, person):
+        """
+        Returns the (movie, person) index path from the root to `person`,
+        or None if the root cannot reach them.
+        """
+        parents, movies = self.parents, self.movies
+        if parents[person] == NO_PARENT:
+            return None
+        path = []
+        while person != self.root:
+            path.append((movies[person], person))
+            person = parents[person]
+        path.reverse()
+        return path
+
+    def path_from(self, person):
+        """
+        Returns the (movie, person) index path from `person` to the root,
+        or None if the root cannot reach them.
+        """
+        parents, movies = self.parents, self.movies
+        if parents[person] == NO_PARENT:
+            return None
+        path = []
+        while person != self.root:
+            path.append((movies[person], parents[person]))
+            person = parents[person]
+        return path
+
+
+class TreeCache:
+    """
+    Keeps BFS trees for recently used endpoints, evicting the least
+    recently used trees once their total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, graph, max_bytes=256 * 2**20):
+        self.graph = graph
+        self.max_bytes = max_bytes
+        self.trees = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs that
+        connect the source to the target, or None if not connected.
+
+        Answered from a cached tree rooted at either endpoint when there
+        is one; otherwise a tree rooted at the source is built and cached.
+        """
+        graph = self.graph
+        source, target = graph.person_index(source), graph.person_index(target)
+        if not graph.connected(source, target):
+            return None
+        tree = self._get(source)
+        if tree is not None:
+            path = tree.path_to(target)
+        else:
+            tree = self._get(target)
+            if tree is not None:
+                path = tree.path_from(source)
+            else:
+                self.misses += 1
+                tree = BFSTree.build(graph, source)
+                self._put(tree)
+                path = tree.path_to(target)
+        if path is None:
+            return None
+        return graph.path_ids(path)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "trees": len(self.trees),
+            "bytes": self.nbytes,
+        }
+
+    def invalidate(self, graph, components):
+        """
+        Switches to `graph`, an updated version of the current graph, and
+        drops the trees rooted in any of `components`. Other trees stay
+        valid: their component gained no people or edges, and the people
+        added since they were built are in other components.
+        """
+        self.graph = graph
+        labels = graph.person_components
+        for root in [root for root in self.trees if labels[root] in components]:
+            self.nbytes -= self.trees.pop(root).nbytes()
+
+    def clear(self):
+        self.trees.clear()
+        self.nbytes = 0
+
+    def _get(self, root):
+        tree = self.trees.get(root)
+        if tree is not None:
+            self.trees.move_to_end(root)
+            self.hits += 1
+        return tree
+
+    def _put(self, tree):
+        size = tree.nbytes()
+        if size > self.max_bytes:
+            return
+        while self.trees and self.nbytes + size > self.max_bytes:
+            _, evicted = self.trees.popitem(last=False)
+            self.nbytes -= evicted.nbytes()
+            self.evictions += 1
+        self.trees[tree.root] = tree
+        self.nbytes += size
@@ -0,0 +1,123 @@
+"""
+Connected-component labels for the people in a Graph.
+
+Two people are connected exactly when they are in the same component of
+the person <-> movie graph, so comparing labels answers "Not connected."
+without any search.
+"""
+
+from array import array
+
+
+class UnionFind:
+    """Disjoint sets over 0..count-1 with union by size and path halving."""
+
+    def __init__(self, count):
+        self.parents = array("i", range(count))
+        self.sizes = array("i", [1]) * count
+
+    def find(self, item):
+        parents = self.parents
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        sizes = self.sizes
+        if sizes[a] < sizes[b]:
+            a, b = b, a
+        self.parents[b] = a
+        sizes[a] += sizes[b]
+        return a
+
+
+def label_components(person_count, movie_offsets, movie_people):
+    """
+    Returns (labels, sizes): a dense component ID for every person, and
+    the number of people in each component.
+    """
+    sets = UnionFind(person_count)
+    for movie in range(len(movie_offsets) - 1):
+        start, end = movie_offsets[movie], movie_offsets[movie + 1]
+        if end - start < 2:
+            continue
+        first = movie_people[start]
+        for person in movie_people[start + 1 : end]:
+            sets.union(first, person)
+    return relabel(sets)
+
+
+def relabel(sets):
+    """
+    Numbers the roots of `sets` densely in order of first appearance.
+    """
+    ids = {}
+    labels = array("i", bytes(4 * len(sets.parents)))
+    sizes = array("i")
+    for person in range(len(sets.parents)):
+        root = sets.find(person)
+        label = ids.get(root)
+        if label is None:
+            label = ids[root] = len(sizes)
+            sizes.append(sets.sizes[root])
+        labels[person] = label
+    return labels, sizes
+
+
+def merge_components(labels, sizes, person_count, groups):
+    """
+    Returns (labels, sizes, changed) after adding people up to
+    `person_count` and joining each group of person indices in `groups`
+    into one component.
+
+    Components the groups do not touch keep their labels, so anything
+    keyed by them stays valid. A component absorbed into another keeps
+    its slot in `sizes` with a size of 0. `changed` is the set of new
+    labels of every component that gained people or edges.
+    """
+    old_people, old_components = len(labels), len(sizes)
+    sets = UnionFind(old_components + person_count - old_people)
+    sets.sizes[:old_components] = array("i", sizes)
+
+    def element(person):
+        if person < old_people:
+            return labels[person]
+        return old_components + person - old_people
+
+    touched = set()
+    for group in groups:
+        members = [element(person) for person in group]
+        touched.update(members)
+        for other in members[1:]:
+            sets.union(members[0], other)
+
+    # Each set is named after its smallest old label, or gets a fresh
+    # label if it only holds new people
+    names = {}
+    for item in range(len(sets.parents)):
+        names.setdefault(sets.find(item), item)
+    sizes = array("i", bytes(4 * old_components))
+    for root, item in names.items():
+        if item >= old_components:
+            names[root] = len(sizes)
+            sizes.append(0)
+        sizes[names[root]] = sets.sizes[root]
+
+    relabelled = {}
+    for label in range(old_components):
+        name = names[sets.find(label)]
+        if name != label:
+            relabelled[label] = name
+    labels = array("i", labels)
+    if relabelled:
+        for person, label in enumerate(labels):
+            if label in relabelled:
+                labels[person] = relabelled[label]
+    for person in range(old_people, person_count):
+        labels.append(names[sets.find(element(person))])
+    changed = {names[sets.find(item)] for item in touched}
+    return labels, sizes, changed
@@ -0,0 +1,105 @@
+"""
+Constraints on the paths a search may return.
+
+A Constraints object limits a search to movies released within a range
+of years and can exclude movies and people. It is resolved against a
+Graph into a bytearray of allowed movie indices and a set of blocked
+person indices, which the search checks during expansion. The year range
+is resolved by the graph, from its `year_order` by bisection in memory,
+and the masks built from it are cached per graph, so repeated queries
+with the same range reuse one. The cache holds graphs weakly and
+`forget` drops a graph's masks early, so a graph replaced by an update
+is not kept alive.
+"""
+
+from collections import OrderedDict
+from weakref import WeakKeyDictionary
+
+# Year masks kept per graph
+MASKS = 32
+
+_masks = WeakKeyDictionary()
+
+
+class Constraints:
+    def __init__(self, first_year=None, last_year=None, movies=(), people=()):
+        # Inclusive year bounds, either of which may be None, and the
+        # movie_ids and person_ids a path must avoid
+        self.first_year = first_year
+        self.last_year = last_year
+        self.movies = frozenset(movies)
+        self.people = frozenset(people)
+
+    def __repr__(self):
+        return (
+            f"Constraints(first_year={self.first_year!r}, "
+            f"last_year={self.last_year!r}, movies={set(self.movies)!r}, "
+            f"people={set(self.people)!r})"
+        )
+
+    def allowed_movies(self, graph):
+        """
+        Returns a bytearray with a nonzero entry for every movie index a
+        path may use. Movies of unknown year are excluded by any bound.
+        Excluded movie_ids that are not in the graph are ignored.
+        """
+        if self.first_year is None and self.last_year is None:
+            mask = _all_movies(graph)
+        else:
+            first = 1 if self.first_year is None else self.first_year
+            last = 0xFFFF if self.last_year is None else self.last_year
+            mask = _year_mask(graph, first, last)
+        if not self.movies:
+            return mask
+        mask = bytearray(mask)
+        for movie_id in self.movies:
+            try:
+                mask[graph.movie_index(movie_id)] = 0
+            except KeyError:
+                pass
+        return mask
+
+    def blocked_people(self, graph):
+        """
+        Returns the set of person indices a path may not pass through.
+        """
+        blocked = set()
+        for person_id in self.people:
+            try:
+                blocked.add(graph.person_index(person_id))
+            except KeyError:
+                pass
+        return blocked
+
+
+def forget(graph):
+    """
+    Drops the masks cached for `graph`.
+    """
+    _masks.pop(graph, None)
+
+
+def _cached(graph, key, build):
+    masks = _masks.get(graph)
+    if masks is None:
+        masks = _masks[graph] = OrderedDict()
+    mask = masks.get(key)
+    if mask is None:
+        mask = masks[key] = build()
+        if len(masks) > MASKS:
+            masks.popitem(last=False)
+    else:
+        masks.move_to_end(key)
+    return mask
+
+
+def _all_movies(graph):
+    return _cached(graph, None, lambda: b"\1" * graph.movie_count())
+
+
+def _year_mask(graph, first, last):
+    """
+    Returns the graph's mask of the movies released from `first` through
+    `last`.
+    """
+    return _cached(graph, (first, last), lambda: graph.year_mask(first, last))
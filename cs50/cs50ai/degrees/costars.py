@@ -0,0 +1,87 @@
+"""
+Deduplicated co-star adjacency.
+
+Expanding a person through the raw CSR arrays visits every cast member
+of every one of their movies, including the person themselves and any
+co-star once per shared movie. CoStarIndex collapses that to one entry
+per distinct co-star, keeping the first shared movie as the
+representative, as two parallel arrays built on first use.
+"""
+
+import sys
+from array import array
+
+DEFAULT_MAX_BYTES = 128 * 2**20
+
+
+class CoStarIndex:
+    """
+    Lazily built co-star lists for the people of a Graph. Once the lists
+    held exceed `max_bytes` they are all dropped and rebuilt on demand; a
+    single list larger than that is returned without being kept.
+    """
+
+    def __init__(self, graph, max_bytes=DEFAULT_MAX_BYTES):
+        self.graph = graph
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.nbytes = 0
+        self.builds = 0
+        self.resets = 0
+
+    def of(self, person):
+        """
+        Returns (people, movies): parallel arrays of the distinct
+        co-stars of `person` and a movie each of them shares with them.
+        """
+        entry = self.entries.get(person)
+        if entry is None:
+            entry = self._build(person)
+        return entry
+
+    def _build(self, person):
+        # Through movies_of and stars_of, so any Graph storage works
+        graph = self.graph
+        shared = {person: -1}
+        for movie in graph.movies_of(person):
+            for other in graph.stars_of(movie):
+                shared.setdefault(other, movie)
+        del shared[person]
+        entry = (array("i", shared.keys()), array("i", shared.values()))
+
+        size = sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+        self.builds += 1
+        if size > self.max_bytes:
+            # Caching it would break the cap on its own
+            return entry
+        if self.nbytes + size > self.max_bytes:
+            self.entries.clear()
+            self.nbytes = 0
+            self.resets += 1
+        self.entries[person] = entry
+        self.nbytes += size
+        return entry
+
+    def invalidate(self, graph, people):
+        """
+        Switches to `graph`, an updated version of the current graph, and
+        drops the lists of `people`, whose co-stars changed.
+        """
+        self.graph = graph
+        for person in people:
+            entry = self.entries.pop(person, None)
+            if entry is not None:
+                self.nbytes -= sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+
+    def footprint(self):
+        """
+        Returns the number of cached lists, the co-star entries they hold
+        and their size in bytes, with build and reset counts.
+        """
+        return {
+            "people": len(self.entries),
+            "costars": sum(len(people) for people, _ in self.entries.values()),
+            "bytes": self.nbytes,
+            "builds": self.builds,
+            "resets": self.resets,
+        }
@@ -1,7 +1,27 @@
-import csv
 import sys
+from functools import partial
 
-from util import Node, StackFrontier, QueueFrontier
+import constraints
+import instrument
+import landmarks
+import snapshot
+import sqlite_graph
+import update
+from costars import CoStarIndex
+from ingest import load_csv
+from nameindex import NameIndex
+
+# Compact integer-indexed graph holding all loaded data
+graph = None
+
+# Row counts from the load that produced `graph`
+load_report = None
+
+# Prefix and fuzzy name lookup over `graph`
+name_index = None
+
+# Deduplicated co-star lists the search expands people through
+costars = None
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -13,54 +33,74 @@ people = {}
 movies = {}
 
 
-def load_data(directory):
-    """
-    Load data from CSV kiles into memory.
-    """
-    # Load people
-    with open(f"{directory}/people.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            people[row["id"]] = {
-                "name": row["name"],
-                "birth": row["birth"],
-                "movies": set(),
-            }
-            if row["name"].lower() not in names:
-                names[row["name"].lower()] = {row["id"]}
-            else:
-                names[row["name"].lower()].add(row["id"])
-
-    # Load movies
-    with open(f"{directory}/movies.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            movies[row["id"]] = {
-                "title": row["title"],
-                "year": row["year"],
-                "stars": set(),
-            }
-
-    # Load stars
-    with open(f"{directory}/stars.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                people[row["person_id"]]["movies"].add(row["movie_id"])
-                movies[row["movie_id"]]["stars"].add(row["person_id"])
-            except KeyError:
-                pass
+@instrument.phase("load")
+def load_data(directory, use_snapshot=True, sqlite=False):
+    """
+    Load data from CSV files into memory.
+
+    The data is held in a compact `Graph`; `names`, `people` and `movies`
+    are read-only views over it with the same shape as before. With
+    `use_snapshot`, a binary snapshot next to the CSV files is
+    memory-mapped when it is current, and rebuilt when it is not.
+
+    With `sqlite`, the graph is instead read on demand from a database
+    imported next to the CSV files, for datasets that do not fit in
+    memory.
+    """
+    global graph, load_report, name_index, costars, names, people, movies
+    if sqlite:
+        graph, load_report = sqlite_graph.open_graph(directory)
+    elif use_snapshot:
+        graph, load_report = snapshot.load(directory)
+    else:
+        graph, load_report = load_csv(directory)
+    name_index = NameIndex(graph, directory if use_snapshot or sqlite else None)
+    if sqlite:
+        costars = CoStarIndex(graph, sqlite_graph.COSTAR_BYTES)
+    else:
+        costars = CoStarIndex(graph)
+    names, people, movies = graph.names, graph.people, graph.movies
+
+
+@instrument.phase("update")
+def update_data(directory):
+    """
+    Apply the delta CSV files in `directory` to the loaded data, keeping
+    the cached co-star lists and name trigrams the delta leaves valid.
+    Returns the update.UpdateReport. Data loaded with `sqlite` cannot be
+    updated in place and raises TypeError.
+    """
+    global graph, names, people, movies
+    old = graph
+    graph, report = update.apply_delta(graph, directory)
+    constraints.forget(old)
+    name_index.extend(graph, report.named)
+    costars.invalidate(graph, report.affected)
+    names, people, movies = graph.names, graph.people, graph.movies
+    return report
 
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    arguments = sys.argv[1:]
+    sqlite = "--sqlite" in arguments
+    if sqlite:
+        arguments.remove("--sqlite")
+    use_landmarks = "--landmarks" in arguments
+    if use_landmarks:
+        arguments.remove("--landmarks")
+    if len(arguments) > 1 or (sqlite and use_landmarks):
+        sys.exit("Usage: python degrees.py [--sqlite | --landmarks] [directory]")
+    directory = arguments[0] if arguments else "large"
 
     # Load data from files into memory
     print("Loading data...")
-    load_data(directory)
+    load_data(directory, sqlite=sqlite)
     print("Data loaded.")
+    if load_report.dangling_stars:
+        print(
+            f"Skipped {load_report.dangling_stars} star rows "
+            "referring to unknown people or movies."
+        )
 
     source = person_id_for_name(input("Name: "))
     if source is None:
@@ -69,7 +109,14 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    # Opt-in: on the benchmark graphs the bounded search is no faster
+    index = None
+    if use_landmarks:
+        try:
+            index = landmarks.LandmarkIndex.load(directory)
+        except snapshot.SnapshotError as e:
+            print(f"Landmarks not used: {e}")
+    path = shortest_path(source, target, index)
 
     if path is None:
         print("Not connected.")
@@ -84,35 +131,205 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
-def shortest_path(source, target):
+@instrument.phase("search")
+def shortest_path(source, target, index=None, constraints=None):
     """
     Returns the shortest list of (movie_id, person_id) pairs
     that connect the source to the target.
 
     If no possible path, returns None.
+
+    Searches breadth-first from both ends at once, always growing the
+    smaller frontier by one full level, and stops as soon as a newly
+    reached person has already been seen from the other side. Given a
+    landmarks.LandmarkIndex, people that cannot lie on a shortest path
+    are pruned from the search. People in different components are
+    answered without searching.
+
+    Given constraints.Constraints, the path only uses the movies and
+    people they allow; the landmark index is not used then, since its
+    bounds ignore the constraints.
+    """
+    if source == target:
+        return []
+
+    source, target = graph.person_index(source), graph.person_index(target)
+    if not graph.connected(source, target):
+        return None
+    if constraints is not None:
+        path = _shortest_index_path(source, target, constraints)
+    elif index is not None:
+        path = landmarks.bounded_path(graph, index, source, target)
+    else:
+        path = _shortest_index_path(source, target)
+    if path is None:
+        return None
+    return graph.path_ids(path)
+
+
+def _shortest_index_path(source, target, constraints=None):
+    """
+    Bidirectional BFS over person indices of `graph`. Returns a list of
+    (movie index, person index) pairs, or None if not connected.
     """
+    if source == target:
+        return []
+
+    # Maps person index to the (movie, person) step it was reached from
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+
+    # Instrumented runs swap in a counting copy of the expansion loop so
+    # the plain loop carries no bookkeeping
+    recorder = instrument.active
+    stats = recorder.stats if recorder is not None else None
+    expand = _expand_level if stats is None else _expand_level_counted
+    expand_forward = expand_backward = expand
+    if constraints is not None:
+        blocked = constraints.blocked_people(graph)
+        if source in blocked or target in blocked:
+            return None
+        # Each side clears movies from its own copy of the mask as it
+        # expands them, so no movie is expanded twice from one side
+        allowed = constraints.allowed_movies(graph)
+        expand_forward = partial(
+            _expand_level_constrained, unexpanded=bytearray(allowed), blocked=blocked
+        )
+        expand_backward = partial(
+            _expand_level_constrained, unexpanded=bytearray(allowed), blocked=blocked
+        )
+
+    while forward_frontier and backward_frontier:
+        if stats is not None:
+            size = len(forward_frontier) + len(backward_frontier)
+            stats.frontier_peak = max(stats.frontier_peak, size)
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meeting = expand_forward(
+                forward_frontier, forward, backward
+            )
+        else:
+            backward_frontier, meeting = expand_backward(
+                backward_frontier, backward, forward
+            )
+        if meeting is not None:
+            return _join_paths(meeting, forward, backward)
 
-    # TODO
-    start = Node(source, None, None)
-    frontier = QueueFrontier()
-    frontier.add(start)
+    return None
 
-    neighbors = neighbors_for_person(source)
 
-    for neighbor in neighbors:
-        if target in neighbor:
-            return neighbors
+def _expand_level(frontier, visited, other):
+    """
+    Expands every person in `frontier` by one hop, recording parents
+    in `visited`. Returns the next frontier and the first person that
+    is also in `other`, or None if the two searches have not met.
+    """
+    costars_of = costars.of
+    next_frontier = []
+    for person in frontier:
+        neighbors, shared = costars_of(person)
+        for i, neighbor in enumerate(neighbors):
+            if neighbor in visited:
+                continue
+            visited[neighbor] = (shared[i], person)
+            if neighbor in other:
+                return next_frontier, neighbor
+            next_frontier.append(neighbor)
+    return next_frontier, None
+
 
-    raise NotImplementedError
+def _expand_level_counted(frontier, visited, other):
+    """
+    _expand_level, also adding to the counters of the active Recorder.
+    """
+    stats = instrument.active.stats
+    costars_of = costars.of
+    next_frontier = []
+    for person in frontier:
+        stats.nodes_expanded += 1
+        neighbors, shared = costars_of(person)
+        for i, neighbor in enumerate(neighbors):
+            stats.neighbor_pairs += 1
+            if neighbor in visited:
+                stats.duplicate_pushes += 1
+                continue
+            visited[neighbor] = (shared[i], person)
+            if neighbor in other:
+                return next_frontier, neighbor
+            next_frontier.append(neighbor)
+    return next_frontier, None
 
 
-def person_id_for_name(name):
+def _expand_level_constrained(frontier, visited, other, unexpanded, blocked):
+    """
+    _expand_level through the raw movie lists, since the co-star lists
+    keep one shared movie per co-star, which a constraint may exclude.
+    Only movies still set in `unexpanded` are followed, and are cleared
+    as they are; people in `blocked` are never reached.
+    """
+    movies_of, stars_of = graph.movies_of, graph.stars_of
+    next_frontier = []
+    for person in frontier:
+        for movie in movies_of(person):
+            if not unexpanded[movie]:
+                continue
+            unexpanded[movie] = 0
+            for neighbor in stars_of(movie):
+                if neighbor in visited or neighbor in blocked:
+                    continue
+                visited[neighbor] = (movie, person)
+                if neighbor in other:
+                    return next_frontier, neighbor
+                next_frontier.append(neighbor)
+    return next_frontier, None
+
+
+def _join_paths(meeting, forward, backward):
+    """
+    Builds the (movie, person) path through `meeting` from the
+    parent maps of the forward and backward searches.
+    """
+    path = []
+    person = meeting
+    while forward[person] is not None:
+        movie, parent = forward[person]
+        path.append((movie, person))
+        person = parent
+    path.reverse()
+
+    person = meeting
+    while backward[person] is not None:
+        movie, person = backward[person]
+        path.append((movie, person))
+    return path
+
+
+@instrument.phase("resolve")
+def person_id_for_name(name, interactive=True):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    With `interactive` false, never prompts: returns None unless the
+    name is an ID or belongs to exactly one person.
     """
+    if not interactive:
+        try:
+            return name_index.resolve(name)
+        except LookupError:
+            return None
+
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
+        candidates = name_index.search(name, 5)
+        if candidates:
+            print(f"No exact match for '{name}'. Did you mean:")
+            for candidate in candidates:
+                print(
+                    f"ID: {candidate.person_id}, Name: {candidate.name}, "
+                    f"Birth: {candidate.birth}, Movies: {candidate.movies}"
+                )
         return None
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
@@ -132,17 +349,17 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+@instrument.phase("neighbors")
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
-    movie_ids = people[person_id]["movies"]
-    neighbors = set()
-    for movie_id in movie_ids:
-        for person_id in movies[movie_id]["stars"]:
-            neighbors.add((movie_id, person_id))
-    return neighbors
+    movie_ids, person_ids = graph.movie_ids, graph.person_ids
+    return {
+        (movie_ids[movie], person_ids[person])
+        for movie, person in graph.neighbors(graph.person_index(person_id))
+    }
 
 
 if __name__ == "__main__":
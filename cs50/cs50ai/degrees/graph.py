@@ -0,0 +1,421 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+
+from components import label_components
+
+
+class StringTable:
+    """
+    An immutable sequence of strings packed into a single UTF-8 buffer,
+    with `offsets[i]:offsets[i + 1]` giving the bytes of string i.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        offsets = array("q", [0])
+        chunks = []
+        position = 0
+        for string in strings:
+            encoded = string.encode("utf-8")
+            chunks.append(encoded)
+            position += len(encoded)
+            offsets.append(position)
+        return cls(b"".join(chunks), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def nbytes(self):
+        return len(self.data) + len(self.offsets) * self.offsets.itemsize
+
+
+class Graph:
+    """
+    Compact person <-> movie bipartite graph.
+
+    People and movies are interned to dense integer indices. Edges are
+    stored in CSR form: the movies of person p are
+    `person_movies[person_offsets[p]:person_offsets[p + 1]]` and the
+    stars of movie m are `movie_people[movie_offsets[m]:movie_offsets[m + 1]]`.
+    String IDs are resolved through `person_order`/`movie_order`, index
+    permutations sorted by ID, and names through `name_order`, sorted by
+    lowercase name, so no per-entry dicts or sets are kept; `year_order`
+    sorts movies by year the same way. Every person
+    is labelled with a connected-component ID in `person_components`.
+    """
+
+    # Constructor arguments, in order; each is a StringTable or an array
+    FIELDS = (
+        "person_ids",
+        "person_names",
+        "person_births",
+        "movie_ids",
+        "movie_titles",
+        "movie_years",
+        "person_offsets",
+        "person_movies",
+        "movie_offsets",
+        "movie_people",
+        "person_order",
+        "movie_order",
+        "name_order",
+        "year_order",
+        "person_components",
+        "component_sizes",
+    )
+
+    def __init__(
+        self,
+        person_ids,
+        person_names,
+        person_births,
+        movie_ids,
+        movie_titles,
+        movie_years,
+        person_offsets,
+        person_movies,
+        movie_offsets,
+        movie_people,
+        person_order,
+        movie_order,
+        name_order,
+        year_order,
+        person_components,
+        component_sizes,
+    ):
+        self.person_ids = person_ids
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_ids = movie_ids
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_people = movie_people
+        self.person_order = person_order
+        self.movie_order = movie_order
+        self.name_order = name_order
+        self.year_order = year_order
+        self.person_components = person_components
+        self.component_sizes = component_sizes
+
+        self.people = PeopleView(self)
+        self.movies = MoviesView(self)
+        self.names = NamesView(self)
+
+    @classmethod
+    def from_edges(
+        cls,
+        person_ids,
+        person_names,
+        person_births,
+        movie_ids,
+        movie_titles,
+        movie_years,
+        star_people,
+        star_movies,
+    ):
+        """
+        Build a graph from per-entity lists and parallel arrays of
+        (person index, movie index) star edges.
+        """
+        person_offsets, person_movies = _build_csr(
+            len(person_ids), star_people, star_movies
+        )
+        movie_offsets, movie_people = _build_csr(
+            len(movie_ids), star_movies, star_people
+        )
+        person_order = array(
+            "i", sorted(range(len(person_ids)), key=person_ids.__getitem__)
+        )
+        movie_order = array(
+            "i", sorted(range(len(movie_ids)), key=movie_ids.__getitem__)
+        )
+        lowered = [name.lower() for name in person_names]
+        name_order = array("i", sorted(range(len(lowered)), key=lowered.__getitem__))
+        year_order = array(
+            "i", sorted(range(len(movie_years)), key=movie_years.__getitem__)
+        )
+        person_components, component_sizes = label_components(
+            len(person_ids), movie_offsets, movie_people
+        )
+        return cls(
+            StringTable.from_strings(person_ids),
+            StringTable.from_strings(person_names),
+            person_births,
+            StringTable.from_strings(movie_ids),
+            StringTable.from_strings(movie_titles),
+            movie_years,
+            person_offsets,
+            person_movies,
+            movie_offsets,
+            movie_people,
+            person_order,
+            movie_order,
+            name_order,
+            year_order,
+            person_components,
+            component_sizes,
+        )
+
+    def person_count(self):
+        return len(self.person_offsets) - 1
+
+    def movie_count(self):
+        return len(self.movie_offsets) - 1
+
+    def person_index(self, person_id):
+        """
+        Returns the integer index of `person_id`, or raises KeyError.
+        """
+        return _lookup(self.person_ids, self.person_order, person_id)
+
+    def movie_index(self, movie_id):
+        """
+        Returns the integer index of `movie_id`, or raises KeyError.
+        """
+        return _lookup(self.movie_ids, self.movie_order, movie_id)
+
+    def people_named(self, name):
+        """
+        Returns the indices of every person whose lowercase name is `name`.
+        """
+        names, order = self.person_names, self.name_order
+        key = lambda i: names[order[i]].lower()  # noqa: E731
+        lo = bisect_left(range(len(order)), name, key=key)
+        hi = bisect_right(range(lo, len(order)), name, key=key) + lo
+        return [order[i] for i in range(lo, hi)]
+
+    def year_span(self, first, last):
+        """
+        Returns (lo, hi) such that `year_order[lo:hi]` holds every movie
+        released from year `first` through `last`. Movies of unknown year
+        sort first, before `lo`.
+        """
+        years, order = self.movie_years, self.year_order
+        key = lambda i: years[order[i]]  # noqa: E731
+        lo = bisect_left(range(len(order)), max(first, 1), key=key)
+        hi = bisect_right(range(lo, len(order)), last, key=key) + lo
+        return lo, hi
+
+    def year_mask(self, first, last):
+        """
+        Returns a bytes mask of the movies released from `first` through
+        `last`, setting whichever of the movies inside or outside the
+        range are fewer, found as slices of `year_order`.
+        """
+        order, count = self.year_order, self.movie_count()
+        lo, hi = self.year_span(first, last)
+        if hi - lo <= count // 2:
+            mask = bytearray(count)
+            for movie in order[lo:hi]:
+                mask[movie] = 1
+        else:
+            mask = bytearray(b"\1") * count
+            for movie in order[:lo]:
+                mask[movie] = 0
+            for movie in order[hi:]:
+                mask[movie] = 0
+        return bytes(mask)
+
+    def connected(self, a, b):
+        """
+        Returns whether person indices `a` and `b` are in the same
+        component, that is whether any path joins them.
+        """
+        components = self.person_components
+        return components[a] == components[b]
+
+    def component_size(self, person):
+        return self.component_sizes[self.person_components[person]]
+
+    def movies_of(self, person):
+        offsets = self.person_offsets
+        return self.person_movies[offsets[person] : offsets[person + 1]]
+
+    def stars_of(self, movie):
+        offsets = self.movie_offsets
+        return self.movie_people[offsets[movie] : offsets[movie + 1]]
+
+    def neighbors(self, person):
+        """
+        Yields (movie index, person index) pairs for everyone who starred
+        in a movie with `person`, including `person` itself.
+        """
+        for movie in self.movies_of(person):
+            for other in self.stars_of(movie):
+                yield movie, other
+
+    def path_ids(self, path):
+        """
+        Converts a list of (movie index, person index) pairs to
+        (movie_id, person_id) pairs.
+        """
+        movie_ids, person_ids = self.movie_ids, self.person_ids
+        return [(movie_ids[movie], person_ids[person]) for movie, person in path]
+
+    def nbytes(self):
+        """
+        Returns the approximate number of bytes held by the graph.
+        """
+        total = 0
+        for value in vars(self).values():
+            if isinstance(value, StringTable):
+                total += value.nbytes()
+            elif isinstance(value, (array, memoryview)):
+                total += len(value) * value.itemsize
+        return total
+
+
+class PeopleView(Mapping):
+    """
+    Maps person_ids to a dictionary of: name, birth, movies (a set of
+    movie_ids), built on demand from a Graph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, person_id):
+        graph = self.graph
+        person = graph.person_index(person_id)
+        birth = graph.person_births[person]
+        return {
+            "name": graph.person_names[person],
+            "birth": str(birth) if birth else "",
+            "movies": {graph.movie_ids[m] for m in graph.movies_of(person)},
+        }
+
+    def __contains__(self, person_id):
+        try:
+            self.graph.person_index(person_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.graph.person_ids)
+
+    def __len__(self):
+        return self.graph.person_count()
+
+
+class MoviesView(Mapping):
+    """
+    Maps movie_ids to a dictionary of: title, year, stars (a set of
+    person_ids), built on demand from a Graph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, movie_id):
+        graph = self.graph
+        movie = graph.movie_index(movie_id)
+        year = graph.movie_years[movie]
+        return {
+            "title": graph.movie_titles[movie],
+            "year": str(year) if year else "",
+            "stars": {graph.person_ids[p] for p in graph.stars_of(movie)},
+        }
+
+    def __contains__(self, movie_id):
+        try:
+            self.graph.movie_index(movie_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.graph.movie_ids)
+
+    def __len__(self):
+        return self.graph.movie_count()
+
+
+class NamesView(Mapping):
+    """
+    Maps lowercase names to a set of corresponding person_ids.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, name):
+        graph = self.graph
+        people = graph.people_named(name)
+        if not people:
+            raise KeyError(name)
+        return {graph.person_ids[p] for p in people}
+
+    def __contains__(self, name):
+        return bool(self.graph.people_named(name))
+
+    def __iter__(self):
+        graph = self.graph
+        previous = None
+        for person in graph.name_order:
+            name = graph.person_names[person].lower()
+            if name != previous:
+                yield name
+                previous = name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def parse_year(value):
+    """
+    Returns `value` as an integer year, or 0 if it is blank or invalid.
+    """
+    try:
+        year = int(value)
+    except ValueError:
+        return 0
+    return year if 0 < year < 65536 else 0
+
+
+def _lookup(table, order, key):
+    position = bisect_left(range(len(order)), key, key=lambda i: table[order[i]])
+    if position < len(order) and table[order[position]] == key:
+        return order[position]
+    raise KeyError(key)
+
+
+def _build_csr(count, sources, targets):
+    """
+    Groups parallel `sources`/`targets` edge arrays by source into CSR
+    offset and index arrays, sorting and de-duplicating each row.
+    """
+    offsets = array("i", bytes(4 * (count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+
+    cursor = offsets[:-1]
+    indices = array("i", bytes(4 * len(sources)))
+    for source, target in zip(sources, targets):
+        indices[cursor[source]] = target
+        cursor[source] += 1
+
+    compact_offsets = array("i", [0])
+    compact = array("i")
+    for i in range(count):
+        row = indices[offsets[i] : offsets[i + 1]]
+        compact.extend(sorted(set(row)))
+        compact_offsets.append(len(compact))
+    return compact_offsets, compact
@@ -0,0 +1,165 @@
+"""
+Streaming CSV ingestion for the degrees dataset.
+
+people.csv and movies.csv are parsed concurrently, each into plain
+column lists: on a machine with more than one CPU, movies.csv is parsed
+in a forked child process while the parent parses people.csv, since
+threads would be serialised by the GIL. The child sends its columns
+back packed into a few large strings, which are cheap to pickle and
+split. stars.csv is then streamed in fixed-size chunks and resolved
+straight into two compact index arrays, so no per-row dicts are ever
+built and memory during the load stays bounded by the final graph plus
+the temporary ID lookups.
+"""
+
+import csv
+import multiprocessing
+import os
+from array import array
+from dataclasses import dataclass, asdict
+from itertools import islice
+from operator import itemgetter
+
+from graph import Graph, parse_year
+
+CHUNK_SIZE = 1 << 16
+
+# Joins the packed columns a child process sends back; CSV text never
+# holds a NUL
+SEPARATOR = "\0"
+
+
+@dataclass
+class IngestReport:
+    """Row counts from one CSV load."""
+
+    people: int = 0
+    movies: int = 0
+    stars: int = 0
+    dangling_stars: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def load_csv(directory, chunk_size=CHUNK_SIZE, parallel=None):
+    """
+    Returns a (Graph, IngestReport) pair for the CSV files in `directory`.
+
+    With `parallel`, movies.csv is parsed in a child process while this
+    one parses people.csv. It defaults to whether there is more than one
+    CPU and fork is available.
+    """
+    if parallel is None:
+        forkable = "fork" in multiprocessing.get_all_start_methods()
+        parallel = forkable and (os.cpu_count() or 1) > 1
+    people_path, movies_path = f"{directory}/people.csv", f"{directory}/movies.csv"
+    if parallel:
+        with multiprocessing.get_context("fork").Pool(1) as pool:
+            packed = pool.apply_async(_read_packed, (movies_path,))
+            people = read_entities(people_path, ("id", "name", "birth"))
+            movies = _unpack(*packed.get())
+    else:
+        people = read_entities(people_path, ("id", "name", "birth"))
+        movies = read_entities(movies_path, ("id", "title", "year"))
+    person_ids, person_names, person_births, person_lookup = people
+    movie_ids, movie_titles, movie_years, movie_lookup = movies
+    del people, movies
+
+    report = IngestReport(people=len(person_ids), movies=len(movie_ids))
+    star_people, star_movies = read_stars(
+        f"{directory}/stars.csv", person_lookup, movie_lookup, report, chunk_size
+    )
+    del person_lookup, movie_lookup
+
+    graph = Graph.from_edges(
+        person_ids,
+        person_names,
+        person_births,
+        movie_ids,
+        movie_titles,
+        movie_years,
+        star_people,
+        star_movies,
+    )
+    return graph, report
+
+
+def read_entities(path, columns):
+    """
+    Reads an (id, label, year) CSV into an ID list, a label list, an
+    array of years and a dict mapping each ID to its position. A repeated
+    ID keeps its first position and takes the label and year of its last
+    row.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            get = itemgetter(*(header.index(column) for column in columns))
+        except ValueError as e:
+            raise ValueError(f"{path}: missing column ({e})") from None
+
+        positions = {}
+        ids, labels, years = [], [], array("H")
+        for row in reader:
+            if not row:
+                continue
+            id_, label, year = get(row)
+            index = positions.setdefault(id_, len(ids))
+            if index == len(ids):
+                ids.append(id_)
+                labels.append(label)
+                years.append(parse_year(year))
+            else:
+                labels[index] = label
+                years[index] = parse_year(year)
+    return ids, labels, years, positions
+
+
+def _read_packed(path):
+    """
+    read_entities for movies.csv in a child process, returning the ID and
+    title lists each joined into one string and the array of years.
+    """
+    ids, titles, years, _ = read_entities(path, ("id", "title", "year"))
+    return SEPARATOR.join(ids), SEPARATOR.join(titles), years
+
+
+def _unpack(ids, titles, years):
+    """
+    Returns the read_entities tuple that _read_packed packed.
+    """
+    if not years:
+        return [], [], years, {}
+    ids = ids.split(SEPARATOR)
+    return ids, titles.split(SEPARATOR), years, {id_: i for i, id_ in enumerate(ids)}
+
+
+def read_stars(path, person_lookup, movie_lookup, report, chunk_size=CHUNK_SIZE):
+    """
+    Streams stars.csv in chunks of `chunk_size` rows and returns parallel
+    arrays of person and movie indices. Rows naming an unknown person or
+    movie are counted in `report.dangling_stars` and skipped.
+    """
+    star_people, star_movies = array("i"), array("i")
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            get = itemgetter(header.index("person_id"), header.index("movie_id"))
+        except ValueError as e:
+            raise ValueError(f"{path}: missing column ({e})") from None
+
+        rows = filter(None, reader)
+        while chunk := list(islice(rows, chunk_size)):
+            for person_id, movie_id in map(get, chunk):
+                person = person_lookup.get(person_id)
+                movie = movie_lookup.get(movie_id)
+                if person is None or movie is None:
+                    report.dangling_stars += 1
+                    continue
+                star_people.append(person)
+                star_movies.append(movie)
+            report.stars += len(chunk)
+    return star_people, star_movies
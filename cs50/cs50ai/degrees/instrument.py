@@ -0,0 +1,123 @@
+"""
+Opt-in instrumentation for degrees queries.
+
+Nothing is measured until `enable()` installs a Recorder. While it is
+off, each instrumented function pays one global lookup per call, and
+the search loops run their uninstrumented versions.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# The Recorder in use, or None when instrumentation is off
+active = None
+
+
+class SearchStats:
+    """Counters and per-phase wall time collected by a Recorder."""
+
+    __slots__ = (
+        "nodes_expanded",
+        "neighbor_pairs",
+        "duplicate_pushes",
+        "frontier_peak",
+        "phases",
+        "calls",
+    )
+
+    def __init__(self):
+        self.nodes_expanded = 0
+        self.neighbor_pairs = 0
+        self.duplicate_pushes = 0
+        self.frontier_peak = 0
+        # Seconds and call counts per phase name
+        self.phases = {}
+        self.calls = {}
+
+    def as_dict(self):
+        return {
+            "nodes_expanded": self.nodes_expanded,
+            "neighbor_pairs": self.neighbor_pairs,
+            "duplicate_pushes": self.duplicate_pushes,
+            "frontier_peak": self.frontier_peak,
+            "phases": dict(self.phases),
+            "calls": dict(self.calls),
+        }
+
+
+class Recorder:
+    """
+    Accumulates SearchStats, optionally writing them as JSON lines to
+    `path` each time `flush` is called.
+    """
+
+    def __init__(self, path=None):
+        self.stats = SearchStats()
+        self.file = open(path, "a", encoding="utf-8") if path else None
+
+    @contextmanager
+    def timing(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases, calls = self.stats.phases, self.stats.calls
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+            calls[name] = calls.get(name, 0) + 1
+
+    def flush(self, **context):
+        """
+        Returns the stats gathered since the last flush as a dict, merged
+        with `context`, writes them as a JSON line if a path was given,
+        and starts a new SearchStats.
+        """
+        record = dict(context, **self.stats.as_dict())
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        self.stats = SearchStats()
+        return record
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def enable(path=None):
+    """
+    Installs and returns a new Recorder, closing any previous one.
+    """
+    global active
+    disable()
+    active = Recorder(path)
+    return active
+
+
+def disable():
+    global active
+    if active is not None:
+        active.close()
+        active = None
+
+
+def phase(name):
+    """
+    Decorator that adds the wall time of each call to phase `name` of
+    the active Recorder, if there is one.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = active
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.timing(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,334 @@
+"""
+Landmark (ALT) distance index for goal-directed degrees search.
+
+A handful of well-connected people are chosen as landmarks and the BFS
+distance from each of them to everyone else is stored. By the triangle
+inequality, for any landmark L
+
+    |d(L, t) - d(L, v)| <= d(v, t) <= d(v, L) + d(L, t)
+
+which gives an A*-style pruning bound for the search and instant
+bounds for "at most N degrees" queries. The depth at which each
+landmark's BFS first reached every movie is stored too: the whole cast
+of a movie lies within one degree of that depth, so one bound prunes a
+movie's cast at once.
+
+Usage: python landmarks.py [directory] [count]
+"""
+
+import heapq
+import os
+import sys
+from array import array
+
+import degrees
+import snapshot
+
+LANDMARKS_NAME = "degrees.landmarks"
+DEFAULT_COUNT = 8
+
+# Distance recorded for people a landmark cannot reach
+UNREACHABLE = 0xFFFF
+
+
+class LandmarkIndex:
+    def __init__(self, landmarks, distances, movie_distances):
+        # Person indices of the landmarks, and for each one an array of
+        # distances indexed by person and one of the depths at which its
+        # BFS reached each movie, indexed by movie
+        self.landmarks = landmarks
+        self.distances = distances
+        self.movie_distances = movie_distances
+
+    @classmethod
+    def build(cls, graph, count=DEFAULT_COUNT):
+        """
+        Picks `count` landmarks from the best-connected people in `graph`
+        and computes their distance arrays.
+        """
+        landmarks = array("i", select_landmarks(graph, count))
+        rows = [bfs_distances(graph, landmark) for landmark in landmarks]
+        return cls(landmarks, [p for p, _ in rows], [m for _, m in rows])
+
+    def save(self, directory):
+        buffers = {"landmarks": self.landmarks}
+        for i, distances in enumerate(self.distances):
+            buffers[f"distances.{i}"] = distances
+            buffers[f"movies.{i}"] = self.movie_distances[i]
+        snapshot.write_image(
+            landmarks_path(directory),
+            directory,
+            {"kind": "landmarks", "count": len(self.landmarks)},
+            buffers,
+        )
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory-maps the index saved for `directory`, raising
+        snapshot.SnapshotError if it is missing or out of date.
+        """
+        meta, sections = snapshot.read_image(landmarks_path(directory), directory)
+        if meta.get("kind") != "landmarks":
+            raise snapshot.SnapshotError("not a landmark index")
+        try:
+            count = range(meta["count"])
+            distances = [sections[f"distances.{i}"] for i in count]
+            movie_distances = [sections[f"movies.{i}"] for i in count]
+            return cls(sections["landmarks"], distances, movie_distances)
+        except KeyError as e:
+            raise snapshot.SnapshotError(f"landmark index is missing {e}") from e
+
+    def updated(self, graph, components):
+        """
+        Returns an index for `graph`, an updated version of the indexed
+        graph, keeping the landmarks outside `components`, or None if
+        every landmark is in one of them.
+
+        The distances of a kept landmark are still exact: its component
+        gained no people or edges, and everyone added is unreachable.
+        """
+        landmarks, distances, movie_distances = array("i"), [], []
+        labels = graph.person_components
+        people, movies = graph.person_count(), graph.movie_count()
+        rows = zip(self.landmarks, self.distances, self.movie_distances)
+        for landmark, row, movie_row in rows:
+            if labels[landmark] in components:
+                continue
+            landmarks.append(landmark)
+            distances.append(_padded(row, people))
+            movie_distances.append(_padded(movie_row, movies))
+        if not landmarks:
+            return None
+        return LandmarkIndex(landmarks, distances, movie_distances)
+
+    def goal_distances(self, goal):
+        """
+        Returns the distance of every landmark to person index `goal`,
+        for movie_lower_bound.
+        """
+        return [distances[goal] for distances in self.distances]
+
+    def movie_lower_bound(self, movie, goal_distances):
+        """
+        Returns a lower bound on the degrees from anyone in the cast of
+        `movie` to the goal of `goal_distances`. Landmarks that cannot
+        reach both are skipped.
+        """
+        bound = 0
+        for movies, b in zip(self.movie_distances, goal_distances):
+            a = movies[movie]
+            if a == UNREACHABLE or b == UNREACHABLE:
+                continue
+            # The cast is at distance a or a + 1 from the landmark
+            if b - a - 1 > bound:
+                bound = b - a - 1
+            elif a - b > bound:
+                bound = a - b
+        return bound
+
+    def lower_bound(self, person, target):
+        """
+        Returns a lower bound on the degrees between two person indices,
+        or None if some landmark proves they are not connected.
+        """
+        bound = 0
+        for distances in self.distances:
+            a, b = distances[person], distances[target]
+            if (a == UNREACHABLE) != (b == UNREACHABLE):
+                return None
+            if a != UNREACHABLE and abs(a - b) > bound:
+                bound = abs(a - b)
+        return bound
+
+    def upper_bound(self, person, target):
+        """
+        Returns an upper bound on the degrees between two person indices,
+        or None if no landmark reaches both.
+        """
+        bound = None
+        for distances in self.distances:
+            a, b = distances[person], distances[target]
+            if a != UNREACHABLE and b != UNREACHABLE:
+                if bound is None or a + b < bound:
+                    bound = a + b
+        return bound
+
+    def within(self, person, target, degrees):
+        """
+        Returns True or False if the index alone decides whether the two
+        person indices are at most `degrees` apart, and None otherwise.
+        """
+        upper = self.upper_bound(person, target)
+        if upper is not None and upper <= degrees:
+            return True
+        lower = self.lower_bound(person, target)
+        if lower is None or lower > degrees:
+            return False
+        return None
+
+
+def landmarks_path(directory):
+    return os.path.join(directory, LANDMARKS_NAME)
+
+
+def select_landmarks(graph, count):
+    """
+    Returns the `count` person indices with the most co-star slots, that
+    is the largest total cast size over their movies.
+    """
+    movie_offsets = graph.movie_offsets
+    cast_sizes = [
+        movie_offsets[m + 1] - movie_offsets[m] for m in range(graph.movie_count())
+    ]
+    reach = (
+        (sum(cast_sizes[m] for m in graph.movies_of(p)), p)
+        for p in range(graph.person_count())
+    )
+    return [p for _, p in heapq.nlargest(count, reach)]
+
+
+def bfs_distances(graph, source):
+    """
+    Returns an array of the degrees from `source` to every person index,
+    and one of the depth of the first cast member it reached in every
+    movie, with UNREACHABLE for people and movies in other components.
+    """
+    person_offsets, person_movies = graph.person_offsets, graph.person_movies
+    movie_offsets, movie_people = graph.movie_offsets, graph.movie_people
+    distances = array("H", [UNREACHABLE]) * graph.person_count()
+    movie_distances = array("H", [UNREACHABLE]) * graph.movie_count()
+    distances[source] = 0
+    frontier = [source]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for person in frontier:
+            start, end = person_offsets[person], person_offsets[person + 1]
+            for movie in person_movies[start:end]:
+                # Every star of a movie is reached at the same depth, so
+                # each movie only needs to be scanned once
+                if movie_distances[movie] != UNREACHABLE:
+                    continue
+                movie_distances[movie] = depth - 1
+                start, end = movie_offsets[movie], movie_offsets[movie + 1]
+                for neighbor in movie_people[start:end]:
+                    if distances[neighbor] == UNREACHABLE:
+                        distances[neighbor] = depth
+                        next_frontier.append(neighbor)
+        frontier = next_frontier
+    return distances, movie_distances
+
+
+def bounded_path(graph, index, source, target):
+    """
+    Bidirectional BFS between two person indices that prunes, A*-style,
+    every movie whose cast, reached at depth g, has g + movie_lower_bound
+    greater than the landmark upper bound for the whole query. People on
+    a shortest path always satisfy that bound, so the result is still a
+    shortest list of (movie index, person index) pairs, or None if not
+    connected.
+    """
+    if source == target:
+        return []
+    if index.lower_bound(source, target) is None:
+        return None
+    limit = index.upper_bound(source, target)
+    if limit is None:
+        limit = UNREACHABLE
+
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+    forward_depth = backward_depth = 0
+    # Movies each side has expanded or pruned; a pruned movie stays
+    # pruned, since the slack only shrinks with depth
+    forward_movies = bytearray(graph.movie_count())
+    backward_movies = bytearray(graph.movie_count())
+    to_target = index.goal_distances(target)
+    to_source = index.goal_distances(source)
+
+    while forward_frontier and backward_frontier:
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_depth += 1
+            forward_frontier, meeting = _expand_bounded(
+                graph,
+                index,
+                forward_frontier,
+                forward,
+                backward,
+                forward_movies,
+                to_target,
+                limit - forward_depth,
+            )
+        else:
+            backward_depth += 1
+            backward_frontier, meeting = _expand_bounded(
+                graph,
+                index,
+                backward_frontier,
+                backward,
+                forward,
+                backward_movies,
+                to_source,
+                limit - backward_depth,
+            )
+        if meeting is not None:
+            return degrees._join_paths(meeting, forward, backward)
+    return None
+
+
+def _expand_bounded(graph, index, frontier, visited, other, seen, goal, slack):
+    """
+    Expands `frontier` by one level like degrees._expand_level, once per
+    movie not yet in `seen`, skipping movies whose cast's lower bound to
+    the goal of `goal` distances exceeds `slack`.
+    """
+    person_offsets, person_movies = graph.person_offsets, graph.person_movies
+    movie_offsets, movie_people = graph.movie_offsets, graph.movie_people
+    movie_lower_bound = index.movie_lower_bound
+    next_frontier = []
+    for person in frontier:
+        start, end = person_offsets[person], person_offsets[person + 1]
+        for movie in person_movies[start:end]:
+            if seen[movie]:
+                continue
+            seen[movie] = 1
+            if movie_lower_bound(movie, goal) > slack:
+                continue
+            start, end = movie_offsets[movie], movie_offsets[movie + 1]
+            for neighbor in movie_people[start:end]:
+                if neighbor in visited:
+                    continue
+                visited[neighbor] = (movie, person)
+                if neighbor in other:
+                    return next_frontier, neighbor
+                next_frontier.append(neighbor)
+    return next_frontier, None
+
+
+def _padded(row, length):
+    row = array("H", row)
+    row.extend(array("H", [UNREACHABLE]) * (length - len(row)))
+    return row
+
+
+def main():
+    if len(sys.argv) > 3:
+        sys.exit("Usage: python landmarks.py [directory] [count]")
+    directory = sys.argv[1] if len(sys.argv) > 1 else "large"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_COUNT
+
+    graph, _ = snapshot.load(directory)
+    print(f"Building {count} landmarks...")
+    index = LandmarkIndex.build(graph, count)
+    index.save(directory)
+    for landmark in index.landmarks:
+        print(f"  {graph.person_ids[landmark]} {graph.person_names[landmark]}")
+    print(f"Saved {landmarks_path(directory)}")
+
+
+if __name__ == "__main__":
+    main()
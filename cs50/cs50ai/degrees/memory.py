@@ -0,0 +1,96 @@
+"""
+Compare the resident memory of the original dict-of-sets layout with
+the compact Graph layout loaded by ingest.load_csv, and with the
+on-demand SQLite layout (measured once its database has been imported).
+
+Usage: python memory.py [directory]
+
+Each layout is loaded in a fresh interpreter so the numbers do not
+interfere with each other.
+"""
+
+import csv
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+import sqlite_graph
+from ingest import load_csv
+
+
+def load_dict_layout(directory):
+    """
+    Load data the way degrees.py originally did, into dicts of sets.
+    """
+    names, people, movies = {}, {}, {}
+    with open(f"{directory}/people.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            people[row["id"]] = {
+                "name": row["name"],
+                "birth": row["birth"],
+                "movies": set(),
+            }
+            names.setdefault(row["name"].lower(), set()).add(row["id"])
+    with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            movies[row["id"]] = {
+                "title": row["title"],
+                "year": row["year"],
+                "stars": set(),
+            }
+    with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                people[row["person_id"]]["movies"].add(row["movie_id"])
+                movies[row["movie_id"]]["stars"].add(row["person_id"])
+            except KeyError:
+                pass
+    return names, people, movies
+
+
+LAYOUTS = {
+    "dict": load_dict_layout,
+    "graph": load_csv,
+    "sqlite": sqlite_graph.open_graph,
+}
+
+
+def measure(layout, directory):
+    """
+    Load `directory` with `layout` and print retained and peak bytes.
+    """
+    tracemalloc.start()
+    data = LAYOUTS[layout](directory)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(retained, peak, max_rss)
+    del data
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] in LAYOUTS:
+        measure(sys.argv[1], sys.argv[2])
+        return
+    if len(sys.argv) > 2:
+        sys.exit("Usage: python memory.py [directory]")
+    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+
+    print(f"{'layout':<8}{'retained MB':>14}{'peak MB':>14}{'max RSS MB':>14}")
+    for layout in LAYOUTS:
+        output = subprocess.run(
+            [sys.executable, __file__, layout, directory],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        retained, peak, max_rss = (int(value) for value in output.split())
+        print(
+            f"{layout:<8}{retained / 2**20:>14.2f}{peak / 2**20:>14.2f}"
+            f"{max_rss / 2**10:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Prefix and typo-tolerant person name lookup.
+
+Prefix queries bisect the graph's `name_order`, which is already sorted
+by lowercase name. Fuzzy queries use a trigram inverted index: every
+lowercase name, padded with two leading spaces and one trailing space,
+is split into 3-character grams, and each gram maps to the people whose
+name contains it. The postings are stored in CSR form and cached next
+to the CSV files like the graph snapshot. They are built on the first
+fuzzy query, so loading stays fast for callers that never need them.
+"""
+
+import heapq
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+import snapshot
+from graph import StringTable
+
+NAMES_NAME = "degrees.names"
+
+# Fraction of the query's trigrams a fuzzy match must share
+MIN_SIMILARITY = 0.5
+
+# Upper bound on the people scanned for one prefix query
+PREFIX_SCAN = 2000
+
+Candidate = namedtuple("Candidate", "person_id name birth movies score")
+
+
+class NameIndex:
+    def __init__(self, graph, directory=None):
+        self.graph = graph
+        self.directory = directory
+        self.grams = None
+        self.gram_offsets = None
+        self.gram_people = None
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` Candidates for `query`, ranked exact
+        matches first, then prefix matches, then fuzzy matches by trigram
+        similarity, with ties going to people in more movies. Fuzzy
+        matches are only looked for when there is no exact match and
+        fewer than `limit` prefix matches.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        graph = self.graph
+        scores = {}
+        exact = False
+        for person in self._prefix_matches(query):
+            name = graph.person_names[person].lower()
+            if name == query:
+                exact = True
+                scores[person] = 2.0
+            else:
+                scores[person] = 1.0 + len(query) / len(name)
+        if not exact and len(scores) < limit:
+            for person, score in self._fuzzy_matches(query, limit, scores):
+                scores[person] = score
+
+        ranked = sorted(
+            scores.items(), key=lambda item: (-item[1], -self._movie_count(item[0]))
+        )
+        return [self._candidate(person, score) for person, score in ranked[:limit]]
+
+    def resolve(self, query):
+        """
+        Returns the person_id that `query` names without prompting: an
+        exact person_id, or a name only one person has. Raises
+        LookupError otherwise, listing the best candidates.
+        """
+        graph = self.graph
+        if query in graph.people:
+            return query
+        matches = graph.people_named(query.strip().lower())
+        if len(matches) == 1:
+            return graph.person_ids[matches[0]]
+        if matches:
+            raise LookupError(f"ambiguous name: {query} ({len(matches)} matches)")
+        suggestions = ", ".join(c.name for c in self.search(query, 3))
+        if suggestions:
+            raise LookupError(
+                f"person not found: {query} (did you mean {suggestions}?)"
+            )
+        raise LookupError(f"person not found: {query}")
+
+    def extend(self, graph, people):
+        """
+        Switches to `graph`, an updated version of the current graph,
+        adding the trigrams of `people`, whose names are new or changed.
+        Postings left under a changed name's old trigrams are harmless,
+        since every candidate is checked against its current name.
+        """
+        self.graph = graph
+        if self.grams is None or not people:
+            return
+        added = {}
+        for person in sorted(people):
+            for gram in trigrams(graph.person_names[person].lower()):
+                added.setdefault(gram, array("i")).append(person)
+
+        keys = sorted(set(self.grams) | added.keys())
+        offsets = array("q", [0])
+        postings = array("i")
+        for key in keys:
+            posting = self._postings(key)
+            if posting:
+                postings.frombytes(memoryview(posting).cast("B"))
+            postings.extend(added.get(key, ()))
+            offsets.append(len(postings))
+        self.gram_offsets = offsets
+        self.gram_people = postings
+        self.grams = StringTable.from_strings(keys)
+
+    def _candidate(self, person, score):
+        graph = self.graph
+        birth = graph.person_births[person]
+        return Candidate(
+            graph.person_ids[person],
+            graph.person_names[person],
+            str(birth) if birth else "",
+            self._movie_count(person),
+            round(score, 3),
+        )
+
+    def _movie_count(self, person):
+        return len(self.graph.movies_of(person))
+
+    def _prefix_matches(self, prefix):
+        names, order = self.graph.person_names, self.graph.name_order
+        position = bisect_left(
+            range(len(order)), prefix, key=lambda i: names[order[i]].lower()
+        )
+        end = min(position + PREFIX_SCAN, len(order))
+        for i in range(position, end):
+            person = order[i]
+            if not names[person].lower().startswith(prefix):
+                break
+            yield person
+
+    def _fuzzy_matches(self, query, limit, exclude=()):
+        """
+        Returns up to `limit` (person, similarity) pairs, best first, for
+        names outside `exclude` sharing at least MIN_SIMILARITY of the
+        query's trigrams.
+
+        The query's postings are merged into a count of the trigrams each
+        person shares with it. A name sharing `count` of the query's n
+        trigrams has a similarity of at most count / n, so names are
+        checked in falling count order until that bound cannot beat the
+        `limit` best found. Counts can overshoot after `extend`, which
+        leaves stale postings, so the check uses the current name.
+        """
+        self._ensure_grams()
+        wanted = trigrams(query)
+        needed = max(1, int(len(wanted) * MIN_SIMILARITY + 0.5))
+        counts = Counter()
+        for gram in wanted:
+            counts.update(self._postings(gram))
+        by_count = {}
+        for person, count in counts.items():
+            if count >= needed and person not in exclude:
+                by_count.setdefault(count, []).append(person)
+
+        names = self.graph.person_names
+        best = []  # heap of the `limit` best (similarity, person)
+        for count in sorted(by_count, reverse=True):
+            bound = min(count, len(wanted)) / len(wanted)
+            for person in by_count[count]:
+                if len(best) == limit and bound <= best[0][0]:
+                    break
+                grams = trigrams(names[person].lower())
+                shared = len(wanted & grams)
+                if shared < needed:
+                    continue
+                match = (shared / len(wanted | grams), person)
+                if len(best) < limit:
+                    heapq.heappush(best, match)
+                else:
+                    heapq.heappushpop(best, match)
+            else:
+                continue
+            break
+        return [
+            (person, similarity) for similarity, person in sorted(best, reverse=True)
+        ]
+
+    def _postings(self, gram):
+        grams = self.grams
+        position = bisect_left(range(len(grams)), gram, key=grams.__getitem__)
+        if position == len(grams) or grams[position] != gram:
+            return ()
+        offsets = self.gram_offsets
+        return self.gram_people[offsets[position] : offsets[position + 1]]
+
+    def _ensure_grams(self):
+        if self.grams is not None:
+            return
+        if self.directory is not None:
+            try:
+                self.load_grams()
+                return
+            except snapshot.SnapshotError:
+                pass
+        self._build_grams()
+        if self.directory is not None:
+            try:
+                self.save_grams()
+            except OSError:
+                pass
+
+    def _build_grams(self):
+        names = self.graph.person_names
+        index = {}
+        for person, name in enumerate(names):
+            for gram in trigrams(name.lower()):
+                posting = index.get(gram)
+                if posting is None:
+                    index[gram] = posting = array("i")
+                posting.append(person)
+
+        keys = sorted(index)
+        offsets = array("q", [0])
+        people = array("i")
+        for key in keys:
+            people.extend(index.pop(key))
+            offsets.append(len(people))
+        self.gram_offsets = offsets
+        self.gram_people = people
+        self.grams = StringTable.from_strings(keys)
+
+    def save_grams(self):
+        """
+        Writes the trigram postings next to the CSV files in `directory`.
+        """
+        snapshot.write_image(
+            names_path(self.directory),
+            self.directory,
+            {"kind": "names"},
+            {
+                "grams.data": self.grams.data,
+                "grams.offsets": self.grams.offsets,
+                "offsets": self.gram_offsets,
+                "people": self.gram_people,
+            },
+        )
+
+    def load_grams(self):
+        """
+        Reads the trigram postings cached in `directory`, raising
+        snapshot.SnapshotError if they are missing or out of date.
+        """
+        meta, sections = snapshot.read_image(names_path(self.directory), self.directory)
+        if meta.get("kind") != "names":
+            raise snapshot.SnapshotError("not a name index")
+        try:
+            grams = StringTable(sections["grams.data"], sections["grams.offsets"])
+            self.gram_offsets = sections["offsets"]
+            self.gram_people = sections["people"]
+        except KeyError as e:
+            raise snapshot.SnapshotError(f"name index is missing {e}") from e
+        self.grams = grams
+
+
+def names_path(directory):
+    return os.path.join(directory, NAMES_NAME)
+
+
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
@@ -0,0 +1,251 @@
+"""
+Enumerate every shortest path, or the k shortest paths, between two
+people.
+
+`shortest_dag` runs one bidirectional breadth-first search that, unlike
+degrees.shortest_path, finishes the level where the two sides meet and
+keeps every (movie, person) step that lies on some shortest path, one
+per shared movie. The resulting ShortestPathDAG counts its paths without
+listing them and yields them lazily, so callers can stream or cap the
+output even when popular movies make the number of paths explode.
+
+`k_shortest_paths` yields the shortest paths first, from the DAG, and
+then longer ones in order of length, using Yen's algorithm with a
+breadth-first search from each spur person.
+"""
+
+import heapq
+from itertools import islice
+
+import degrees
+
+
+class ShortestPathDAG:
+    def __init__(self, source, target, forward, backward, meetings):
+        # Person indices of the ends; for each person on a shortest path,
+        # the (movie, person) steps one hop closer to the source (forward)
+        # or the target (backward); and the people where the halves join
+        self.source = source
+        self.target = target
+        self.forward = forward
+        self.backward = backward
+        self.meetings = meetings
+
+    def count(self):
+        """
+        Returns the number of shortest paths, without enumerating them.
+        """
+        ahead, behind = {self.source: 1}, {self.target: 1}
+        return sum(
+            _count(m, self.forward, ahead) * _count(m, self.backward, behind)
+            for m in self.meetings
+        )
+
+    def paths(self):
+        """
+        Yields every shortest path as a list of (movie index, person
+        index) pairs.
+        """
+        for meeting in self.meetings:
+            for head in self._heads(meeting):
+                for tail in self._tails(meeting):
+                    yield head + tail
+
+    def _heads(self, person):
+        if person == self.source:
+            yield []
+            return
+        for movie, parent in self.forward[person]:
+            for head in self._heads(parent):
+                yield head + [(movie, person)]
+
+    def _tails(self, person):
+        if person == self.target:
+            yield []
+            return
+        for movie, child in self.backward[person]:
+            for tail in self._tails(child):
+                yield [(movie, child)] + tail
+
+
+def shortest_dag(source, target):
+    """
+    Returns the ShortestPathDAG between two person indices of the loaded
+    graph, or None if they are not connected.
+    """
+    graph = degrees.graph
+    if not graph.connected(source, target):
+        return None
+    if source == target:
+        return ShortestPathDAG(source, target, {}, {}, [source])
+    forward, backward = _Side(graph, source), _Side(graph, target)
+
+    while True:
+        if len(forward.frontier) <= len(backward.frontier):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+        side.expand()
+        meetings = [p for p in side.frontier if p in other.depths]
+        if meetings:
+            break
+
+    # The new level may meet the other side at different depths; only
+    # the closest meetings lie on shortest paths
+    closest = min(other.depths[p] for p in meetings)
+    meetings = sorted(p for p in meetings if other.depths[p] == closest)
+    return ShortestPathDAG(source, target, forward.steps, backward.steps, meetings)
+
+
+def all_shortest_paths(source, target, limit=None):
+    """
+    Yields every shortest list of (movie_id, person_id) pairs connecting
+    the source to the target, at most `limit` of them if given. Yields
+    nothing if they are not connected.
+    """
+    graph = degrees.graph
+    dag = shortest_dag(graph.person_index(source), graph.person_index(target))
+    if dag is None:
+        return
+    for path in islice(dag.paths(), limit):
+        yield graph.path_ids(path)
+
+
+def k_shortest_paths(source, target, k=None):
+    """
+    Yields up to `k` simple paths (no person repeated) from the source to
+    the target as lists of (movie_id, person_id) pairs, shortest first.
+    With no `k`, keeps yielding until every simple path has been listed.
+    """
+    graph = degrees.graph
+    source, target = graph.person_index(source), graph.person_index(target)
+    dag = shortest_dag(source, target)
+    if dag is None:
+        return
+
+    found = []
+    for path in islice(dag.paths(), k):
+        found.append(path)
+        yield graph.path_ids(path)
+    if k is not None and len(found) == k:
+        return
+
+    # Yen's algorithm, seeded with every shortest path
+    candidates, queued = [], set()
+    for path in found:
+        _spur_candidates(graph, source, target, path, found, candidates, queued)
+    while candidates and (k is None or len(found) < k):
+        _, _, path = heapq.heappop(candidates)
+        found.append(path)
+        yield graph.path_ids(path)
+        _spur_candidates(graph, source, target, path, found, candidates, queued)
+
+
+class _Side:
+    """One direction of the search: depths and steps back to its root."""
+
+    def __init__(self, graph, root):
+        self.graph = graph
+        self.depths = {root: 0}
+        self.steps = {root: []}
+        self.frontier = [root]
+        self.depth = 0
+        # Movies already expanded; their casts are at most a level deeper
+        self.expanded = set()
+
+    def expand(self):
+        """
+        Expands one full level, recording every step into the new level.
+        """
+        graph, depths, steps = self.graph, self.depths, self.steps
+        depth = self.depth + 1
+        expanded = set()
+        next_frontier = []
+        for person in self.frontier:
+            for movie in graph.movies_of(person):
+                if movie in self.expanded:
+                    continue
+                expanded.add(movie)
+                for other in graph.stars_of(movie):
+                    known = depths.get(other)
+                    if known is None:
+                        depths[other] = depth
+                        steps[other] = [(movie, person)]
+                        next_frontier.append(other)
+                    elif known == depth:
+                        steps[other].append((movie, person))
+        self.expanded |= expanded
+        self.frontier = next_frontier
+        self.depth = depth
+
+
+def _count(person, steps, counts):
+    """
+    Returns the number of paths from `person` back to the root of
+    `steps`, memoized in `counts`, which starts as {root: 1}.
+    """
+    pending = [person]
+    while pending:
+        current = pending[-1]
+        if current in counts:
+            pending.pop()
+            continue
+        missing = [p for _, p in steps[current] if p not in counts]
+        if missing:
+            pending.extend(missing)
+            continue
+        counts[current] = sum(counts[p] for _, p in steps[current])
+        pending.pop()
+    return counts[person]
+
+
+def _spur_candidates(graph, source, target, path, found, candidates, queued):
+    """
+    Pushes onto `candidates` every path that follows `path` up to some
+    spur person and then leaves it by a step no found path with that
+    prefix takes, continuing by a shortest route avoiding the prefix.
+    """
+    people = [source] + [person for _, person in path]
+    for i in range(len(path)):
+        root = path[:i]
+        spur = people[i]
+        banned = {p[i] for p in found if len(p) > i and p[:i] == root}
+        tail = _spur_path(graph, spur, target, set(people[:i]), banned)
+        if tail is None:
+            continue
+        candidate = root + tail
+        key = tuple(candidate)
+        if key not in queued:
+            queued.add(key)
+            heapq.heappush(candidates, (len(candidate), len(queued), candidate))
+
+
+def _spur_path(graph, spur, target, blocked, banned):
+    """
+    Returns a shortest (movie, person) path from `spur` to `target` that
+    avoids the people in `blocked` and does not start with a step in
+    `banned`, or None.
+    """
+    parents = {spur: None}
+    frontier = [spur]
+    while frontier:
+        next_frontier = []
+        for person in frontier:
+            for movie in graph.movies_of(person):
+                for other in graph.stars_of(movie):
+                    if other in parents or other in blocked:
+                        continue
+                    if person == spur and (movie, other) in banned:
+                        continue
+                    parents[other] = (movie, person)
+                    if other == target:
+                        path = []
+                        while parents[other] is not None:
+                            movie, parent = parents[other]
+                            path.append((movie, other))
+                            other = parent
+                        path.reverse()
+                        return path
+                    next_frontier.append(other)
+        frontier = next_frontier
+    return None
@@ -0,0 +1,328 @@
+"""
+Resident HTTP/JSON query server for degrees.
+
+Usage: python server.py [-d DIRECTORY] [--host HOST] [--port PORT]
+                        [-w WORKERS] [-c TREE_CACHE_MB | -t SECONDS]
+
+Loads the graph once and serves
+
+    GET /path?source=...&target=...   shortest path between two people
+        [&first_year=...][&last_year=...]
+        [&exclude_movie=...][&exclude_person=...]   (both repeatable)
+    GET /person?name=...&limit=...    ranked name lookup
+    GET /stats                        request counts and latency percentiles
+
+Sources and targets may be names or person IDs. With --timeout, a search
+that runs longer gives up and answers 503 with its progress, so one
+unlucky pair cannot hold a worker indefinitely; it cannot be combined
+with the tree cache, whose trees are built in full. Searches run in a
+process pool forked after the load, so the event loop stays responsive
+and the workers share the graph copy-on-write. The workers are forked
+before the event loop starts, while the parent has a single thread.
+Name lookups run on a thread of the parent, which holds the name index.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import anytime
+import batch
+import degrees
+from constraints import Constraints
+
+# Latencies kept per route for /stats
+LATENCY_WINDOW = 1000
+
+MAX_REQUEST_LINE = 8192
+
+# Header lines read per request before answering 431
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        # Fields added to the JSON error body next to "error"
+        self.details = details or {}
+
+
+class QueryServer:
+    def __init__(self, executor):
+        self.executor = executor
+        self.started = time.time()
+        self.requests = {}
+        self.latencies = {}
+
+    async def handle(self, reader, writer):
+        """
+        Serves requests on one connection until the client closes it or
+        asks for `Connection: close`.
+        """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    # The rest of the request cannot be skipped, so the
+                    # connection is done
+                    await self._respond(writer, e.status, {"error": str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, keep_alive = request
+                start = time.perf_counter()
+                route = urlsplit(target).path
+                try:
+                    if method != "GET":
+                        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "use GET")
+                    status, body = HTTPStatus.OK, await self.dispatch(target)
+                except HTTPError as e:
+                    status, body = e.status, {"error": str(e), **e.details}
+                except Exception as e:
+                    status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+                elapsed = (time.perf_counter() - start) * 1000
+                self._record(route, elapsed)
+                print(
+                    f"{method} {target} {status.value} {elapsed:.1f} ms",
+                    file=sys.stderr,
+                )
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, target):
+        parts = urlsplit(target)
+        values = parse_qs(parts.query)
+        query = {key: found[-1] for key, found in values.items()}
+        if parts.path == "/path":
+            return await self.path(
+                _require(query, "source"),
+                _require(query, "target"),
+                _constraints(query, values),
+            )
+        if parts.path == "/person":
+            return await self.person(_require(query, "name"), query.get("limit", "10"))
+        if parts.path == "/stats":
+            return self.stats()
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"no route {parts.path}")
+
+    async def path(self, source, target, constraints=None):
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.executor, batch.answer, (source, target), constraints
+        )
+        if "error" in result:
+            raise HTTPError(HTTPStatus.NOT_FOUND, result["error"])
+        if result.get("status") == anytime.BUDGET_EXCEEDED:
+            raise HTTPError(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                f"search gave up after {result['progress']['elapsed']:.3f}s",
+                {"progress": result["progress"]},
+            )
+
+        steps = []
+        for movie_id, person_id in result["path"] or ():
+            steps.append(
+                {
+                    "movie_id": movie_id,
+                    "title": degrees.movies[movie_id]["title"],
+                    "person_id": person_id,
+                    "name": degrees.people[person_id]["name"],
+                }
+            )
+        result["path"] = steps if result["path"] is not None else None
+        return result
+
+    async def person(self, name, limit):
+        try:
+            limit = max(1, min(int(limit), 100))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "limit must be an integer")
+        # A fuzzy lookup, or the first one building the trigram index, is
+        # slow enough to stall other connections, so it runs on a thread
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(
+            None, degrees.name_index.search, name, limit
+        )
+        return {"query": name, "candidates": [c._asdict() for c in candidates]}
+
+    def stats(self):
+        routes = {}
+        for route, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            routes[route] = {
+                "requests": self.requests[route],
+                "p50_ms": _percentile(ordered, 0.5),
+                "p90_ms": _percentile(ordered, 0.9),
+                "p99_ms": _percentile(ordered, 0.99),
+            }
+        return {"uptime_s": time.time() - self.started, "routes": routes}
+
+    def _record(self, route, elapsed):
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if route not in self.latencies:
+            self.latencies[route] = deque(maxlen=LATENCY_WINDOW)
+        self.latencies[route].append(elapsed)
+
+    async def _read_request(self, reader):
+        """
+        Returns (method, target, keep_alive) for the next request, or
+        None once the client has closed the connection. Raises HTTPError
+        for more than MAX_HEADERS header lines, an overlong one, or a
+        Content-Length that is not a non-negative integer.
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        if len(line) > MAX_REQUEST_LINE:
+            raise ConnectionError("request line too long")
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise ConnectionError("malformed request line") from None
+
+        headers = {}
+        for _ in range(MAX_HEADERS + 1):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(line) > MAX_REQUEST_LINE:
+                raise HTTPError(
+                    HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "header line too long"
+                )
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "too many header lines"
+            )
+
+        # Drain any body so the next request on the connection starts clean
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+        if length:
+            await reader.readexactly(length)
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+        return method, target, keep_alive
+
+    async def _respond(self, writer, status, body, keep_alive):
+        payload = json.dumps(body).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+
+def _require(query, key):
+    value = query.get(key, "").strip()
+    if not value:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"missing parameter {key}")
+    return value
+
+
+def _constraints(query, values):
+    """
+    Returns the Constraints given by the query string, or None.
+    """
+    try:
+        first, last = (
+            int(query[key]) if key in query else None
+            for key in ("first_year", "last_year")
+        )
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "years must be integers")
+    movies = values.get("exclude_movie", [])
+    people = values.get("exclude_person", [])
+    if first is None and last is None and not movies and not people:
+        return None
+    return Constraints(first, last, movies, people)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def serve(host, port, executor):
+    server = QueryServer(executor)
+    listener = await asyncio.start_server(server.handle, host, port)
+    addresses = ", ".join(str(s.getsockname()) for s in listener.sockets)
+    print(f"Serving on {addresses}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-d", "--directory", default="large")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "-w", "--workers", type=int, default=os.cpu_count(), help="search processes"
+    )
+    parser.add_argument(
+        "-c", "--tree-cache", type=int, default=0, help="BFS tree cache MB per worker"
+    )
+    parser.add_argument("-t", "--timeout", type=float, help="seconds per search")
+    args = parser.parse_args()
+    if args.tree_cache and args.timeout is not None:
+        parser.error("--tree-cache cannot be combined with --timeout")
+
+    print("Loading data...", file=sys.stderr)
+    degrees.load_data(args.directory)
+    print("Data loaded.", file=sys.stderr)
+
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    executor = ProcessPoolExecutor(
+        args.workers,
+        multiprocessing.get_context(method),
+        initializer=batch._init_worker,
+        initargs=(
+            args.directory,
+            args.tree_cache * 2**20,
+            None,
+            None if args.timeout is None else (args.timeout, None),
+        ),
+    )
+    # Fork every worker now: fork copies only the calling thread, and once
+    # the event loop runs, name lookups hold threads of their own
+    executor.submit(os.getpid).result()
+    try:
+        asyncio.run(serve(args.host, args.port, executor))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Binary snapshots of a loaded Graph.
+
+A snapshot is written next to the CSV files it was built from. It starts
+with a fixed preamble (magic, format version, header length), followed
+by a JSON header that records the byte order, the size and mtime of each
+source CSV, and the location of every Graph field. Each field is stored
+as a raw, 8-byte aligned array so it can be memory-mapped and used in
+place without parsing.
+
+`write_image` and `read_image` implement the file format on their own,
+so other precomputed indexes can be stored the same way.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from graph import Graph, StringTable
+from ingest import IngestReport, load_csv
+
+SNAPSHOT_NAME = "degrees.snapshot"
+SNAPSHOT_VERSION = 5
+SOURCES = ("people.csv", "movies.csv", "stars.csv")
+
+MAGIC = b"DEGSNAP\0"
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, stale or unreadable."""
+
+
+def snapshot_path(directory):
+    return os.path.join(directory, SNAPSHOT_NAME)
+
+
+def source_stats(directory):
+    """
+    Returns the size and mtime of each source CSV in `directory`.
+    """
+    stats = {}
+    for name in SOURCES:
+        st = os.stat(os.path.join(directory, name))
+        stats[name] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def load(directory):
+    """
+    Returns the (Graph, IngestReport) pair for `directory`, memory-mapping
+    its snapshot when it is up to date and rebuilding it from the CSV
+    files otherwise.
+    """
+    try:
+        return read(directory)
+    except SnapshotError:
+        pass
+
+    graph, report = load_csv(directory)
+    try:
+        write(graph, directory, report)
+    except OSError:
+        # A read-only data directory only costs us the cache
+        pass
+    return graph, report
+
+
+def write(graph, directory, report, stats=None):
+    """
+    Writes `graph` and the IngestReport it was loaded with as the
+    snapshot for `directory`.
+    """
+    buffers = {}
+    for field in Graph.FIELDS:
+        value = getattr(graph, field)
+        if isinstance(value, StringTable):
+            buffers[f"{field}.data"] = value.data
+            buffers[f"{field}.offsets"] = value.offsets
+        else:
+            buffers[field] = value
+    write_image(
+        snapshot_path(directory),
+        directory,
+        {"report": report.as_dict()},
+        buffers,
+        stats,
+    )
+
+
+def read(directory):
+    """
+    Memory-maps the snapshot for `directory` and returns its Graph and
+    the IngestReport recorded when it was written.
+
+    Raises SnapshotError if the snapshot is missing, was written by a
+    different format version or byte order, or no longer matches the
+    sizes and mtimes of the source CSV files.
+    """
+    meta, sections = read_image(snapshot_path(directory), directory)
+    fields = []
+    try:
+        for field in Graph.FIELDS:
+            if f"{field}.data" in sections:
+                data = sections[f"{field}.data"]
+                fields.append(StringTable(data, sections[f"{field}.offsets"]))
+            else:
+                fields.append(sections[field])
+        report = IngestReport(**meta["report"])
+    except KeyError as e:
+        raise SnapshotError(f"snapshot is missing section {e}") from e
+    return Graph(*fields), report
+
+
+def write_image(path, directory, meta, buffers, stats=None):
+    """
+    Writes the arrays in `buffers` (a dict of name to array, bytes or
+    memoryview) and the JSON-serializable `meta` to the image at `path`,
+    stamped with the source stats of `directory`.
+    """
+    if stats is None:
+        stats = source_stats(directory)
+
+    sections = {}
+    offset = 0
+    for name, value in buffers.items():
+        value = memoryview(value)
+        sections[name] = [value.format, offset, len(value)]
+        offset = _align(offset + value.nbytes)
+
+    header = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "sources": stats,
+            "meta": meta,
+            "sections": sections,
+        }
+    ).encode("utf-8")
+    body_start = _align(PREAMBLE.size + len(header))
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            for name, value in buffers.items():
+                f.seek(body_start + sections[name][1])
+                f.write(memoryview(value).cast("B"))
+            f.truncate(body_start + offset)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def read_image(path, directory):
+    """
+    Memory-maps the image at `path` and returns its `meta` and a dict of
+    section name to a memoryview cast to the section's typecode.
+
+    Raises SnapshotError if the image is unreadable or no longer matches
+    the source CSV files of `directory`.
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"cannot open {path}: {e}") from e
+
+    buffer = memoryview(mapped)
+    try:
+        magic, version, header_length = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"unsupported format in {path}")
+        header_end = PREAMBLE.size + header_length
+        header = json.loads(str(buffer[PREAMBLE.size : header_end], "utf-8"))
+        byteorder, sources = header["byteorder"], header["sources"]
+        meta, layout = header["meta"], header["sections"]
+    except (struct.error, ValueError, KeyError, TypeError) as e:
+        raise SnapshotError(f"corrupt header in {path}: {e}") from e
+
+    if byteorder != sys.byteorder:
+        raise SnapshotError(f"{path} was written with a different byte order")
+    try:
+        stats = source_stats(directory)
+    except OSError as e:
+        raise SnapshotError(f"cannot stat source files: {e}") from e
+    if sources != stats:
+        raise SnapshotError(f"{path} is out of date")
+
+    body_start = _align(header_end)
+    sections = {}
+    for name, (typecode, offset, length) in layout.items():
+        start = body_start + offset
+        end = start + length * array(typecode).itemsize
+        if end > len(buffer):
+            raise SnapshotError(f"truncated section {name} in {path}")
+        sections[name] = buffer[start:end].cast(typecode)
+    return meta, sections
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
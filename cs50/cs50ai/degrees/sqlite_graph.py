@@ -0,0 +1,391 @@
+"""
+Out-of-core graph storage in SQLite.
+
+Usage: python sqlite_graph.py [directory]
+
+The CSV files are imported once into an indexed database next to them.
+People and movies are numbered in file order exactly as load_csv numbers
+them, star edges are keyed both ways, and component labels and the name
+order are computed at import time. SQLiteGraph answers the Graph
+interface from that database, so the search, name lookups and
+neighbors_for_person run against it unchanged, paying a query for each
+uncached lookup instead of holding the graph in memory. Casts are kept
+in a bounded LRU cache; the co-star lists the search builds are bounded
+by the CoStarIndex they go through.
+
+There are no CSR arrays, so BFS trees, landmarks and incremental updates
+still need the in-memory Graph.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+from array import array
+from collections import OrderedDict
+from itertools import islice
+from operator import itemgetter
+
+import snapshot
+from components import UnionFind, relabel
+from graph import Graph, parse_year
+from ingest import CHUNK_SIZE, IngestReport
+
+DATABASE_NAME = "degrees.sqlite"
+SCHEMA_VERSION = 1
+
+# Casts kept in memory, and the co-star bytes degrees should allow
+CAST_CACHE = 4096
+COSTAR_BYTES = 16 * 2**20
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE people (
+    idx INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    lname TEXT NOT NULL,
+    birth INTEGER NOT NULL,
+    name_rank INTEGER,
+    component INTEGER
+);
+CREATE TABLE movies (
+    idx INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    year INTEGER NOT NULL
+);
+CREATE TABLE stars (
+    person INTEGER NOT NULL,
+    movie INTEGER NOT NULL,
+    PRIMARY KEY (person, movie)
+) WITHOUT ROWID;
+CREATE TABLE components (label INTEGER PRIMARY KEY, size INTEGER NOT NULL);
+CREATE TEMP TABLE raw (seq INTEGER PRIMARY KEY, id TEXT, label TEXT, year INTEGER);
+CREATE TEMP TABLE raw_stars (person_id TEXT, movie_id TEXT);
+"""
+
+# A repeated ID keeps its first position and takes its last row, as in
+# ingest.read_entities
+ENTITIES = """
+INSERT INTO {table}
+SELECT row_number() OVER (ORDER BY span.first) - 1, raw.id, raw.label, {extra}
+FROM (SELECT MIN(seq) AS first, MAX(seq) AS last FROM raw GROUP BY id) AS span
+JOIN raw ON raw.seq = span.last
+"""
+
+
+class _Column:
+    """
+    A read-only sequence over one column of a table, in `key` order,
+    standing in for the arrays and StringTables of a Graph.
+    """
+
+    def __init__(self, graph, table, column, key="idx"):
+        self.graph = graph
+        self.select = f"SELECT {column} FROM {table} WHERE {key} = ?"
+        self.scan = f"SELECT {column} FROM {table} ORDER BY {key}"
+        self.count = f"SELECT count(*) FROM {table}"
+        self.length = None
+
+    def __len__(self):
+        if self.length is None:
+            self.length = self.graph.query(self.count).fetchone()[0]
+        return self.length
+
+    def __getitem__(self, i):
+        row = self.graph.query(self.select, (i,)).fetchone()
+        if row is None:
+            raise IndexError(i)
+        return row[0]
+
+    def __iter__(self):
+        for (value,) in self.graph.query(self.scan):
+            yield value
+
+
+class SQLiteGraph(Graph):
+    """
+    A Graph whose fields are read from the database at `path` on demand.
+    """
+
+    def __init__(self, path, cast_cache=CAST_CACHE):
+        self.path = path
+        self.cast_cache = cast_cache
+        self.casts = OrderedDict()
+        self.connection = None
+        self.pid = None
+
+        def people(column, key="idx"):
+            return _Column(self, "people", column, key)
+
+        def movies(column):
+            return _Column(self, "movies", column)
+
+        super().__init__(
+            people("id"),
+            people("name"),
+            people("birth"),
+            movies("id"),
+            movies("title"),
+            movies("year"),
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            people("idx", "name_rank"),
+            None,
+            people("component"),
+            _Column(self, "components", "size", "label"),
+        )
+
+    def query(self, sql, parameters=()):
+        # A connection must not be shared with a forked child, so each
+        # process opens its own
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+            self.pid = os.getpid()
+        return self.connection.execute(sql, parameters)
+
+    def person_count(self):
+        return len(self.person_ids)
+
+    def movie_count(self):
+        return len(self.movie_ids)
+
+    def person_index(self, person_id):
+        return self._index("SELECT idx FROM people WHERE id = ?", person_id)
+
+    def movie_index(self, movie_id):
+        return self._index("SELECT idx FROM movies WHERE id = ?", movie_id)
+
+    def people_named(self, name):
+        rows = self.query(
+            "SELECT idx FROM people WHERE lname = ? ORDER BY name_rank", (name,)
+        )
+        return [person for (person,) in rows]
+
+    def movies_of(self, person):
+        rows = self.query("SELECT movie FROM stars WHERE person = ?", (person,))
+        return array("i", (movie for (movie,) in rows))
+
+    def stars_of(self, movie):
+        cast = self.casts.get(movie)
+        if cast is not None:
+            self.casts.move_to_end(movie)
+            return cast
+        rows = self.query("SELECT person FROM stars WHERE movie = ?", (movie,))
+        cast = self.casts[movie] = array("i", (person for (person,) in rows))
+        if len(self.casts) > self.cast_cache:
+            self.casts.popitem(last=False)
+        return cast
+
+    def year_mask(self, first, last):
+        mask = bytearray(self.movie_count())
+        rows = self.query(
+            "SELECT idx FROM movies WHERE year BETWEEN ? AND ?", (max(first, 1), last)
+        )
+        for (movie,) in rows:
+            mask[movie] = 1
+        return bytes(mask)
+
+    def nbytes(self):
+        """
+        Returns the approximate number of bytes of cached casts.
+        """
+        return sum(len(cast) * cast.itemsize for cast in self.casts.values())
+
+    def _index(self, sql, key):
+        row = self.query(sql, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+
+def database_path(directory):
+    return os.path.join(directory, DATABASE_NAME)
+
+
+def open_graph(directory):
+    """
+    Returns the (SQLiteGraph, IngestReport) pair for `directory`,
+    importing its CSV files first if the database is missing or stale.
+    """
+    try:
+        return read(directory)
+    except snapshot.SnapshotError:
+        pass
+    build(directory, database_path(directory))
+    return read(directory)
+
+
+def read(directory):
+    """
+    Opens the database for `directory`, raising snapshot.SnapshotError if
+    it is missing, from another schema version, or out of date.
+    """
+    path = database_path(directory)
+    if not os.path.exists(path):
+        raise snapshot.SnapshotError(f"no database at {path}")
+    graph = SQLiteGraph(path)
+    try:
+        meta = dict(graph.query("SELECT key, value FROM meta"))
+        version, sources = int(meta["version"]), json.loads(meta["sources"])
+        report = IngestReport(**json.loads(meta["report"]))
+    except (sqlite3.Error, KeyError, ValueError) as e:
+        raise snapshot.SnapshotError(f"unreadable database {path}: {e}") from e
+    if version != SCHEMA_VERSION:
+        raise snapshot.SnapshotError(f"unsupported schema in {path}")
+    try:
+        stats = snapshot.source_stats(directory)
+    except OSError as e:
+        raise snapshot.SnapshotError(f"cannot stat source files: {e}") from e
+    if sources != stats:
+        raise snapshot.SnapshotError(f"{path} is out of date")
+    return graph, report
+
+
+def build(directory, path):
+    """
+    Imports the CSV files in `directory` into a new database at `path`.
+    The import streams rows through temporary tables, so it never holds
+    more than a chunk of rows and the component labels in memory.
+    """
+    stats = snapshot.source_stats(directory)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    db = sqlite3.connect(temporary)
+    try:
+        db.create_function("py_lower", 1, str.lower, deterministic=True)
+        db.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+        db.executescript(SCHEMA)
+
+        report = IngestReport()
+        report.people = _import_entities(
+            db, f"{directory}/people.csv", ("id", "name", "birth"), "people"
+        )
+        report.movies = _import_entities(
+            db, f"{directory}/movies.csv", ("id", "title", "year"), "movies"
+        )
+        _import_stars(db, f"{directory}/stars.csv", report)
+        _rank_names(db)
+        _label_components(db, report.people)
+
+        meta = {
+            "version": str(SCHEMA_VERSION),
+            "sources": json.dumps(stats),
+            "report": json.dumps(report.as_dict()),
+        }
+        db.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        db.commit()
+    except BaseException:
+        db.close()
+        os.remove(temporary)
+        raise
+    db.close()
+    os.replace(temporary, path)
+    return report
+
+
+def _rows(path, columns):
+    """
+    Yields chunks of the `columns` of the CSV file at `path`.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            get = itemgetter(*(header.index(column) for column in columns))
+        except ValueError as e:
+            raise ValueError(f"{path}: missing column ({e})") from None
+        rows = filter(None, reader)
+        while chunk := list(islice(rows, CHUNK_SIZE)):
+            yield [get(row) for row in chunk]
+
+
+def _import_entities(db, path, columns, table):
+    db.execute("DELETE FROM raw")
+    for chunk in _rows(path, columns):
+        db.executemany(
+            "INSERT INTO raw (id, label, year) VALUES (?, ?, ?)",
+            ((id_, label, parse_year(year)) for id_, label, year in chunk),
+        )
+    if table == "people":
+        extra = "py_lower(raw.label), raw.year, NULL, NULL"
+    else:
+        extra = "raw.year"
+    db.execute(ENTITIES.format(table=table, extra=extra))
+    db.execute(f"CREATE UNIQUE INDEX {table}_id ON {table} (id)")
+    return db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def _import_stars(db, path, report):
+    for chunk in _rows(path, ("person_id", "movie_id")):
+        db.executemany("INSERT INTO raw_stars VALUES (?, ?)", chunk)
+        report.stars += len(chunk)
+    joined = """
+        FROM raw_stars
+        JOIN people ON people.id = raw_stars.person_id
+        JOIN movies ON movies.id = raw_stars.movie_id
+    """
+    matched = db.execute(f"SELECT count(*) {joined}").fetchone()[0]
+    report.dangling_stars = report.stars - matched
+    db.execute(f"INSERT OR IGNORE INTO stars SELECT people.idx, movies.idx {joined}")
+    db.execute("CREATE INDEX stars_movie ON stars (movie, person)")
+    db.execute("DROP TABLE raw_stars")
+
+
+def _rank_names(db):
+    db.execute(
+        "CREATE TEMP TABLE ranks AS SELECT idx, "
+        "row_number() OVER (ORDER BY lname, idx) - 1 AS rank FROM people"
+    )
+    db.execute(
+        "UPDATE people SET name_rank = ranks.rank FROM ranks "
+        "WHERE ranks.idx = people.idx"
+    )
+    db.execute("DROP TABLE ranks")
+    db.execute("CREATE INDEX people_lname ON people (lname)")
+    db.execute("CREATE UNIQUE INDEX people_rank ON people (name_rank)")
+
+
+def _label_components(db, person_count):
+    sets = UnionFind(person_count)
+    first = movie = None
+    for star_movie, person in db.execute(
+        "SELECT movie, person FROM stars ORDER BY movie"
+    ):
+        if star_movie != movie:
+            first, movie = person, star_movie
+        else:
+            sets.union(first, person)
+    labels, sizes = relabel(sets)
+    db.executemany(
+        "UPDATE people SET component = ? WHERE idx = ?",
+        ((label, person) for person, label in enumerate(labels)),
+    )
+    db.executemany("INSERT INTO components VALUES (?, ?)", enumerate(sizes))
+
+
+def main():
+    if len(sys.argv) > 2:
+        sys.exit("Usage: python sqlite_graph.py [directory]")
+    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    try:
+        _, report = read(directory)
+        print("Database is up to date.")
+    except snapshot.SnapshotError:
+        print("Importing...")
+        report = build(directory, database_path(directory))
+    for key, value in report.as_dict().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
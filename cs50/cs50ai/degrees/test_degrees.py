@@ -0,0 +1,749 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import analytics
+import anytime
+import batch
+import benchmark
+import costars
+import degrees
+import instrument
+import landmarks
+import nameindex
+import paths
+import server
+import snapshot
+import update
+import util
+from cache import TreeCache
+from constraints import Constraints
+from ingest import load_csv
+
+PAIRS = 60
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("benchmark")
+    benchmark.generate(directory, 3000, 1500, seed=7)
+    return str(directory)
+
+
+@pytest.fixture
+def graph(dataset):
+    degrees.load_data(dataset)
+    return degrees.graph
+
+
+def distances(graph, source, allowed=None, blocked=()):
+    """
+    Returns the BFS depth of every person index reachable from `source`,
+    using only movies set in `allowed` and never entering `blocked`.
+    """
+    depths = {source: 0}
+    queue = deque([source])
+    while queue:
+        person = queue.popleft()
+        for movie in graph.movies_of(person):
+            if allowed is not None and not allowed[movie]:
+                continue
+            for neighbor in graph.stars_of(movie):
+                if neighbor not in depths and neighbor not in blocked:
+                    depths[neighbor] = depths[person] + 1
+                    queue.append(neighbor)
+    return depths
+
+
+def pairs(graph, count=PAIRS, seed=1):
+    rng = random.Random(seed)
+    people = graph.person_count()
+    return [(rng.randrange(people), rng.randrange(people)) for _ in range(count)]
+
+
+def check_path(graph, source, target, path, expected, allowed=None, blocked=()):
+    """
+    Asserts that `path`, a list of (movie_id, person_id) pairs, joins the
+    two person indices in `expected` steps, or is None if that is None.
+    """
+    if expected is None:
+        assert path is None
+        return
+    assert path is not None and len(path) == expected
+    person = source
+    for movie_id, person_id in path:
+        movie, next_person = graph.movie_index(movie_id), graph.person_index(person_id)
+        cast = graph.stars_of(movie)
+        assert person in cast and next_person in cast
+        assert allowed is None or allowed[movie]
+        assert next_person not in blocked
+        person = next_person
+    assert person == target
+
+
+def far_pair(graph, hops=3):
+    """
+    Returns a pair of person indices at least `hops` degrees apart.
+    """
+    for source, target in pairs(graph, 200, seed=8):
+        depth = distances(graph, source).get(target)
+        if depth is not None and depth >= hops:
+            return source, target
+    raise AssertionError(f"no pair {hops} degrees apart")
+
+
+def test_shortest_path_matches_bfs(graph):
+    for source, target in pairs(graph):
+        expected = distances(graph, source).get(target)
+        path = degrees.shortest_path(graph.person_ids[source], graph.person_ids[target])
+        check_path(graph, source, target, path, expected)
+
+
+def test_frontiers_track_states():
+    stack, queue = util.StackFrontier(), util.QueueFrontier()
+    nodes = [util.Node(state, None, None) for state in ("a", "b", "a", "c")]
+    for node in nodes:
+        stack.add(node)
+        queue.add(node)
+    assert len(stack) == len(queue) == 4
+    assert [stack.remove().state for _ in range(2)] == ["c", "a"]
+    assert [queue.remove().state for _ in range(2)] == ["a", "b"]
+
+    # One copy of "a" is still in each frontier
+    for frontier in (stack, queue):
+        assert frontier.contains_state("a")
+        assert not frontier.contains_state("z")
+    assert not stack.contains_state("c") and stack.contains_state("b")
+    assert not queue.contains_state("b") and queue.contains_state("c")
+
+    # The queue marks what it removes as explored; the stack leaves it
+    # to the caller
+    assert queue.is_explored("a") and queue.is_explored("b")
+    assert not stack.is_explored("c")
+    stack.mark_explored(nodes[3])
+    assert stack.is_explored("c")
+
+    for frontier in (stack, queue):
+        while not frontier.empty():
+            frontier.remove()
+        assert not frontier.contains_state("a")
+        with pytest.raises(Exception, match="empty frontier"):
+            frontier.remove()
+
+
+def test_node_has_slots():
+    node = util.Node("a", None, "movie")
+    assert not hasattr(node, "__dict__")
+    with pytest.raises(AttributeError):
+        node.cost = 1
+
+
+def dict_layout(directory):
+    """
+    Returns the names, people and movies dicts the original load_data
+    built from the CSV files.
+    """
+    names, people, movies = {}, {}, {}
+    with open(f"{directory}/people.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            people[row["id"]] = {
+                "name": row["name"],
+                "birth": row["birth"],
+                "movies": set(),
+            }
+            names.setdefault(row["name"].lower(), set()).add(row["id"])
+    with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            movies[row["id"]] = {
+                "title": row["title"],
+                "year": row["year"],
+                "stars": set(),
+            }
+    with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["person_id"] in people and row["movie_id"] in movies:
+                people[row["person_id"]]["movies"].add(row["movie_id"])
+                movies[row["movie_id"]]["stars"].add(row["person_id"])
+    return names, people, movies
+
+
+def test_csr_graph_matches_dict_layout(dataset, graph):
+    names, people, movies = dict_layout(dataset)
+    assert dict(degrees.people) == people
+    assert dict(degrees.movies) == movies
+    assert dict(degrees.names) == names
+    for person_id in list(people)[:200]:
+        expected = {
+            (movie_id, star)
+            for movie_id in people[person_id]["movies"]
+            for star in movies[movie_id]["stars"]
+        }
+        assert degrees.neighbors_for_person(person_id) == expected
+    with pytest.raises(KeyError):
+        graph.person_index("no such person")
+
+
+def test_snapshot_round_trip(dataset, tmp_path):
+    directory = tmp_path / "data"
+    shutil.copytree(dataset, directory, ignore=shutil.ignore_patterns("degrees.*"))
+    graph, report = load_csv(directory)
+    snapshot.write(graph, directory, report)
+
+    loaded, loaded_report = snapshot.read(directory)
+    assert loaded_report == report
+    for field in graph.FIELDS:
+        assert list(getattr(loaded, field)) == list(getattr(graph, field)), field
+
+    # Touching a source CSV makes the snapshot stale
+    with open(directory / "stars.csv", "a", encoding="utf-8") as f:
+        f.write("\n")
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read(directory)
+
+
+def test_parse_pairs():
+    lines = ["a\tb, c\n", "\n", "Kevin Bacon, Tom Hanks\n", "  x ,y  "]
+    assert list(batch.parse_pairs(lines)) == [
+        ("a", "b, c"),
+        ("Kevin Bacon", "Tom Hanks"),
+        ("x", "y"),
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_run_matches_bfs(dataset, graph, workers, monkeypatch):
+    monkeypatch.setattr(batch, "tree_cache", None)
+    monkeypatch.setattr(batch, "budget", None)
+    queries = pairs(graph, PAIRS // 2, seed=11)
+    # Each pair twice, so the tree cache gets hits
+    lines = [f"{graph.person_ids[s]}\t{graph.person_ids[t]}" for s, t in queries] * 2
+    lines.append("nobody at all,\tnobody")
+    output, cache_stats = io.StringIO(), {}
+    count = batch.run(
+        batch.parse_pairs(lines),
+        output,
+        dataset,
+        workers,
+        chunksize=4,
+        cache_bytes=2**20,
+        cache_stats=cache_stats,
+    )
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == len(results) == len(lines)
+
+    for (source, target), result in zip(queries * 2, results):
+        assert result["source_id"] == graph.person_ids[source]
+        expected = distances(graph, source).get(target)
+        assert result["degrees"] == expected
+        check_path(graph, source, target, result["path"], expected)
+    assert "error" in results[-1]
+    # Every connected query is a hit or a miss in some worker's cache
+    connected = sum(graph.connected(s, t) for s, t in queries)
+    assert cache_stats["hits"] + cache_stats["misses"] == 2 * connected
+    if workers == 1:
+        assert cache_stats["hits"] >= connected
+
+
+def test_parallel_ingest_matches_sequential(dataset):
+    graph, report = load_csv(dataset, parallel=False)
+    loaded, loaded_report = load_csv(dataset, parallel=True)
+    assert loaded_report == report
+    for field in graph.FIELDS:
+        assert list(getattr(loaded, field)) == list(getattr(graph, field)), field
+
+
+def test_landmark_path_matches_bfs(graph):
+    index = landmarks.LandmarkIndex.build(graph, 4)
+    for source, target in pairs(graph):
+        expected = distances(graph, source).get(target)
+        path = degrees.shortest_path(
+            graph.person_ids[source], graph.person_ids[target], index
+        )
+        check_path(graph, source, target, path, expected)
+
+
+def test_tree_cache_matches_bfs(graph):
+    cache = TreeCache(graph)
+    # Pairs sharing endpoints are answered from cached trees both ways
+    queries = pairs(graph, PAIRS // 2)
+    queries += [(target, source) for source, target in queries]
+    for source, target in queries:
+        expected = distances(graph, source).get(target)
+        path = cache.shortest_path(graph.person_ids[source], graph.person_ids[target])
+        check_path(graph, source, target, path, expected)
+    connected = sum(graph.connected(s, t) and s != t for s, t in queries) // 2
+    assert cache.hits >= connected
+
+
+def test_name_search_ranks_exact_prefix_then_fuzzy(graph):
+    index = nameindex.NameIndex(graph)
+    names = graph.person_names
+    person = max(range(graph.person_count()), key=lambda p: len(names[p]))
+    name = names[person]
+
+    exact = index.search(name.upper(), 5)
+    assert exact[0].name.lower() == name.lower() and exact[0].score == 2.0
+
+    prefix = name[: len(name) // 2].lower()
+    found = index.search(prefix, 50)
+    matching = [c for c in found if c.name.lower().startswith(prefix)]
+    assert matching and found[: len(matching)] == matching
+
+    typo = name[:3] + ("x" if name[3] != "x" else "y") + name[4:]
+    assert graph.person_ids[person] in {c.person_id for c in index.search(typo, 5)}
+    assert index.search("   ") == []
+
+
+def test_fuzzy_matches_brute_force(graph):
+    index = nameindex.NameIndex(graph)
+    rng = random.Random(12)
+    names = [name.lower() for name in graph.person_names]
+    for _ in range(20):
+        name = names[rng.randrange(len(names))]
+        i = rng.randrange(len(name))
+        query = name[:i] + rng.choice("aeiouxyz") + name[i + 1 :]
+        wanted = nameindex.trigrams(query)
+        needed = max(1, int(len(wanted) * nameindex.MIN_SIMILARITY + 0.5))
+        expected = []
+        for person, other in enumerate(names):
+            grams = nameindex.trigrams(other)
+            if len(wanted & grams) >= needed:
+                expected.append((len(wanted & grams) / len(wanted | grams), person))
+        expected.sort(reverse=True)
+        found = index._fuzzy_matches(query, 5)
+        assert found == [(person, score) for score, person in expected[:5]]
+
+
+def test_resolve_names(graph):
+    index = nameindex.NameIndex(graph)
+    names = [name.lower() for name in graph.person_names]
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    unique = next(p for p, name in enumerate(names) if counts[name] == 1)
+    shared = next(name for name, count in counts.items() if count > 1)
+
+    person_id = graph.person_ids[unique]
+    assert index.resolve(person_id) == person_id
+    assert index.resolve(f"  {graph.person_names[unique].upper()} ") == person_id
+    with pytest.raises(LookupError, match="ambiguous"):
+        index.resolve(shared)
+    with pytest.raises(LookupError, match="did you mean"):
+        index.resolve(graph.person_names[unique] + "q")
+    with pytest.raises(LookupError, match="not found"):
+        index.resolve("zzzzqqqq")
+
+
+def test_instrumented_search_records_stats(graph, tmp_path):
+    queries = pairs(graph, 10, seed=13)
+    plain = [
+        degrees.shortest_path(graph.person_ids[s], graph.person_ids[t])
+        for s, t in queries
+    ]
+    path = tmp_path / "stats.jsonl"
+    recorder = instrument.enable(path)
+    try:
+        assert instrument.active is recorder
+        for (source, target), expected in zip(queries, plain):
+            found = degrees.shortest_path(
+                graph.person_ids[source], graph.person_ids[target]
+            )
+            assert found == expected
+            record = recorder.flush(source=source, target=target)
+            assert record["source"] == source
+            assert record["calls"] == {"search": 1}
+            if expected:
+                assert record["nodes_expanded"] > 0
+                assert record["neighbor_pairs"] >= record["nodes_expanded"]
+                assert record["frontier_peak"] >= 2
+    finally:
+        instrument.disable()
+    assert instrument.active is None
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [(r["source"], r["target"]) for r in records] == queries
+
+
+def test_costar_lists_match_casts(graph):
+    index = costars.CoStarIndex(graph)
+    for person in range(0, graph.person_count(), 7):
+        people, movies = index.of(person)
+        expected = {other for _, other in graph.neighbors(person)} - {person}
+        assert len(people) == len(expected) and set(people) == expected
+        for other, movie in zip(people, movies):
+            assert movie in graph.movies_of(person)
+            assert other in graph.stars_of(movie)
+        assert index.of(person) is index.of(person)
+
+
+def test_costar_lists_stay_under_byte_cap(graph):
+    people = sorted(
+        range(graph.person_count()), key=lambda p: -len(graph.movies_of(p))
+    )[:50]
+    cap = 16 * 2**10
+    index = costars.CoStarIndex(graph, cap)
+    for person in people:
+        index.of(person)
+        assert index.nbytes <= cap
+    footprint = index.footprint()
+    assert footprint["resets"] > 0 and footprint["builds"] == len(people)
+    assert footprint["bytes"] == index.nbytes
+
+    # A list larger than the cap is returned but not kept
+    tiny = costars.CoStarIndex(graph, 64)
+    assert len(tiny.of(people[0])[0]) > 0
+    assert tiny.entries == {} and tiny.nbytes == 0
+
+    kept = list(index.entries)
+    index.invalidate(graph, kept[:1])
+    assert kept[0] not in index.entries
+    assert index.nbytes < footprint["bytes"]
+
+
+def serve_requests(*requests):
+    """
+    Sends each raw request on its own connection to a QueryServer that
+    searches on a thread pool, and returns the (status, JSON body) of
+    every response.
+    """
+
+    async def exchange(port, request):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def main():
+        with ThreadPoolExecutor(2) as executor:
+            handler = server.QueryServer(executor).handle
+            listener = await asyncio.start_server(handler, "127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                return [await exchange(port, request) for request in requests]
+
+    return asyncio.run(main())
+
+
+def get(target, headers=""):
+    return f"GET {target} HTTP/1.1\r\nConnection: close\r\n{headers}\r\n".encode()
+
+
+def test_server_routes(graph, monkeypatch):
+    first, second = far_pair(graph)
+    source, target = graph.person_ids[first], graph.person_ids[second]
+    name = graph.person_names[first]
+    responses = serve_requests(
+        get(f"/path?source={source}&target={target}"),
+        get(f"/path?source={source}&target={target}&first_year=1&last_year=1"),
+        get(f"/person?name={name[:-1].replace(' ', '+')}&limit=3"),
+        get("/path?source=nobody&target=nobody"),
+        get("/path?source=x"),
+        get("/nowhere"),
+        get("/stats"),
+    )
+    (status, found), (_, blocked), (_, person), *errors, (_, stats) = responses
+    assert status == 200
+    assert found["degrees"] == distances(graph, first)[second]
+    assert found["path"][-1]["person_id"] == target
+    assert blocked["degrees"] is None and blocked["path"] is None
+    assert person["candidates"] and len(person["candidates"]) <= 3
+    assert [status for status, _ in errors] == [404, 400, 404]
+    assert stats["routes"]["/path"]["requests"] == 4
+
+    monkeypatch.setattr(batch, "budget", (None, 1))
+    ((status, body),) = serve_requests(get(f"/path?source={source}&target={target}"))
+    assert status == 503 and body["progress"]["expansions"] == 1
+
+
+def test_server_rejects_bad_headers(graph):
+    headers = "".join(f"X-Header-{i}: {i}\r\n" for i in range(server.MAX_HEADERS + 1))
+    responses = serve_requests(
+        get("/stats", headers),
+        get("/stats", "Content-Length: -1\r\n"),
+        get("/stats", "Content-Length: many\r\n"),
+        get("/stats", f"X-Long: {'x' * server.MAX_REQUEST_LINE}\r\n"),
+    )
+    assert [status for status, _ in responses] == [431, 400, 400, 431]
+
+
+def test_apply_delta_matches_reload(dataset, tmp_path):
+    directory, delta = tmp_path / "data", tmp_path / "delta"
+    shutil.copytree(dataset, directory, ignore=shutil.ignore_patterns("degrees.*"))
+    os.makedirs(delta)
+    graph, _ = load_csv(directory)
+    rng = random.Random(4)
+    people, movies = graph.person_count(), graph.movie_count()
+
+    def known_person():
+        return graph.person_ids[rng.randrange(people)]
+
+    def write(name, header, rows):
+        with open(delta / name, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    write(
+        "people.csv",
+        ["id", "name", "birth"],
+        [(f"new{i}", f"New Person {i}", 1990) for i in range(20)]
+        + [(known_person(), f"Renamed {i}", "") for i in range(5)],
+    )
+    write(
+        "movies.csv",
+        ["id", "title", "year"],
+        [(f"m{i}", f"New Movie {i}", 2025) for i in range(5)]
+        + [(graph.movie_ids[rng.randrange(movies)], "Retitled", 1960)],
+    )
+    write(
+        "stars.csv",
+        ["person_id", "movie_id"],
+        [(f"new{i}", f"m{i % 5}") for i in range(20)]
+        + [(known_person(), f"m{rng.randrange(5)}") for _ in range(15)]
+        + [(known_person(), graph.movie_ids[rng.randrange(movies)]) for _ in range(15)]
+        + [("unknown", "m0")],
+    )
+
+    updated, report = update.apply_delta(graph, delta)
+    assert (report.people_added, report.people_changed) == (20, 5)
+    assert (report.movies_added, report.movies_changed) == (5, 1)
+    assert report.dangling_stars == 1
+
+    update.append_rows(directory, delta)
+    reloaded, _ = load_csv(directory)
+    # Orders only need to be sorted by their keys, and component labels
+    # only need to group the same people
+    sorted_by = {
+        "name_order": lambda graph, person: graph.person_names[person].lower(),
+        "year_order": lambda graph, movie: graph.movie_years[movie],
+    }
+    for field in graph.FIELDS:
+        if field in ("person_components", "component_sizes"):
+            continue
+        ours, theirs = getattr(updated, field), getattr(reloaded, field)
+        if field in sorted_by:
+            key = sorted_by[field]
+            assert sorted(ours) == sorted(theirs), field
+            ours = [key(updated, i) for i in ours]
+            theirs = [key(reloaded, i) for i in theirs]
+        assert list(ours) == list(theirs), field
+    for source, target in pairs(updated, 20, seed=5):
+        assert updated.connected(source, target) == reloaded.connected(source, target)
+
+
+def test_apply_delta_rejects_sqlite(dataset, tmp_path):
+    degrees.load_data(dataset, sqlite=True)
+    try:
+        with pytest.raises(TypeError):
+            update.apply_delta(degrees.graph, tmp_path)
+    finally:
+        degrees.load_data(dataset)
+
+
+@pytest.mark.parametrize("sqlite", [False, True])
+def test_constrained_path_matches_bfs(dataset, sqlite):
+    degrees.load_data(dataset, sqlite=sqlite)
+    graph = degrees.graph
+    rng = random.Random(2)
+    try:
+        for source, target in pairs(graph, PAIRS // 2, seed=3):
+            blocked = {rng.randrange(graph.person_count()) for _ in range(20)}
+            blocked -= {source, target}
+            excluded = [graph.movie_ids[rng.randrange(graph.movie_count())]]
+            constraints = Constraints(
+                1950,
+                2000,
+                excluded,
+                [graph.person_ids[person] for person in blocked],
+            )
+            allowed = constraints.allowed_movies(graph)
+            expected = distances(graph, source, allowed, blocked).get(target)
+            path = degrees.shortest_path(
+                graph.person_ids[source],
+                graph.person_ids[target],
+                constraints=constraints,
+            )
+            check_path(graph, source, target, path, expected, allowed, blocked)
+    finally:
+        degrees.load_data(dataset)
+
+
+def test_anytime_matches_bfs(graph):
+    rng = random.Random(9)
+    for source, target in pairs(graph, PAIRS // 2, seed=10):
+        blocked = {rng.randrange(graph.person_count()) for _ in range(20)}
+        blocked -= {source, target}
+        constraints = Constraints(
+            1950, 2000, (), [graph.person_ids[person] for person in blocked]
+        )
+        allowed = constraints.allowed_movies(graph)
+        for given, expected in (
+            (None, distances(graph, source).get(target)),
+            (constraints, distances(graph, source, allowed, blocked).get(target)),
+        ):
+            outcome = anytime.run(
+                graph.person_ids[source], graph.person_ids[target], constraints=given
+            )
+            if expected is None:
+                assert outcome.status == anytime.NOT_CONNECTED
+            else:
+                assert outcome.status == anytime.FOUND
+            if given is None:
+                check_path(graph, source, target, outcome.path, expected)
+            else:
+                check_path(
+                    graph, source, target, outcome.path, expected, allowed, blocked
+                )
+
+
+def test_anytime_budget_and_cancel(graph):
+    first, second = far_pair(graph)
+    source, target = graph.person_ids[first], graph.person_ids[second]
+
+    outcome = anytime.run(source, target, max_expansions=1)
+    assert outcome.status == anytime.BUDGET_EXCEEDED
+    assert outcome.path is None and outcome.progress.expansions == 1
+
+    outcome = anytime.run(source, target, timeout=0)
+    assert outcome.status == anytime.BUDGET_EXCEEDED
+    assert outcome.progress.expansions == 0
+
+    cancel = threading.Event()
+    search = anytime.search(source, target, cancel=cancel, report_every=1)
+    progress = next(search)
+    assert progress.expansions == 1
+    cancel.set()
+    outcome = next(search)
+    assert outcome.status == anytime.CANCELLED
+    assert outcome.progress.expansions == 1
+
+    components = graph.person_components
+    lonely = next(
+        p for p in range(graph.person_count()) if components[p] != components[first]
+    )
+    outcome = anytime.run(source, graph.person_ids[lonely])
+    assert outcome.status == anytime.NOT_CONNECTED
+    assert outcome.progress.expansions == 0
+
+
+def test_batch_budget_covers_constrained_queries(graph, monkeypatch):
+    source, target = (graph.person_ids[i] for i in far_pair(graph))
+    monkeypatch.setattr(batch, "budget", (None, 1))
+    result = batch.answer((source, target), Constraints(1900, 2100))
+    assert result["status"] == anytime.BUDGET_EXCEEDED
+    assert result["progress"]["expansions"] == 1 and result["path"] is None
+
+
+def test_analytics_distances_match_bfs(graph):
+    incidence = analytics.Incidence(graph)
+    for source, _ in pairs(graph, 5, seed=7):
+        expected = distances(graph, source)
+        found = incidence.distances(source).tolist()
+        assert {p: d for p, d in enumerate(found) if d >= 0} == expected
+        assert found.count(analytics.UNREACHABLE) == len(found) - len(expected)
+
+
+def test_analytics_degree_statistics(graph, tmp_path):
+    movies = analytics.movies_per_person(graph).tolist()
+    casts = analytics.cast_sizes(graph).tolist()
+    assert movies == [len(graph.movies_of(p)) for p in range(graph.person_count())]
+    assert casts == [len(graph.stars_of(m)) for m in range(graph.movie_count())]
+    summary = analytics.summarize(analytics.cast_sizes(graph))
+    assert summary["count"] == len(casts) and summary["max"] == max(casts)
+    assert summary["median"] <= summary["p90"] <= summary["p99"] <= summary["max"]
+
+    path = tmp_path / "movies_per_person.csv"
+    analytics.write_histogram(path, analytics.movies_per_person(graph), "movies")
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["movies", "count"]
+    assert {int(v): int(c) for v, c in rows[1:]} == {
+        v: movies.count(v) for v in set(movies)
+    }
+
+    incidence = analytics.Incidence(graph)
+    rng = np.random.default_rng(0)
+    people, eccentricity = analytics.eccentricities(graph, incidence, 3, rng)
+    for person, value in zip(people.tolist(), eccentricity.tolist()):
+        assert value == max(distances(graph, person).values())
+
+
+@pytest.fixture
+def tiny(tmp_path):
+    """
+    Loads a graph of 10 people in 9 movies of two or three, sparse enough
+    to list every simple path.
+    """
+    rng = random.Random(3)
+    with open(tmp_path / "people.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        writer.writerows((i, f"Person {i}", "") for i in range(10))
+    with open(tmp_path / "movies.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "year"])
+        writer.writerows((100 + i, f"Movie {i}", 2000) for i in range(9))
+    with open(tmp_path / "stars.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["person_id", "movie_id"])
+        for movie in range(9):
+            for person in rng.sample(range(10), rng.randint(2, 3)):
+                writer.writerow([person, 100 + movie])
+    degrees.load_data(str(tmp_path), use_snapshot=False)
+    return degrees.graph
+
+
+def simple_paths(graph, source, target):
+    """
+    Returns every simple path between two person indices as a tuple of
+    (movie index, person index) pairs.
+    """
+    found = []
+
+    def extend(person, path, seen):
+        if person == target:
+            found.append(tuple(path))
+            return
+        for movie, neighbor in graph.neighbors(person):
+            if neighbor not in seen:
+                seen.add(neighbor)
+                path.append((movie, neighbor))
+                extend(neighbor, path, seen)
+                path.pop()
+                seen.remove(neighbor)
+
+    extend(source, [], {source})
+    return found
+
+
+def test_k_shortest_paths_matches_brute_force(tiny):
+    graph = tiny
+    for source, target in pairs(graph, 20, seed=6):
+        if source == target:
+            continue
+        expected = simple_paths(graph, source, target)
+        found = list(
+            paths.k_shortest_paths(graph.person_ids[source], graph.person_ids[target])
+        )
+        assert [len(path) for path in found] == sorted(map(len, expected))
+        ids = {tuple(graph.path_ids(list(path))) for path in expected}
+        assert {tuple(path) for path in found} == ids
+
+        k = min(5, len(expected))
+        first = paths.k_shortest_paths(
+            graph.person_ids[source], graph.person_ids[target], k
+        )
+        assert [len(path) for path in first] == sorted(map(len, expected))[:k]
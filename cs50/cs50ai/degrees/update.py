@@ -0,0 +1,411 @@
+"""
+Incremental updates to a loaded degrees graph.
+
+Usage: python update.py DIRECTORY DELTA
+
+DELTA is a directory holding any of people.csv, movies.csv and
+stars.csv with only new or changed rows, in the same format as the full
+export. A row for a known person or movie replaces their name or title
+and year. Star rows add credits, and may refer to people and movies from
+either the graph or the delta.
+
+Existing people and movies keep their indices, so the update only
+merges the rows of the CSR arrays that gained credits, inserts new keys
+into the sorted orders, and relabels the components that were joined.
+Everything keyed by person index that the delta did not reach stays
+valid: `UpdateReport.affected` and `UpdateReport.components` say which
+cached co-star lists, BFS trees and landmarks to drop.
+
+From the command line, the delta rows are appended to the CSV files in
+DIRECTORY, and its snapshot, name index and landmarks are rewritten to
+match them without reparsing the full export.
+"""
+
+import csv
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+import landmarks
+import snapshot
+from components import merge_components
+from graph import Graph, StringTable
+from ingest import IngestReport, read_entities, read_stars
+from nameindex import NameIndex, names_path
+
+
+@dataclass
+class UpdateReport:
+    """Row counts from one delta, and the state it invalidated."""
+
+    people_added: int = 0
+    people_changed: int = 0
+    movies_added: int = 0
+    movies_changed: int = 0
+    stars: int = 0
+    stars_added: int = 0
+    dangling_stars: int = 0
+
+    # Person indices whose co-stars changed, people with new or changed
+    # names, and the labels of every component that gained people or edges
+    affected: set = field(default_factory=set, repr=False)
+    named: set = field(default_factory=set, repr=False)
+    components: set = field(default_factory=set, repr=False)
+
+    def as_dict(self):
+        return {
+            "people_added": self.people_added,
+            "people_changed": self.people_changed,
+            "movies_added": self.movies_added,
+            "movies_changed": self.movies_changed,
+            "stars": self.stars,
+            "stars_added": self.stars_added,
+            "dangling_stars": self.dangling_stars,
+            "affected_people": len(self.affected),
+            "changed_components": len(self.components),
+        }
+
+
+class _Lookup:
+    """
+    Resolves an ID to its index in the graph, falling back to the IDs a
+    delta adds; the `get` half of a dict for `read_stars`.
+    """
+
+    def __init__(self, index, added):
+        self.index = index
+        self.added = added
+
+    def get(self, key):
+        try:
+            return self.index(key)
+        except KeyError:
+            return self.added.get(key)
+
+
+def apply_delta(graph, directory):
+    """
+    Returns a (Graph, UpdateReport) pair for `graph` with the delta CSV
+    files in `directory` applied. `graph` itself is left unchanged.
+
+    Only an in-memory Graph can be updated. A SQLiteGraph has no CSR
+    arrays to merge into and raises TypeError; its database is rebuilt
+    from the CSV files once the delta rows are appended to them.
+    """
+    if graph.person_offsets is None:
+        raise TypeError(
+            "cannot apply a delta to a SQLite graph; append the rows to the"
+            " CSV files and reopen it to rebuild the database"
+        )
+    report = UpdateReport()
+    people = _read_optional(f"{directory}/people.csv", ("id", "name", "birth"))
+    movies = _read_optional(f"{directory}/movies.csv", ("id", "title", "year"))
+
+    person_count, movie_count = graph.person_count(), graph.movie_count()
+    new_people, renamed = _split(graph.person_index, people, person_count)
+    new_movies, retitled = _split(graph.movie_index, movies, movie_count)
+    report.people_added, report.people_changed = len(new_people), len(renamed)
+    report.movies_added, report.movies_changed = len(new_movies), len(retitled)
+
+    stars = IngestReport()
+    star_people, star_movies = array("i"), array("i")
+    if os.path.exists(f"{directory}/stars.csv"):
+        star_people, star_movies = read_stars(
+            f"{directory}/stars.csv",
+            _Lookup(graph.person_index, new_people),
+            _Lookup(graph.movie_index, new_movies),
+            stars,
+        )
+    report.stars, report.dangling_stars = stars.stars, stars.dangling_stars
+
+    # Indices only grow, so new rows go at the end of every per-entity field
+    person_count += len(new_people)
+    movie_count += len(new_movies)
+    person_ids = _extend(graph.person_ids, new_people)
+    movie_ids = _extend(graph.movie_ids, new_movies)
+    person_names = _relabel(graph.person_names, people, new_people, renamed)
+    movie_titles = _relabel(graph.movie_titles, movies, new_movies, retitled)
+    person_births = _reyear(graph.person_births, people, new_people, renamed)
+    movie_years = _reyear(graph.movie_years, movies, new_movies, retitled)
+
+    person_offsets, person_movies, added = _merge_csr(
+        graph.person_offsets,
+        graph.person_movies,
+        person_count,
+        star_people,
+        star_movies,
+    )
+    movie_offsets, movie_people, _ = _merge_csr(
+        graph.movie_offsets, graph.movie_people, movie_count, star_movies, star_people
+    )
+    report.stars_added = added
+
+    person_order = _insert_sorted(
+        graph.person_order, person_ids.__getitem__, new_people.values()
+    )
+    movie_order = _insert_sorted(
+        graph.movie_order, movie_ids.__getitem__, new_movies.values()
+    )
+    year_order = graph.year_order
+    if retitled:
+        year_order = array("i", (m for m in year_order if m not in retitled))
+    year_order = _insert_sorted(
+        year_order, movie_years.__getitem__, set(retitled) | set(new_movies.values())
+    )
+    lowered = lambda person: person_names[person].lower()  # noqa: E731
+    name_order = graph.name_order
+    if renamed:
+        name_order = array("i", (p for p in name_order if p not in renamed))
+    report.named = set(renamed) | set(new_people.values())
+    name_order = _insert_sorted(name_order, lowered, report.named)
+
+    casts = []
+    for movie in sorted(set(star_movies)):
+        cast = movie_people[movie_offsets[movie] : movie_offsets[movie + 1]]
+        report.affected.update(cast)
+        casts.append(cast)
+    person_components, component_sizes, report.components = merge_components(
+        graph.person_components, graph.component_sizes, person_count, casts
+    )
+
+    updated = Graph(
+        person_ids,
+        person_names,
+        person_births,
+        movie_ids,
+        movie_titles,
+        movie_years,
+        person_offsets,
+        person_movies,
+        movie_offsets,
+        movie_people,
+        person_order,
+        movie_order,
+        name_order,
+        year_order,
+        person_components,
+        component_sizes,
+    )
+    return updated, report
+
+
+def append_rows(directory, delta):
+    """
+    Appends the rows of each CSV file in `delta` to the file of the same
+    name in `directory`, in that file's column order.
+    """
+    for name in snapshot.SOURCES:
+        source = os.path.join(delta, name)
+        if not os.path.exists(source):
+            continue
+        target = os.path.join(directory, name)
+        with open(target, encoding="utf-8", newline="") as f:
+            header = next(csv.reader(f), [])
+        newline = not _ends_with_newline(target)
+        with open(source, encoding="utf-8", newline="") as rows, open(
+            target, "a", encoding="utf-8", newline=""
+        ) as f:
+            if newline:
+                f.write("\r\n")
+            writer = csv.DictWriter(f, header, restval="", extrasaction="ignore")
+            writer.writerows(csv.DictReader(rows))
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _read_optional(path, columns):
+    """
+    Returns (ids, labels, years) from an entity CSV, or empty lists if
+    the delta has no such file.
+    """
+    if not os.path.exists(path):
+        return [], [], array("H")
+    ids, labels, years, _ = read_entities(path, columns)
+    return ids, labels, years
+
+
+def _split(index, rows, count):
+    """
+    Returns ({new ID: index}, {existing index: delta row}) for the IDs in
+    `rows`, numbering new IDs from `count`.
+    """
+    added, changed = {}, {}
+    for row, id_ in enumerate(rows[0]):
+        try:
+            changed[index(id_)] = row
+        except KeyError:
+            added[id_] = count + len(added)
+    return added, changed
+
+
+def _extend(table, strings):
+    """
+    Returns a StringTable with `strings` appended to `table`.
+    """
+    if not strings:
+        return table
+    tail = StringTable.from_strings(strings)
+    offsets = _copy("q", table.offsets)
+    end = offsets[-1]
+    offsets.extend(end + offset for offset in tail.offsets[1:])
+    return StringTable(bytes(table.data) + tail.data, offsets)
+
+
+def _relabel(table, rows, added, changed):
+    """
+    Returns `table` with the labels of changed rows replaced and those of
+    added rows appended.
+    """
+    ids, labels, _ = rows
+    if changed:
+        replaced = list(table)
+        for index, row in changed.items():
+            replaced[index] = labels[row]
+        table = StringTable.from_strings(replaced)
+    positions = {id_: row for row, id_ in enumerate(ids)}
+    return _extend(table, [labels[positions[id_]] for id_ in added])
+
+
+def _reyear(years, rows, added, changed):
+    ids, _, delta_years = rows
+    if not (added or changed):
+        return years
+    years = _copy("H", years)
+    for index, row in changed.items():
+        years[index] = delta_years[row]
+    positions = {id_: row for row, id_ in enumerate(ids)}
+    years.extend(delta_years[positions[id_]] for id_ in added)
+    return years
+
+
+def _copy(typecode, values):
+    copy = array(typecode)
+    copy.frombytes(_raw(values, 0, len(values)))
+    return copy
+
+
+def _raw(values, start, end):
+    """
+    Returns the bytes of `values[start:end]` without copying, for arrays
+    and memory-mapped sections alike.
+    """
+    return memoryview(values)[start:end].cast("B")
+
+
+def _merge_csr(offsets, indices, count, sources, targets):
+    """
+    Returns (offsets, indices, added) for the CSR arrays with the
+    `sources`/`targets` edges merged in, grown to `count` rows. Rows no
+    edge touches are copied in bulk; `added` counts the edges that were
+    not already present.
+    """
+    rows = {}
+    for source, target in zip(sources, targets):
+        rows.setdefault(source, set()).add(target)
+
+    old_count = len(offsets) - 1
+    new_offsets, new_indices = array("i", [0]), array("i")
+    added = 0
+    # Rows before `copied` are already in the output
+    copied = 0
+    for row in sorted(rows) + [count]:
+        end = min(row, old_count)
+        if copied < end:
+            shift = len(new_indices) - offsets[copied]
+            new_indices.frombytes(_raw(indices, offsets[copied], offsets[end]))
+            new_offsets.extend(o + shift for o in offsets[copied + 1 : end + 1])
+            copied = end
+        # New rows without edges
+        while copied < row:
+            new_offsets.append(len(new_indices))
+            copied += 1
+        if row == count:
+            break
+
+        existing = indices[offsets[row] : offsets[row + 1]] if row < old_count else ()
+        merged = sorted(set(existing) | rows[row])
+        added += len(merged) - len(existing)
+        new_indices.extend(merged)
+        new_offsets.append(len(new_indices))
+        copied = row + 1
+    return new_offsets, new_indices, added
+
+
+def _insert_sorted(order, key, items):
+    """
+    Returns `order`, a permutation sorted by `key`, with `items` inserted
+    in place. Each item is placed by bisection and the runs between them
+    are copied in bulk, so the cost is one pass over `order` rather than
+    a re-sort.
+    """
+    if not items:
+        return order
+    keyed = [(key(item), item) for item in items]
+    positions = sorted(
+        (bisect_right(range(len(order)), k, key=lambda i: key(order[i])), k, item)
+        for k, item in keyed
+    )
+    merged = array("i")
+    previous = 0
+    for position, _, item in positions:
+        merged.frombytes(_raw(order, previous, position))
+        merged.append(item)
+        previous = position
+    merged.frombytes(_raw(order, previous, len(order)))
+    return merged
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python update.py DIRECTORY DELTA")
+    directory, delta = sys.argv[1:]
+
+    # Everything derived from the current CSV files has to be read before
+    # the delta is appended to them
+    graph, load_report = snapshot.load(directory)
+    names = None
+    if os.path.exists(names_path(directory)):
+        names = NameIndex(graph, directory)
+        try:
+            names.load_grams()
+        except snapshot.SnapshotError:
+            names = None
+    try:
+        index = landmarks.LandmarkIndex.load(directory)
+    except snapshot.SnapshotError:
+        index = None
+
+    graph, report = apply_delta(graph, delta)
+    append_rows(directory, delta)
+    load_report = IngestReport(
+        people=load_report.people + report.people_added,
+        movies=load_report.movies + report.movies_added,
+        stars=load_report.stars + report.stars,
+        dangling_stars=load_report.dangling_stars + report.dangling_stars,
+    )
+    snapshot.write(graph, directory, load_report)
+
+    if names is not None:
+        names.extend(graph, report.named)
+        names.save_grams()
+    if index is not None:
+        index = index.updated(graph, report.components)
+        if index is not None:
+            index.save(directory)
+        else:
+            print("Every landmark changed; rebuild them with landmarks.py.")
+
+    for key, value in report.as_dict().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
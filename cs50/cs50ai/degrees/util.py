@@ -1,4 +1,9 @@
+from collections import deque
+
+
 class Node:
+    __slots__ = ("state", "parent", "action")
+
     def __init__(self, state, parent, action):
         self.state = state
         self.parent = parent
@@ -7,28 +12,50 @@ class Node:
 
 class StackFrontier:
     def __init__(self):
-        self.frontier = []
+        self.frontier = deque()
         self.explored = []
+        # Counts of each state currently in the frontier, and the set of
+        # states already removed, so membership checks are O(1)
+        self.frontier_states = {}
+        self.explored_states = set()
 
     def add(self, node):
         self.frontier.append(node)
+        state = node.state
+        self.frontier_states[state] = self.frontier_states.get(state, 0) + 1
 
     def contains_state(self, state):
-        return any(node.state == state for node in self.frontier)
+        return state in self.frontier_states
 
     def empty(self):
         return len(self.frontier) == 0
 
+    def __len__(self):
+        return len(self.frontier)
+
     def remove(self):
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[-1]
-            self.frontier = self.frontier[:-1]
+            node = self.frontier.pop()
+            self._discard_state(node.state)
             return node
 
     def is_explored(self, state):
-        return any(node.state == state for node in self.explored)
+        return state in self.explored_states
+
+    def mark_explored(self, node):
+        self.explored.append(node)
+        self.explored_states.add(node.state)
+
+    def _discard_state(self, state):
+        # The same state may be pushed more than once; only forget it
+        # when no other copy is left in the frontier.
+        count = self.frontier_states[state] - 1
+        if count:
+            self.frontier_states[state] = count
+        else:
+            del self.frontier_states[state]
 
 
 class QueueFrontier(StackFrontier):
@@ -36,7 +63,7 @@ class QueueFrontier(StackFrontier):
         if self.empty():
             raise Exception("empty frontier")
         else:
-            node = self.frontier[0]
-            self.explored.append(node)
-            self.frontier = self.frontier[1:]
+            node = self.frontier.popleft()
+            self.mark_explored(node)
+            self._discard_state(node.state)
             return node
@@ -18,6 +18,12 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import WebDriverException, NoSuchElementException
 
+from driver_pool import DriverPool
+from http_backend import BackendError, HttpBackend
+from usage_collector import collect_usage, worker_count
+from burn_rate import SAFETY_MARGIN, BurnRateScheduler
+from rotation_planner import plan_rotation
+
 # Set up logging configuration
 logging.basicConfig(
     level=logging.INFO,
@@ -65,8 +71,14 @@ class RouterManager:
         """Initialize RouterManager with configuration."""
         self.config_path = config_path
         self.current_index = 0
+        self.switch_failures = 0
         self._load_config()
         self._setup_driver_config()
+        self.router_pool = DriverPool(self.get_driver, "router")
+        self.portal_pool = DriverPool(
+            self.get_driver, "portal", size=worker_count(self.users)
+        )
+        self.burn_rate = BurnRateScheduler(self.threshold_usage, self.safety_margin)
 
     def _load_config(self) -> None:
         """Load and validate configuration from .env file."""
@@ -83,7 +95,10 @@ class RouterManager:
             self.email_user = os.getenv("EMAIL_USER")
             self.email_pass = os.getenv("EMAIL_PASS")
             self.threshold_usage = int(os.getenv("THRESHOLD_USAGE", "11600"))
+            self.safety_margin = int(os.getenv("SAFETY_MARGIN", str(SAFETY_MARGIN)))
             self.email_recipients = os.getenv("EMAIL_RECIPIENTS", "").split(",")
+            # BACKEND=http tries plain HTTP requests before Selenium
+            self.http = HttpBackend() if os.getenv("BACKEND") == "http" else None
 
             # Validate required fields
             if not all([self.email_user, self.email_pass, self.router_pass]):
@@ -99,7 +114,7 @@ class RouterManager:
     def _setup_driver_config(self) -> None:
         """Set up Firefox driver configuration."""
         self.options = Options()
-        # self.options.add_argument("--headless")
+        self.options.add_argument("--headless")
         # self.options.add_argument("--no-sandbox")
         # self.options.add_argument("--disable-dev-shm-usage")
         self.options.add_argument("--width=1920")
@@ -118,130 +133,151 @@ class RouterManager:
     @retry_on_exception(retries=3, delay=5)
     def fetch_current_user(self) -> Optional[UserConfig]:
         """Fetch current router user configuration."""
-        driver = self.get_driver()
-        try:
-            driver.get("http://192.168.0.1")
-            wait = WebDriverWait(driver, 10)
+        if self.http is not None:
+            try:
+                current_username = self.http.fetch_username(self.router_pass)
+                for user in self.users:
+                    if user.username == current_username:
+                        return user
+                logger.warning("No matching user found")
+                return None
+            except BackendError as e:
+                logger.warning(f"HTTP backend failed, using Selenium: {e}")
+        with self.router_pool.session() as driver:
+            try:
+                driver.get("http://192.168.0.1")
+                wait = WebDriverWait(driver, 10)
+
+                # Login to router
+                password_field = wait.until(
+                    EC.presence_of_element_located((By.ID, "pcPassword"))
+                )
+                password_field.send_keys(self.router_pass)
+                driver.find_element(By.ID, "loginBtn").click()
+
+                # Navigate to network settings
+                driver.switch_to.frame("frame1")
+                wait.until(EC.element_to_be_clickable((By.ID, "menu_network"))).click()
+                driver.switch_to.default_content()
+                driver.switch_to.frame("frame2")
+
+                # Get current username
+                username_field = wait.until(
+                    EC.presence_of_element_located((By.ID, "username"))
+                )
+                current_username = username_field.get_attribute("value")
 
-            # Login to router
-            password_field = wait.until(
-                EC.presence_of_element_located((By.ID, "pcPassword"))
-            )
-            password_field.send_keys(self.router_pass)
-            driver.find_element(By.ID, "loginBtn").click()
-
-            # Navigate to network settings
-            driver.switch_to.frame("frame1")
-            wait.until(EC.element_to_be_clickable((By.ID, "menu_network"))).click()
-            driver.switch_to.default_content()
-            driver.switch_to.frame("frame2")
-
-            # Get current username
-            username_field = wait.until(
-                EC.presence_of_element_located((By.ID, "username"))
-            )
-            current_username = username_field.get_attribute("value")
+                # Find matching user
+                for user in self.users:
+                    if user.username == current_username:
+                        return user
 
-            # Find matching user
-            for user in self.users:
-                if user.username == current_username:
-                    return user
+                logger.warning("No matching user found")
+                return None
 
-            logger.warning("No matching user found")
-            return None
-
-        except Exception as e:
-            logger.error(f"Error in fetch_current_user: {e}")
-            self.send_email("Router Manager Error", f"Error fetching current user: {e}")
-            raise
-        finally:
-            driver.quit()
+            except Exception as e:
+                logger.error(f"Error in fetch_current_user: {e}")
+                self.send_email(
+                    "Router Manager Error", f"Error fetching current user: {e}"
+                )
+                raise
 
     @retry_on_exception(retries=3, delay=5)
     def change_user(self, user: UserConfig) -> bool:
         """Change router user to specified user."""
-        driver = self.get_driver()
-        try:
-            driver.get("http://192.168.0.1")
-            wait = WebDriverWait(driver, 10)
-
-            # Login to router
-            password_field = wait.until(
-                EC.presence_of_element_located((By.ID, "pcPassword"))
-            )
-            password_field.send_keys(self.router_pass)
-            driver.find_element(By.ID, "loginBtn").click()
-
-            # Navigate to network settings
-            driver.switch_to.frame("frame1")
-            wait.until(EC.element_to_be_clickable((By.ID, "menu_network"))).click()
-            driver.switch_to.default_content()
-            driver.switch_to.frame("frame2")
-
-            # Update user credentials
-            username_field = wait.until(
-                EC.presence_of_element_located((By.ID, "username"))
-            )
-            password_field = driver.find_element(By.ID, "pwd")
-            confirm_field = driver.find_element(By.ID, "pwd2")
-
-            # Clear and set new values
-            for field in [username_field, password_field, confirm_field]:
-                driver.execute_script("arguments[0].value = '';", field)
-
-            username_field.send_keys(user.username)
-            password_field.send_keys(user.password)
-            confirm_field.send_keys(user.password)
-
-            # Save changes
-            driver.find_element(By.ID, "saveBtn").click()
-            logger.info(f"Successfully changed user to {user.name}")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error in change_user: {e}")
-            self.send_email(
-                "Router Manager Error", f"Error changing user to {user.name}: {e}"
-            )
-            raise
-        finally:
-            driver.quit()
+        if self.http is not None:
+            try:
+                self.http.change_user(self.router_pass, user.username, user.password)
+                logger.info(f"Successfully changed user to {user.name}")
+                return True
+            except BackendError as e:
+                logger.warning(f"HTTP backend failed, using Selenium: {e}")
+        with self.router_pool.session() as driver:
+            try:
+                driver.get("http://192.168.0.1")
+                wait = WebDriverWait(driver, 10)
+
+                # Login to router
+                password_field = wait.until(
+                    EC.presence_of_element_located((By.ID, "pcPassword"))
+                )
+                password_field.send_keys(self.router_pass)
+                driver.find_element(By.ID, "loginBtn").click()
+
+                # Navigate to network settings
+                driver.switch_to.frame("frame1")
+                wait.until(EC.element_to_be_clickable((By.ID, "menu_network"))).click()
+                driver.switch_to.default_content()
+                driver.switch_to.frame("frame2")
+
+                # Update user credentials
+                username_field = wait.until(
+                    EC.presence_of_element_located((By.ID, "username"))
+                )
+                password_field = driver.find_element(By.ID, "pwd")
+                confirm_field = driver.find_element(By.ID, "pwd2")
+
+                # Clear and set new values
+                for field in [username_field, password_field, confirm_field]:
+                    driver.execute_script("arguments[0].value = '';", field)
+
+                username_field.send_keys(user.username)
+                password_field.send_keys(user.password)
+                confirm_field.send_keys(user.password)
+
+                # Save changes
+                driver.find_element(By.ID, "saveBtn").click()
+                logger.info(f"Successfully changed user to {user.name}")
+                return True
+
+            except Exception as e:
+                logger.error(f"Error in change_user: {e}")
+                self.send_email(
+                    "Router Manager Error", f"Error changing user to {user.name}: {e}"
+                )
+                raise
 
     @retry_on_exception(retries=3, delay=5)
     def check_status(self, user: UserConfig) -> Optional[int]:
         """Check usage status for specified user."""
-        driver = self.get_driver()
-        try:
-            driver.get("http://10.220.20.12/index.php/home/login")
-            wait = WebDriverWait(driver, 10)
-
-            # Login
-            username_field = wait.until(
-                EC.presence_of_element_located((By.ID, "username"))
-            )
-            username_field.send_keys(user.username)
-            driver.find_element(By.ID, "password").send_keys(user.password)
-            driver.find_element(By.XPATH, "//button[text()='Sign In']").click()
-
-            # Get usage
-            usage_element = wait.until(
-                EC.presence_of_element_located(
-                    (By.XPATH, "(//td[contains(normalize-space(text()), 'Minute')])[1]")
+        if self.http is not None:
+            try:
+                usage = self.http.usage(user.username, user.password)
+                logger.info(f"Usage for {user.name}: {usage} minutes")
+                return usage
+            except BackendError as e:
+                logger.warning(f"HTTP backend failed, using Selenium: {e}")
+        with self.portal_pool.session() as driver:
+            try:
+                driver.get("http://10.220.20.12/index.php/home/login")
+                wait = WebDriverWait(driver, 10)
+
+                # Login
+                username_field = wait.until(
+                    EC.presence_of_element_located((By.ID, "username"))
                 )
-            )
-            usage = int(usage_element.text.split(" ")[0])
+                username_field.send_keys(user.username)
+                driver.find_element(By.ID, "password").send_keys(user.password)
+                driver.find_element(By.XPATH, "//button[text()='Sign In']").click()
+
+                # Get usage
+                usage_element = wait.until(
+                    EC.presence_of_element_located(
+                        (
+                            By.XPATH,
+                            "(//td[contains(normalize-space(text()), 'Minute')])[1]",
+                        )
+                    )
+                )
+                usage = int(usage_element.text.split(" ")[0])
 
-            logger.info(f"Usage for {user.name}: {usage} minutes")
-            return usage
+                logger.info(f"Usage for {user.name}: {usage} minutes")
+                return usage
 
-        except Exception as e:
-            logger.error(f"Error in check_status: {e}")
-            self.send_email(
-                "Router Manager Error", f"Error checking status for {user.name}: {e}"
-            )
-            raise
-        finally:
-            driver.quit()
+            except Exception as e:
+                # collect_usage reports every failed check in one email
+                logger.error(f"Error in check_status: {e}")
+                raise
 
     def send_email(self, subject: str, body: str) -> None:
         """Send email notification."""
@@ -252,37 +288,107 @@ class RouterManager:
         except Exception as e:
             logger.error(f"Failed to send email: {e}")
 
+    def check(self) -> Optional[float]:
+        """
+        Check every account, switch if the plan says so, and return the
+        minutes until the next check, or None if the check could not run.
+        """
+        current_user = self.fetch_current_user()
+        if current_user is None:
+            logger.error("Unable to fetch the current user.")
+            return None
+
+        # Check all accounts at once, so the next one is chosen on fresh data
+        self.current_index = self.users.index(current_user)
+        snapshot = collect_usage(
+            self.users,
+            self.check_status,
+            worker_count(self.users, self.http is not None),
+        )
+        if snapshot.errors:
+            self.send_email(
+                "Router Manager Error",
+                snapshot.failure_report([user.name for user in self.users]),
+            )
+        usage = snapshot.usage[self.current_index]
+        if usage is None:
+            logger.error("Unable to fetch usage.")
+            return None
+
+        self.burn_rate.record(usage)
+        plan = plan_rotation(
+            snapshot.usage,
+            self.current_index,
+            self.threshold_usage,
+            self.burn_rate.rate(),
+            margin=self.burn_rate.margin,
+        )
+        logger.info(f"Rotation plan:\n{plan}")
+        next_index = plan.next_account(self.current_index, usage, self.burn_rate.margin)
+        if (
+            next_index is None
+            and plan.switch_usage(self.current_index) is None
+            and self.burn_rate.due(usage)
+        ):
+            # Nothing planned, so leave a nearly spent account for the
+            # one with the most quota left, if any has some
+            next_index = snapshot.least_used(
+                exclude=self.current_index,
+                below=self.threshold_usage - self.burn_rate.margin,
+            )
+
+        if next_index is None:
+            minutes = self.burn_rate.next_check(plan.switch_usage(self.current_index))
+        else:
+            try:
+                self.change_user(self.users[next_index])
+            except Exception as e:
+                self.switch_failures += 1
+                minutes = self.burn_rate.backoff(self.switch_failures)
+                logger.error(f"Switch failed, retrying in {minutes:.0f} min: {e}")
+            else:
+                self.current_index = next_index
+                self.switch_failures = 0
+                self.burn_rate.reset()
+                # Check the new account once the router has reconnected
+                minutes = self.burn_rate.min_interval
+        return minutes
+
     def run(self) -> None:
         """Main execution loop."""
         try:
             # Initial check
-            current_user = self.fetch_current_user()
-            if current_user is None:
-                logger.error("Unable to fetch the current user. Exiting.")
+            minutes = self.check()
+            if minutes is None:
+                logger.error("Initial check failed. Exiting.")
                 return
 
-            usage = self.check_status(current_user)
-            if usage is None:
-                logger.error("Unable to fetch usage. Exiting.")
-                return
-
-            if usage > self.threshold_usage:
-                self.current_index = (self.current_index + 1) % len(self.users)
-                self.change_user(self.users[self.current_index])
-            else:
-                remaining_minutes = self.threshold_usage - usage
-                logger.info(f"Scheduling next check in {remaining_minutes} minutes")
-
-                schedule.every(remaining_minutes).minutes.do(self.run)
-                try:
-                    while True:
+            # Each check returns its own delay. One job at a time is
+            # scheduled and replaced after it runs, all from this loop, so
+            # checks never nest; a check that could not run is retried
+            # after the previous delay
+            delays = []
+
+            def check():
+                delays.append(self.check())
+                return schedule.CancelJob
+
+            try:
+                while True:
+                    logger.info(f"Scheduling next check in {minutes:.0f} minutes")
+                    schedule.clear()
+                    schedule.every(minutes).minutes.do(check)
+                    while not delays:
                         schedule.run_pending()
                         time.sleep(1)
-                except KeyboardInterrupt:
-                    logger.info("Shutting down gracefully...")
-                except Exception as e:
-                    logger.error(f"Scheduler error: {e}")
-                    raise
+                    delay = delays.pop()
+                    if delay is not None:
+                        minutes = delay
+            except KeyboardInterrupt:
+                logger.info("Shutting down gracefully...")
+            except Exception as e:
+                logger.error(f"Scheduler error: {e}")
+                raise
 
         except Exception as e:
             logger.error(f"Error in main execution: {e}")
@@ -0,0 +1,108 @@
+"""
+Scheduling usage checks from the measured burn rate.
+
+Waiting `threshold - usage` minutes between checks assumes the account
+uses one minute of quota per wall-clock minute, which only holds when
+the line is busy all the time. BurnRateScheduler records usage samples,
+estimates the minutes of quota used per minute over a sliding window,
+and times the next check for when usage is projected to reach the
+threshold less a safety margin. Until two samples span some time it
+assumes the worst case of one minute per minute, as before. An idle line
+can turn busy at any moment, so a low rate never stretches the wait
+past the time a busy line takes to reach the threshold itself: at worst
+the safety margin is used up, never the threshold overrun.
+"""
+
+import time
+from collections import deque
+
+# All in minutes
+SAFETY_MARGIN = 60
+WINDOW = 6 * 60
+MIN_INTERVAL = 5
+MAX_INTERVAL = 12 * 60
+
+
+class BurnRateScheduler:
+    def __init__(
+        self,
+        threshold,
+        margin=SAFETY_MARGIN,
+        window=WINDOW,
+        min_interval=MIN_INTERVAL,
+        max_interval=MAX_INTERVAL,
+    ):
+        self.threshold = threshold
+        self.margin = margin
+        self.window = window
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.samples = deque()  # (time.time(), minutes used)
+
+    def record(self, usage, now=None):
+        """Add a usage sample of the account in use."""
+        now = time.time() if now is None else now
+        if self.samples and usage < self.samples[-1][1]:
+            # Another account, or a new month
+            self.reset()
+        self.samples.append((now, usage))
+        # Drop samples while the rest still span the whole window
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window * 60:
+            self.samples.popleft()
+
+    def reset(self):
+        """Forget the samples, as after switching accounts."""
+        self.samples.clear()
+
+    def rate(self):
+        """
+        Return the minutes of quota used per minute over the window, or
+        None before two samples span any time.
+        """
+        if len(self.samples) < 2:
+            return None
+        (first, first_usage), (last, last_usage) = self.samples[0], self.samples[-1]
+        if last <= first:
+            return None
+        rate = (last_usage - first_usage) / ((last - first) / 60)
+        # An account cannot use more than a minute per minute
+        return min(1.0, max(0.0, rate))
+
+    def next_check(self, limit=None):
+        """
+        Return the minutes to wait before the next check, aiming at
+        `limit`, the threshold by default, less the safety margin, and
+        never waiting longer than one minute per minute takes to reach
+        `limit` itself. Callers switch at the same target, see due().
+        """
+        if not self.samples:
+            return self.min_interval
+        limit = self.limit(limit)
+        usage = self.samples[-1][1]
+        remaining = limit - self.margin - usage
+        if remaining <= 0:
+            return self.min_interval
+        rate = self.rate()
+        if rate is None:
+            rate = 1.0
+        minutes = remaining / rate if rate > 0 else float("inf")
+        minutes = min(minutes, limit - usage)
+        return max(self.min_interval, min(self.max_interval, minutes))
+
+    def backoff(self, failures):
+        """
+        Return the minutes to wait after `failures` failed account
+        switches in a row, doubling from the minimum interval.
+        """
+        return min(self.max_interval, self.min_interval * 2 ** max(0, failures - 1))
+
+    def due(self, usage, limit=None):
+        """
+        Return whether `usage` has reached the target next_check aims
+        at, `limit` less the safety margin.
+        """
+        return usage + self.margin >= self.limit(limit)
+
+    def limit(self, limit=None):
+        """Return `limit`, capped at and defaulting to the threshold."""
+        return self.threshold if limit is None else min(limit, self.threshold)
@@ -17,6 +17,11 @@ import logging
 from dotenv import load_dotenv
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
+from driver_pool import DriverPool
+from http_backend import BackendError, HttpBackend
+from usage_collector import collect_usage, worker_count
+from burn_rate import SAFETY_MARGIN, BurnRateScheduler
+from rotation_planner import plan_rotation
 
 
 @dataclass
@@ -37,6 +42,12 @@ class InternetUsageMonitor:
         self.setup_logging()
         self.load_configuration()
         self.current_index = 0
+        self.switch_failures = 0
+        self.router_pool = DriverPool(self.get_driver, "router")
+        self.portal_pool = DriverPool(
+            self.get_driver, "portal", size=worker_count(self.users)
+        )
+        self.burn_rate = BurnRateScheduler(self.threshold_usage, self.safety_margin)
 
     def setup_logging(self):
         logging.basicConfig(
@@ -65,8 +76,11 @@ class InternetUsageMonitor:
             self.email_user = os.getenv("EMAIL_USER")
             self.email_password = os.getenv("EMAIL_PASS")
             self.threshold_usage = int(os.getenv("THRESHOLD_USAGE", "11600"))
+            self.safety_margin = int(os.getenv("SAFETY_MARGIN", str(SAFETY_MARGIN)))
             self.email_recipients = os.getenv("EMAIL_RECIPIENTS", "").split(",")
             self.driver_path = os.getenv("DRIVER_PATH", "/usr/local/bin/geckodriver")
+            # BACKEND=http tries plain HTTP requests before Selenium
+            self.http = HttpBackend() if os.getenv("BACKEND") == "http" else None
 
             if not all([self.email_user, self.email_password, self.email_recipients]):
                 raise ConfigurationError("Email configuration is incomplete")
@@ -96,89 +110,97 @@ class InternetUsageMonitor:
 
     def change_user(self, user: UserCredentials) -> bool:
         """Change the router user credentials."""
-        driver = self.get_driver()
-        try:
-            driver.get("http://192.168.0.1")
-
-            password_field = self.wait_and_find_element(driver, By.ID, "pcPassword")
-            password_field.send_keys(self.router_password)
-
-            login_button = self.wait_and_find_element(driver, By.ID, "loginBtn")
-            login_button.click()
-
-            driver.switch_to.frame("frame1")
-            network_menu = self.wait_and_find_element(driver, By.ID, "menu_network")
-            network_menu.click()
-
-            driver.switch_to.default_content()
-            driver.switch_to.frame("frame2")
-
-            # Update credentials
-            username_field = self.wait_and_find_element(driver, By.ID, "username")
-            password_field = self.wait_and_find_element(driver, By.ID, "pwd")
-            confirm_field = self.wait_and_find_element(driver, By.ID, "pwd2")
-
-            driver.execute_script("arguments[0].value = '';", username_field)
-            username_field.send_keys(user.username)
-
-            driver.execute_script("arguments[0].value = '';", password_field)
-            password_field.send_keys(user.password)
-
-            driver.execute_script("arguments[0].value = '';", confirm_field)
-            confirm_field.send_keys(user.password)
-
-            save_button = self.wait_and_find_element(driver, By.ID, "saveBtn")
-            save_button.click()
-
-            self.logger.info(f"Successfully changed user to {user.name}")
-            return True
-
-        except Exception as e:
-            self.logger.error(f"Error changing user to {user.name}: {str(e)}")
-            self.send_email(
-                "Change User Error", f"Error changing user to {user.name}: {str(e)}"
-            )
-            return False
-
-        finally:
-            driver.quit()
+        if self.http is not None:
+            try:
+                self.http.change_user(
+                    self.router_password, user.username, user.password
+                )
+                self.logger.info(f"Successfully changed user to {user.name}")
+                return True
+            except BackendError as e:
+                self.logger.warning(f"HTTP backend failed, using Selenium: {e}")
+        with self.router_pool.session() as driver:
+            try:
+                driver.get("http://192.168.0.1")
+
+                password_field = self.wait_and_find_element(driver, By.ID, "pcPassword")
+                password_field.send_keys(self.router_password)
+
+                login_button = self.wait_and_find_element(driver, By.ID, "loginBtn")
+                login_button.click()
+
+                driver.switch_to.frame("frame1")
+                network_menu = self.wait_and_find_element(driver, By.ID, "menu_network")
+                network_menu.click()
+
+                driver.switch_to.default_content()
+                driver.switch_to.frame("frame2")
+
+                # Update credentials
+                username_field = self.wait_and_find_element(driver, By.ID, "username")
+                password_field = self.wait_and_find_element(driver, By.ID, "pwd")
+                confirm_field = self.wait_and_find_element(driver, By.ID, "pwd2")
+
+                driver.execute_script("arguments[0].value = '';", username_field)
+                username_field.send_keys(user.username)
+
+                driver.execute_script("arguments[0].value = '';", password_field)
+                password_field.send_keys(user.password)
+
+                driver.execute_script("arguments[0].value = '';", confirm_field)
+                confirm_field.send_keys(user.password)
+
+                save_button = self.wait_and_find_element(driver, By.ID, "saveBtn")
+                save_button.click()
+
+                self.logger.info(f"Successfully changed user to {user.name}")
+                return True
+
+            except Exception as e:
+                self.logger.error(f"Error changing user to {user.name}: {str(e)}")
+                self.send_email(
+                    "Change User Error", f"Error changing user to {user.name}: {str(e)}"
+                )
+                return False
 
     def check_status(self, user: UserCredentials) -> Optional[int]:
         """Check the usage status for a given user."""
-        driver = self.get_driver()
-        try:
-            driver.get("http://10.220.20.12/index.php/home/login")
-
-            username_field = self.wait_and_find_element(driver, By.ID, "username")
-            username_field.send_keys(user.username)
-
-            password_field = self.wait_and_find_element(driver, By.ID, "password")
-            password_field.send_keys(user.password)
-
-            sign_in = self.wait_and_find_element(
-                driver, By.XPATH, "//button[text()='Sign In']"
-            )
-            sign_in.click()
-
-            usage_element = self.wait_and_find_element(
-                driver,
-                By.XPATH,
-                "(//td[contains(normalize-space(text()), 'Minute')])[1]",
-            )
-
-            usage = int(usage_element.text.split(" ")[0])
-            self.logger.info(f"Usage for {user.name}: {usage} minutes")
-            return usage
-
-        except Exception as e:
-            self.logger.error(f"Error checking status for {user.name}: {str(e)}")
-            self.send_email(
-                "Check Status Error", f"Error checking status for {user.name}: {str(e)}"
-            )
-            return None
-
-        finally:
-            driver.quit()
+        if self.http is not None:
+            try:
+                usage = self.http.usage(user.username, user.password)
+                self.logger.info(f"Usage for {user.name}: {usage} minutes")
+                return usage
+            except BackendError as e:
+                self.logger.warning(f"HTTP backend failed, using Selenium: {e}")
+        with self.portal_pool.session() as driver:
+            try:
+                driver.get("http://10.220.20.12/index.php/home/login")
+
+                username_field = self.wait_and_find_element(driver, By.ID, "username")
+                username_field.send_keys(user.username)
+
+                password_field = self.wait_and_find_element(driver, By.ID, "password")
+                password_field.send_keys(user.password)
+
+                sign_in = self.wait_and_find_element(
+                    driver, By.XPATH, "//button[text()='Sign In']"
+                )
+                sign_in.click()
+
+                usage_element = self.wait_and_find_element(
+                    driver,
+                    By.XPATH,
+                    "(//td[contains(normalize-space(text()), 'Minute')])[1]",
+                )
+
+                usage = int(usage_element.text.split(" ")[0])
+                self.logger.info(f"Usage for {user.name}: {usage} minutes")
+                return usage
+
+            except Exception as e:
+                # collect_usage reports every failed check in one email
+                self.logger.error(f"Error checking status for {user.name}: {str(e)}")
+                raise
 
     def send_email(self, subject: str, body: str):
         """Send email notification."""
@@ -192,29 +214,71 @@ class InternetUsageMonitor:
     def run(self):
         """Main execution loop."""
         while True:
+            # Check all accounts at once, so the next one is chosen on fresh data
+            snapshot = collect_usage(
+                self.users,
+                self.check_status,
+                worker_count(self.users, self.http is not None),
+            )
+            if snapshot.errors:
+                self.send_email(
+                    "Check Status Error",
+                    snapshot.failure_report([user.name for user in self.users]),
+                )
             current_user = self.users[self.current_index]
-            usage = self.check_status(current_user)
+            usage = snapshot.usage[self.current_index]
 
             if usage is None:
                 self.logger.error("Unable to fetch usage. Retrying in 5 minutes.")
                 time.sleep(300)
                 continue
 
-            if usage > self.threshold_usage:
-                self.logger.info(f"Usage threshold exceeded for {current_user.name}")
-                self.current_index = (self.current_index + 1) % len(self.users)
-                new_user = self.users[self.current_index]
-
+            self.burn_rate.record(usage)
+            plan = plan_rotation(
+                snapshot.usage,
+                self.current_index,
+                self.threshold_usage,
+                self.burn_rate.rate(),
+                margin=self.burn_rate.margin,
+            )
+            self.logger.info(f"Rotation plan:\n{plan}")
+            next_index = plan.next_account(
+                self.current_index, usage, self.burn_rate.margin
+            )
+            if (
+                next_index is None
+                and plan.switch_usage(self.current_index) is None
+                and self.burn_rate.due(usage)
+            ):
+                # Nothing planned, so leave a nearly spent account for the
+                # one with the most quota left, if any has some
+                next_index = snapshot.least_used(
+                    exclude=self.current_index,
+                    below=self.threshold_usage - self.burn_rate.margin,
+                )
+
+            if next_index is None:
+                minutes = self.burn_rate.next_check(
+                    plan.switch_usage(self.current_index)
+                )
+            else:
+                new_user = self.users[next_index]
+                self.logger.info(f"Planned switch away from {current_user.name}")
                 if self.change_user(new_user):
+                    self.current_index = next_index
+                    self.switch_failures = 0
+                    self.burn_rate.reset()
                     self.send_email(
                         "User Changed",
-                        f"Switched from {current_user.name} to {new_user.name} due to usage threshold",
+                        f"Switched from {current_user.name} to {new_user.name} as planned",
                     )
-                continue
-
-            minutes_remaining = self.threshold_usage - usage
-            self.logger.info(f"Scheduling next check in {minutes_remaining} minutes")
-            time.sleep(minutes_remaining * 60)
+                    # Check the new account once the router has reconnected
+                    minutes = self.burn_rate.min_interval
+                else:
+                    self.switch_failures += 1
+                    minutes = self.burn_rate.backoff(self.switch_failures)
+            self.logger.info(f"Scheduling next check in {minutes:.0f} minutes")
+            time.sleep(minutes * 60)
 
 
 if __name__ == "__main__":
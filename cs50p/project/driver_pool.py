@@ -0,0 +1,96 @@
+"""
+Pools of warm WebDriver sessions.
+
+Starting Firefox takes seconds and a few hundred MB, so instead of a new
+browser for every router or portal call, a DriverPool keeps idle sessions
+and lends them out with `session()`. A session is health-checked before
+it is lent and reset (frames left, cookies cleared, blank page) when it
+comes back. It is quit instead of reused after `max_uses` loans, or when
+the check or the reset fails, which is how a crashed browser shows up.
+"""
+
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+MAX_USES = 50
+
+
+class DriverPool:
+    def __init__(self, factory, name="driver", size=1, max_uses=MAX_USES):
+        """
+        `factory` starts a new WebDriver; at most `size` sessions are
+        lent at once.
+        """
+        self.factory = factory
+        self.name = name
+        self.max_uses = max_uses
+        self.idle = []  # [driver, uses] pairs, most recently used last
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        # Leftover browsers outlive the Python process otherwise
+        atexit.register(self.close)
+
+    @contextmanager
+    def session(self):
+        """Lend a healthy driver for the duration of a with block."""
+        with self.slots:
+            driver, uses = self._acquire()
+            try:
+                yield driver
+            finally:
+                self._release(driver, uses + 1)
+
+    def close(self):
+        """Quit every idle driver."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for driver, _ in idle:
+            self._quit(driver)
+
+    def _acquire(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                driver, uses = self.idle.pop()
+            if self._healthy(driver):
+                return driver, uses
+            logger.warning(f"Discarding unresponsive {self.name} session")
+            self._quit(driver)
+        logger.info(f"Starting a new {self.name} session")
+        return self.factory(), 0
+
+    def _release(self, driver, uses):
+        if uses >= self.max_uses:
+            logger.info(f"Recycling {self.name} session after {uses} uses")
+            self._quit(driver)
+            return
+        try:
+            driver.switch_to.default_content()
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except WebDriverException as e:
+            logger.warning(f"Discarding {self.name} session that failed to reset: {e}")
+            self._quit(driver)
+            return
+        with self.lock:
+            self.idle.append([driver, uses])
+
+    def _healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
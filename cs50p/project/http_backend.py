@@ -0,0 +1,189 @@
+"""
+Browserless access to the router admin pages and the usage portal.
+
+HttpBackend repeats the steps the Selenium code takes, with a requests
+Session and the standard library's HTML parser instead of a browser: it
+submits the login forms, follows the router's frame1 menu link to the
+network page, and reads or posts the username and password fields there,
+checking that a posted username was saved, or reads the first "Minute"
+cell of the portal. Any step that does not
+find what it expects raises BackendError, so callers can fall back to
+Selenium.
+"""
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+
+ROUTER_URL = "http://192.168.0.1"
+PORTAL_URL = "http://10.220.20.12/index.php/home/login"
+
+
+class BackendError(Exception):
+    """A page did not look the way the backend expected."""
+
+    pass
+
+
+class _Page(HTMLParser):
+    """The forms, elements by id, frames and table cells of a page."""
+
+    def __init__(self, url, html):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.forms = []
+        self.ids = {}
+        self.frames = {}
+        self.cells = []
+        self._form = None
+        self._select = None
+        self._cell = None
+        self.feed(html)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        if tag == "button":
+            attrs.setdefault("type", "submit")
+        if "id" in attrs:
+            self.ids[attrs["id"]] = attrs
+        if tag == "form":
+            self._form = {
+                "action": urljoin(self.url, attrs.get("action", "")),
+                "method": attrs.get("method", "get").lower(),
+                "fields": [],
+            }
+            self.forms.append(self._form)
+        elif (
+            tag in ("input", "button", "select", "textarea") and self._form is not None
+        ):
+            self._form["fields"].append(attrs)
+            if tag == "select":
+                self._select = attrs
+        elif tag == "option" and self._select is not None:
+            # A select submits its selected option, or else its first
+            if "selected" in attrs or "value" not in self._select:
+                self._select["value"] = attrs.get("value", "")
+        elif tag in ("frame", "iframe") and "name" in attrs:
+            self.frames[attrs["name"]] = urljoin(self.url, attrs.get("src", ""))
+        elif tag == "td":
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "select":
+            self._select = None
+        elif tag == "td" and self._cell is not None:
+            self.cells.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def form_with(self, element_id):
+        """Return the form containing the element with `element_id`."""
+        for form in self.forms:
+            if any(field.get("id") == element_id for field in form["fields"]):
+                return form
+        raise BackendError(f"No form with #{element_id} at {self.url}")
+
+    def value(self, element_id):
+        try:
+            return self.ids[element_id].get("value", "")
+        except KeyError:
+            raise BackendError(f"No #{element_id} at {self.url}") from None
+
+
+class HttpBackend:
+    def __init__(self, router_url=ROUTER_URL, portal_url=PORTAL_URL, timeout=10):
+        self.router_url = router_url
+        self.portal_url = portal_url
+        self.timeout = timeout
+
+    def fetch_username(self, router_pass):
+        """Return the PPPoE username currently set on the router."""
+        with requests.Session() as session:
+            return self._network_page(session, router_pass).value("username")
+
+    def change_user(self, router_pass, username, password):
+        """
+        Set the router's PPPoE username and password. The network page
+        is reloaded afterwards, and unless it shows the new username,
+        BackendError is raised: a router whose pages save through
+        JavaScript answers the plain form post without saving anything.
+        """
+        with requests.Session() as session:
+            page = self._network_page(session, router_pass)
+            self._submit(
+                session,
+                page,
+                "saveBtn",
+                {"username": username, "pwd": password, "pwd2": password},
+            )
+            saved = self._network_page(session, router_pass).value("username")
+        if saved != username:
+            raise BackendError(f"Router kept username {saved!r} after saving")
+
+    def usage(self, username, password):
+        """Return the minutes used by an account, read from the portal."""
+        with requests.Session() as session:
+            page = self._get(session, self.portal_url)
+            page = self._submit(
+                session, page, "username", {"username": username, "password": password}
+            )
+        for cell in page.cells:
+            if "Minute" in cell:
+                try:
+                    return int(cell.split(" ")[0])
+                except ValueError:
+                    raise BackendError(f"Unreadable usage {cell!r}") from None
+        raise BackendError(f"No usage at {page.url}; wrong credentials?")
+
+    def _network_page(self, session, router_pass):
+        page = self._get(session, self.router_url)
+        page = self._submit(session, page, "pcPassword", {"pcPassword": router_pass})
+        if "frame1" not in page.frames:
+            raise BackendError(f"No menu frame at {page.url}; wrong password?")
+        menu = self._get(session, page.frames["frame1"])
+        try:
+            link = menu.ids["menu_network"]["href"]
+        except KeyError:
+            raise BackendError(f"No network menu link at {menu.url}") from None
+        return self._get(session, urljoin(menu.url, link))
+
+    def _get(self, session, url):
+        return self._request(session, "get", url)
+
+    def _submit(self, session, page, element_id, values):
+        """
+        Submit the form containing `element_id` with its fields set by
+        id from `values`, as a browser would.
+        """
+        form = page.form_with(element_id)
+        data = {}
+        for field in form["fields"]:
+            name = field.get("name")
+            if not name:
+                continue
+            if field.get("type") in ("submit", "button", "image", "reset"):
+                continue
+            if field.get("type") in ("checkbox", "radio") and "checked" not in field:
+                continue
+            data[name] = values.get(field.get("id"), field.get("value", ""))
+        for element in values:
+            if not any(field.get("id") == element for field in form["fields"]):
+                raise BackendError(f"No #{element} at {page.url}")
+        if form["method"] == "post":
+            return self._request(session, "post", form["action"], data=data)
+        return self._request(session, "get", form["action"], params=data)
+
+    def _request(self, session, method, url, **kwargs):
+        try:
+            response = session.request(method, url, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise BackendError(str(e)) from e
+        return _Page(response.url, response.text)
@@ -8,6 +8,11 @@ import yagmail
 import json
 from dotenv import load_dotenv
 from selenium.common.exceptions import WebDriverException, NoSuchElementException
+from driver_pool import DriverPool
+from http_backend import BackendError, HttpBackend
+from usage_collector import collect_usage, worker_count
+from burn_rate import SAFETY_MARGIN, BurnRateScheduler
+from rotation_planner import plan_rotation
 
 
 def fetch_info():
@@ -49,128 +54,188 @@ IDS, ROUTER_PASS, EMAIL_USER, EMAIL_PASS, TO_EMAILS, THRESHOLD_USAGE, DRIVER_PAT
     fetch_info()
 )
 INDEX = 0
+SWITCH_FAILURES = 0
+ROUTER_POOL = DriverPool(lambda: get_driver(), "router")
+PORTAL_POOL = DriverPool(lambda: get_driver(), "portal", size=worker_count(IDS))
+# BACKEND=http tries plain HTTP requests first and falls back to Selenium
+HTTP = HttpBackend() if os.getenv("BACKEND") == "http" else None
+BURN_RATE = BurnRateScheduler(
+    THRESHOLD_USAGE, int(os.getenv("SAFETY_MARGIN", str(SAFETY_MARGIN)))
+)
 
 
 def main():
-    global INDEX
+    """
+    Check every account, switch if the plan says so, and return the
+    minutes until the next check, or None if the check could not run.
+    """
+    global INDEX, SWITCH_FAILURES
 
     current_user = fetch_current_user()
     if current_user is None:
         print("Unable to fetch the current user. Exiting.")
         return
 
-    usage = check_status(current_user)
+    # Check all accounts at once, so the next one is chosen on fresh data
+    INDEX = IDS.index(current_user)
+    snapshot = collect_usage(IDS, check_status, worker_count(IDS, HTTP is not None))
+    if snapshot.errors:
+        # One email for the whole round, however many checks failed
+        names = [ID["name"] for ID in IDS]
+        send_email("Check Status Error", snapshot.failure_report(names), TO_EMAILS)
+    usage = snapshot.usage[INDEX]
     if usage is None:
         print("Unable to fetch usage. Exiting.")
         return
 
-    if usage > 11000:
-        INDEX = (INDEX + 1) % len(IDS)
-        change_user(IDS[INDEX])
+    BURN_RATE.record(usage)
+    plan = plan_rotation(
+        snapshot.usage,
+        INDEX,
+        THRESHOLD_USAGE,
+        BURN_RATE.rate(),
+        margin=BURN_RATE.margin,
+    )
+    print(plan)
+    next_index = plan.next_account(INDEX, usage, BURN_RATE.margin)
+    if next_index is None and plan.switch_usage(INDEX) is None and BURN_RATE.due(usage):
+        # Nothing planned, so leave a nearly spent account for the one
+        # with the most quota left, if any has some
+        next_index = snapshot.least_used(
+            exclude=INDEX, below=THRESHOLD_USAGE - BURN_RATE.margin
+        )
+
+    if next_index is None:
+        minutes = BURN_RATE.next_check(plan.switch_usage(INDEX))
+    elif change_user(IDS[next_index]):
+        INDEX = next_index
+        SWITCH_FAILURES = 0
+        BURN_RATE.reset()
+        # Check the new account once the router has reconnected
+        minutes = BURN_RATE.min_interval
     else:
-        scheduler(THRESHOLD_USAGE - usage)
+        SWITCH_FAILURES += 1
+        minutes = BURN_RATE.backoff(SWITCH_FAILURES)
+    return minutes
 
 
 def fetch_current_user():
-    driver = get_driver()
-    try:
-        driver.get("http://192.168.0.1")
-        driver.implicitly_wait(10)
-        driver.find_element(By.ID, "pcPassword").send_keys(ROUTER_PASS)
-        driver.find_element(By.ID, "loginBtn").click()
-        driver.implicitly_wait(10)
-
-        driver.switch_to.frame("frame1")
-        driver.find_element(By.ID, "menu_network").click()
-        driver.switch_to.default_content()
-        driver.switch_to.frame("frame2")
-
-        username_field = driver.find_element(By.ID, "username")
-        for idx, ID in enumerate(IDS):
-            if ID["username"] == username_field.get_attribute("value"):
-                return ID
-        print("No matching user found.")
-        return None
-    except WebDriverException as e:
-        print(f"Error in fetching current user: {e}")
-        send_email(
-            "Change User Error", f"Error in fetching current user: {e}", TO_EMAILS
-        )
-        return None
-    finally:
-        driver.quit()
+    if HTTP is not None:
+        try:
+            username = HTTP.fetch_username(ROUTER_PASS)
+            for ID in IDS:
+                if ID["username"] == username:
+                    return ID
+            print("No matching user found.")
+            return None
+        except BackendError as e:
+            print(f"HTTP backend failed, using Selenium: {e}")
+    with ROUTER_POOL.session() as driver:
+        try:
+            driver.get("http://192.168.0.1")
+            driver.implicitly_wait(10)
+            driver.find_element(By.ID, "pcPassword").send_keys(ROUTER_PASS)
+            driver.find_element(By.ID, "loginBtn").click()
+            driver.implicitly_wait(10)
+
+            driver.switch_to.frame("frame1")
+            driver.find_element(By.ID, "menu_network").click()
+            driver.switch_to.default_content()
+            driver.switch_to.frame("frame2")
+
+            username_field = driver.find_element(By.ID, "username")
+            for idx, ID in enumerate(IDS):
+                if ID["username"] == username_field.get_attribute("value"):
+                    return ID
+            print("No matching user found.")
+            return None
+        except WebDriverException as e:
+            print(f"Error in fetching current user: {e}")
+            send_email(
+                "Change User Error", f"Error in fetching current user: {e}", TO_EMAILS
+            )
+            return None
 
 
 def get_driver():
+    options = webdriver.FirefoxOptions()
+    options.add_argument("--headless")
     service = Service("/usr/local/bin/geckodriver")
-    return webdriver.Firefox(service=service)
+    return webdriver.Firefox(service=service, options=options)
 
 
 def change_user(user):
-    driver = get_driver()
-    try:
-        driver.get("http://192.168.0.1")
-        driver.implicitly_wait(10)
-        driver.find_element(By.ID, "pcPassword").send_keys(ROUTER_PASS)
-        driver.find_element(By.ID, "loginBtn").click()
-        driver.implicitly_wait(10)
-
-        driver.switch_to.frame("frame1")
-        driver.find_element(By.ID, "menu_network").click()
-        driver.switch_to.default_content()
-        driver.switch_to.frame("frame2")
-
-        username_field = driver.find_element(By.ID, "username")
-        driver.execute_script("arguments[0].value = '';", username_field)
-        username_field.send_keys(user["username"])
-
-        password_field = driver.find_element(By.ID, "pwd")
-        confirm_password_field = driver.find_element(By.ID, "pwd2")
-
-        driver.execute_script("arguments[0].value = '';", password_field)
-        password_field.send_keys(user["password"])
-
-        driver.execute_script("arguments[0].value = '';", confirm_password_field)
-        confirm_password_field.send_keys(user["password"])
-
-        driver.find_element(By.ID, "saveBtn").click()
-    except WebDriverException as e:
-        print(f"Error in change_user: {e}")
-        send_email(
-            "Change User Error",
-            f"Error changing user to {user['name']}: {e}",
-            TO_EMAILS,
-        )
-    finally:
-        driver.quit()
+    if HTTP is not None:
+        try:
+            HTTP.change_user(ROUTER_PASS, user["username"], user["password"])
+            return True
+        except BackendError as e:
+            print(f"HTTP backend failed, using Selenium: {e}")
+    with ROUTER_POOL.session() as driver:
+        try:
+            driver.get("http://192.168.0.1")
+            driver.implicitly_wait(10)
+            driver.find_element(By.ID, "pcPassword").send_keys(ROUTER_PASS)
+            driver.find_element(By.ID, "loginBtn").click()
+            driver.implicitly_wait(10)
+
+            driver.switch_to.frame("frame1")
+            driver.find_element(By.ID, "menu_network").click()
+            driver.switch_to.default_content()
+            driver.switch_to.frame("frame2")
+
+            username_field = driver.find_element(By.ID, "username")
+            driver.execute_script("arguments[0].value = '';", username_field)
+            username_field.send_keys(user["username"])
+
+            password_field = driver.find_element(By.ID, "pwd")
+            confirm_password_field = driver.find_element(By.ID, "pwd2")
+
+            driver.execute_script("arguments[0].value = '';", password_field)
+            password_field.send_keys(user["password"])
+
+            driver.execute_script("arguments[0].value = '';", confirm_password_field)
+            confirm_password_field.send_keys(user["password"])
+
+            driver.find_element(By.ID, "saveBtn").click()
+            return True
+        except WebDriverException as e:
+            print(f"Error in change_user: {e}")
+            send_email(
+                "Change User Error",
+                f"Error changing user to {user['name']}: {e}",
+                TO_EMAILS,
+            )
+            return False
 
 
 def check_status(user):
-    driver = get_driver()
-    try:
-        driver.get("http://10.220.20.12/index.php/home/login")
-        driver.find_element(By.ID, "username").send_keys(user["username"])
-        driver.find_element(By.ID, "password").send_keys(user["password"])
-        driver.find_element(By.XPATH, "//button[text()='Sign In']").click()
-        driver.implicitly_wait(5)
-
-        usage = int(
-            driver.find_element(
-                By.XPATH, "(//td[contains(normalize-space(text()), 'Minute')])[1]"
-            ).text.split(" ")[0]
-        )
-        print(f"Usage for {user['name']}: {usage} minutes")
-        return usage
-    except (NoSuchElementException, ValueError, WebDriverException) as e:
-        print(f"Error in check_status: {e}")
-        send_email(
-            "Check Status Error",
-            f"Error checking status for {user['name']}: {e}",
-            TO_EMAILS,
-        )
-        return None
-    finally:
-        driver.quit()
+    if HTTP is not None:
+        try:
+            usage = HTTP.usage(user["username"], user["password"])
+            print(f"Usage for {user['name']}: {usage} minutes")
+            return usage
+        except BackendError as e:
+            print(f"HTTP backend failed, using Selenium: {e}")
+    with PORTAL_POOL.session() as driver:
+        try:
+            driver.get("http://10.220.20.12/index.php/home/login")
+            driver.find_element(By.ID, "username").send_keys(user["username"])
+            driver.find_element(By.ID, "password").send_keys(user["password"])
+            driver.find_element(By.XPATH, "//button[text()='Sign In']").click()
+            driver.implicitly_wait(5)
+
+            usage = int(
+                driver.find_element(
+                    By.XPATH, "(//td[contains(normalize-space(text()), 'Minute')])[1]"
+                ).text.split(" ")[0]
+            )
+            print(f"Usage for {user['name']}: {usage} minutes")
+            return usage
+        except (NoSuchElementException, ValueError, WebDriverException) as e:
+            # collect_usage reports every failed check in one email
+            print(f"Error in check_status: {e}")
+            raise
 
 
 def send_email(subject, body, to_emails):
@@ -183,11 +248,31 @@ def send_email(subject, body, to_emails):
 
 
 def scheduler(minutes):
-    schedule.every(minutes).minutes.do(lambda: main())
+    """
+    Run main() after `minutes`, then again after each delay it returns,
+    from this one loop, so checks never nest. A check that could not run
+    is retried after the previous delay.
+    """
+    delays = []
+
+    def check():
+        delays.append(main())
+        return schedule.CancelJob
+
     while True:
-        schedule.run_pending()
-        time.sleep(1)
+        # Each check picks its own delay, so replace the previous job
+        schedule.clear()
+        print(f"Next check in {minutes:.0f} minutes")
+        schedule.every(minutes).minutes.do(check)
+        while not delays:
+            schedule.run_pending()
+            time.sleep(1)
+        delay = delays.pop()
+        if delay is not None:
+            minutes = delay
 
 
 if __name__ == "__main__":
-    main()
+    minutes = main()
+    if minutes is not None:
+        scheduler(minutes)
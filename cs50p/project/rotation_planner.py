@@ -0,0 +1,231 @@
+"""
+Planning which account to use for the rest of the billing month.
+
+Usage: python rotation_planner.py USAGE [USAGE ...] [--current INDEX]
+                                  [--threshold MINUTES] [--rate RATE]
+                                  [--margin MINUTES]
+
+Each account may use `threshold - usage` more minutes this month. At a
+burn rate of `rate` quota minutes per wall-clock minute, staying online
+until the month ends needs `rate` times the minutes left. When the
+accounts together have more than that, connected time is the whole month
+whatever the order, so the plan spends the accounts down to a common
+reserve: every account it uses keeps the same spare minutes, which is
+the most slack against a higher burn rate than expected. When they have
+less, the plan uses every account to its threshold, and the line is
+offline for the rest of the month. The account in use comes first, so
+the plan switches only when it must; it stays in the plan while it can
+fill a slice worth a switch, even below the common reserve, and slices
+too small to be worth a switch are left in reserve. Plans are cheap, so callers re-plan on every
+new usage snapshot.
+"""
+
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class Step:
+    """Use `account` for `minutes` of quota, leaving it at `switch_usage`."""
+
+    account: int
+    minutes: float
+    switch_usage: float
+    start: datetime
+    end: datetime
+
+
+@dataclass
+class Plan:
+    created: datetime
+    month_end: datetime
+    rate: float
+    reserve: float  # quota minutes each used account keeps
+    offline: float  # wall-clock minutes left without quota
+    steps: List[Step]
+
+    def switch_usage(self, account: int) -> Optional[float]:
+        """Return the usage at which to leave `account`, if it is planned."""
+        for step in self.steps:
+            if step.account == account:
+                return step.switch_usage
+        return None
+
+    def next_account(
+        self, current: int, usage: int, margin: float = 0
+    ) -> Optional[int]:
+        """
+        Return the account to switch to now, or None to stay on
+        `current`, whose usage is `usage`. Within `margin` minutes of its
+        switch usage, an account counts as spent.
+        """
+        steps = self.steps
+        if steps and steps[0].account == current:
+            if usage + margin < steps[0].switch_usage:
+                return None
+            steps = steps[1:]
+        return steps[0].account if steps else None
+
+    def __str__(self):
+        lines = [
+            f"Planned {self.created:%Y-%m-%d %H:%M} until "
+            f"{self.month_end:%Y-%m-%d %H:%M} at {self.rate:.2f} min/min, "
+            f"reserve {self.reserve:.0f} min, offline {self.offline:.0f} min"
+        ]
+        for step in self.steps:
+            lines.append(
+                f"  account {step.account}: {step.minutes:.0f} min, "
+                f"{step.start:%m-%d %H:%M} to {step.end:%m-%d %H:%M}, "
+                f"switch at {step.switch_usage:.0f}"
+            )
+        return "\n".join(lines)
+
+
+def month_end(now: datetime) -> datetime:
+    """Return the start of the month after `now`."""
+    return (now.replace(day=28) + timedelta(days=4)).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def plan_rotation(
+    usage: Sequence[Optional[int]],
+    current: int,
+    threshold: int,
+    rate: Optional[float] = None,
+    now: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    margin: float = 0,
+) -> Plan:
+    """
+    Plan the accounts, whose minutes used are `usage` (None for unknown
+    accounts, which are left out), from `now` until `end`, the end of
+    the month by default. Without a measured `rate`, assume the line is
+    busy all the time.
+
+    Accounts are left `margin` minutes before their switch usage (see
+    Plan.next_account), so a slice of less than twice the margin would
+    be left soon after it is entered. The plan uses fewer accounts
+    instead, and those minutes stay in reserve. When not even one
+    account gets such a slice, the plan has no steps and the account in
+    use is kept until it nears the threshold.
+    """
+    now = datetime.now() if now is None else now
+    end = month_end(now) if end is None else end
+    rate = 1.0 if rate is None else rate
+    minutes_left = max(0.0, (end - now).total_seconds() / 60)
+    remaining = {
+        account: max(0, threshold - used)
+        for account, used in enumerate(usage)
+        if used is not None
+    }
+    # Most minutes left first. The account in use counts a minimum slice
+    # more, so re-planning does not leave it for one just slightly fuller
+    bonus = {current: 2 * margin}
+    candidates = sorted(
+        remaining,
+        key=lambda account: (
+            -remaining[account] - bonus.get(account, 0),
+            account != current,
+        ),
+    )
+    need = rate * minutes_left
+    reserve, allotted = _allot(candidates, remaining, need, margin)
+    # Leveling can leave out the account in use when it is below the
+    # common reserve but far from spent. Leaving it would cost a reconnect
+    # for nothing, so while it can fill a minimum slice it goes first and
+    # only the other accounts are leveled over the rest of the need
+    first = min(remaining.get(current, 0), need)
+    if current not in allotted and first > 0 and first >= 2 * margin:
+        others = [account for account in candidates if account != current]
+        reserve, allotted = _allot(others, remaining, need - first, margin)
+        if not allotted:
+            reserve = remaining[current] - first
+        allotted[current] = first
+
+    order = sorted(allotted, key=lambda account: (-allotted[account], account))
+    if current in allotted:
+        order.remove(current)
+        order.insert(0, current)
+    steps = []
+    start = now
+    for account in order:
+        minutes = allotted[account]
+        step_end = start + timedelta(minutes=minutes / rate) if rate > 0 else end
+        steps.append(
+            Step(account, minutes, usage[account] + minutes, start, min(step_end, end))
+        )
+        start = step_end
+
+    # Without steps the account in use runs on until the threshold is near
+    usable = sum(allotted.values())
+    if not steps and current in remaining:
+        usable = max(0.0, remaining[current] - margin)
+    offline = 0.0
+    if rate > 0:
+        offline = max(0.0, minutes_left - usable / rate)
+    return Plan(now, end, rate, reserve, offline, steps)
+
+
+def _allot(
+    candidates: List[int], remaining: Dict[int, float], need: float, margin: float
+) -> Tuple[float, Dict[int, float]]:
+    """
+    Return the common reserve and the minutes each account gets when
+    `candidates`, most minutes first, are leveled to give `need`
+    minutes, dropping the last ones until every slice is at least twice
+    `margin`.
+    """
+    if need <= 0:
+        return 0.0, {}
+    for count in range(len(candidates), 0, -1):
+        used = candidates[:count]
+        level = _reserve([remaining[account] for account in used], need)
+        slices = {
+            account: remaining[account] - level
+            for account in used
+            if remaining[account] > level
+        }
+        if min(slices.values(), default=0) >= 2 * margin:
+            return level, slices
+    return 0.0, {}
+
+
+def _reserve(remaining: List[float], need: float) -> float:
+    """
+    Return the level L at which using every account down to L gives
+    `need` minutes in total, or 0 if all the accounts together give no
+    more than that.
+    """
+    if sum(remaining) <= need:
+        return 0.0
+    remaining = sorted(remaining, reverse=True)
+    total = 0.0
+    for k, minutes in enumerate(remaining, 1):
+        total += minutes
+        level = (total - need) / k
+        if k == len(remaining) or level >= remaining[k]:
+            return level
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("usage", type=int, nargs="+", help="minutes used per account")
+    parser.add_argument("-c", "--current", type=int, default=0)
+    parser.add_argument("-t", "--threshold", type=int, default=11600)
+    parser.add_argument("-r", "--rate", type=float, help="quota minutes per minute")
+    parser.add_argument("-m", "--margin", type=float, default=0, help="minutes")
+    args = parser.parse_args()
+    plan = plan_rotation(
+        args.usage, args.current, args.threshold, args.rate, margin=args.margin
+    )
+    print(plan)
+    switch = plan.next_account(args.current, args.usage[args.current], args.margin)
+    print("Stay" if switch is None else f"Switch to account {switch} now")
+
+
+if __name__ == "__main__":
+    main()
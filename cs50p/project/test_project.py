@@ -1,6 +1,19 @@
+import inspect
 import pytest
+import schedule
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
+from urllib.parse import parse_qs
 import project
+from driver_pool import DriverPool
+from http_backend import BackendError, HttpBackend
+from selenium.common.exceptions import WebDriverException
+from usage_collector import collect_usage, worker_count
+from burn_rate import BurnRateScheduler
+from rotation_planner import plan_rotation
 
 
 @pytest.fixture
@@ -20,6 +33,8 @@ def mock_driver():
         mock_driver = MagicMock()
         MockWebDriver.return_value = mock_driver
         yield mock_driver
+    project.ROUTER_POOL.close()
+    project.PORTAL_POOL.close()
 
 
 def test_get_driver(mock_driver):
@@ -39,3 +54,292 @@ def test_send_email(mock_env_vars):
         mock_smtp = MockSMTP.return_value
         project.send_email("Test Subject", "Test Body", ["test@example.com"])
         assert mock_smtp.send.called
+
+
+def test_change_user_reuses_driver(mock_env_vars, mock_driver):
+    project.change_user(project.IDS[0])
+    project.change_user(project.IDS[0])
+    assert project.webdriver.Firefox.call_count == 1
+    assert not mock_driver.quit.called
+
+
+def test_driver_pool_recycles_after_max_uses():
+    factory = MagicMock(side_effect=lambda: MagicMock())
+    pool = DriverPool(factory, max_uses=2)
+    for _ in range(3):
+        with pool.session():
+            pass
+    assert factory.call_count == 2
+    assert pool.idle[0][1] == 1
+
+
+def test_driver_pool_replaces_crashed_driver():
+    crashed = MagicMock()
+    factory = MagicMock(side_effect=[crashed, MagicMock()])
+    pool = DriverPool(factory)
+    with pool.session():
+        pass
+    type(crashed).current_url = property(MagicMock(side_effect=WebDriverException))
+    with pool.session() as driver:
+        assert driver is not crashed
+    assert crashed.quit.called
+
+
+PAGES = {
+    "/": '<form action="/login" method="post"><input id="pcPassword" '
+    'name="pcPassword" type="password"><input id="loginBtn" type="button">'
+    "</form>",
+    "/index": '<frameset><frame name="frame1" src="/menu">'
+    '<frame name="frame2" src="/blank"></frameset>',
+    "/menu": '<a id="menu_network" href="/network">Network</a>',
+    "/network": '<form action="/save" method="post"><select name="wan">'
+    '<option value="dhcp">DHCP</option><option value="pppoe" selected>PPPoE'
+    '</option></select><input id="username" name="user" value="{username}">'
+    '<input id="pwd" name="pwd" type="password" value="testpass">'
+    '<input id="pwd2" name="pwd2" type="password" value="testpass">'
+    '<input id="saveBtn" name="save" type="submit" value="Save"></form>',
+    "/index.php/home/login": '<form method="post"><input id="username" '
+    'name="username"><input id="password" name="password" type="password">'
+    '<button type="submit">Sign In</button></form>',
+}
+
+
+@pytest.fixture
+def stand_in():
+    """
+    A local stand-in for the router and the usage portal. The router
+    keeps the username it was saved with, unless `router["saves"]` is
+    false, as for a router that only saves through JavaScript.
+    """
+    posted = {}
+    router = {"username": "testuser", "saves": True}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = PAGES.get(self.path)
+            if self.path == "/network":
+                page = page.format(username=router["username"])
+            self.reply(page)
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            form = parse_qs(self.rfile.read(length).decode())
+            posted[self.path] = form
+            if self.path == "/login" and form.get("pcPassword") == ["routerpass"]:
+                self.reply(PAGES["/index"])
+            elif self.path == "/save":
+                if router["saves"]:
+                    router["username"] = form["user"][0]
+                self.reply("Saved")
+            elif form.get("password") == ["testpass"]:
+                self.reply("<table><tr><td> 1234  Minutes </td></tr></table>")
+            else:
+                self.reply("<p>Invalid login</p>")
+
+        def reply(self, body):
+            self.send_response(404 if body is None else 200)
+            self.end_headers()
+            self.wfile.write((body or "").encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    yield HttpBackend(url, f"{url}/index.php/home/login"), posted, router
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_backend_usage(stand_in):
+    backend, _, _ = stand_in
+    assert backend.usage("testuser", "testpass") == 1234
+    with pytest.raises(BackendError):
+        backend.usage("testuser", "wrongpass")
+
+
+def test_http_backend_change_user(stand_in):
+    backend, posted, router = stand_in
+    assert backend.fetch_username("routerpass") == "testuser"
+    backend.change_user("routerpass", "newuser", "newpass")
+    assert posted["/save"] == {
+        "wan": ["pppoe"],
+        "user": ["newuser"],
+        "pwd": ["newpass"],
+        "pwd2": ["newpass"],
+    }
+    assert backend.fetch_username("routerpass") == "newuser"
+    # A post the router answers without saving is not a switch
+    router["saves"] = False
+    with pytest.raises(BackendError):
+        backend.change_user("routerpass", "otheruser", "otherpass")
+    assert backend.fetch_username("routerpass") == "newuser"
+    with pytest.raises(BackendError):
+        backend.fetch_username("wrongpass")
+
+
+def test_check_status_falls_back_to_selenium(mock_env_vars, mock_driver):
+    mock_driver.find_element.return_value.text = "42 Minutes"
+    with patch.object(project, "HTTP", HttpBackend(portal_url="http://127.0.0.1:9")):
+        assert project.check_status(project.IDS[0]) == 42
+    assert mock_driver.get.called
+
+
+def test_change_user_falls_back_when_save_does_not_stick(
+    mock_env_vars, mock_driver, stand_in
+):
+    backend, _, router = stand_in
+    router["saves"] = False
+    with patch.object(project, "HTTP", backend), patch.object(
+        project, "ROUTER_PASS", "routerpass"
+    ):
+        assert project.change_user(project.IDS[0])
+    assert mock_driver.get.called
+    assert mock_driver.find_element.return_value.click.called
+
+
+def test_collect_usage_runs_checks_in_parallel():
+    def check(user):
+        time.sleep(0.2)
+        if user["name"] == "broken":
+            raise WebDriverException("crashed")
+        return user["minutes"]
+
+    users = [{"name": "a", "minutes": 9000}, {"name": "b", "minutes": 2000}]
+    users += [{"name": "broken"}, {"name": "d", "minutes": 11900}]
+    started = time.monotonic()
+    snapshot = collect_usage(users, check)
+    assert time.monotonic() - started < 0.6
+    assert snapshot.usage == [9000, 2000, None, 11900]
+    assert list(snapshot.errors) == [2]
+    report = snapshot.failure_report([user["name"] for user in users])
+    assert report.startswith("broken: ") and "crashed" in report
+    assert snapshot.least_used(exclude=1, below=11600) == 0
+    assert snapshot.least_used(exclude=0, below=1000) is None
+
+
+def test_worker_count_limits_browsers():
+    assert worker_count(range(10)) == 2
+    assert worker_count(range(10), http=True) == 4
+    assert worker_count(range(3), http=True) == 3
+    assert worker_count([]) == 1
+
+
+def test_burn_rate_scheduler():
+    burn_rate = BurnRateScheduler(11600, margin=100, window=60, max_interval=2000)
+    burn_rate.record(10000, now=0)
+    assert burn_rate.next_check() == 1500
+    # Half a minute of quota per minute over the last hour
+    burn_rate.record(10015, now=30 * 60)
+    burn_rate.record(10030, now=60 * 60)
+    assert burn_rate.rate() == 0.5
+    # 2940 minutes at that rate, but a busy line reaches 11600 in 1570
+    assert burn_rate.next_check() == 1570
+    burn_rate.record(11100, now=90 * 60)
+    assert burn_rate.samples[0] == (30 * 60, 10015)
+    assert burn_rate.rate() == 1.0
+    assert burn_rate.next_check() == 400
+    burn_rate.record(11550, now=100 * 60)
+    assert burn_rate.next_check() == burn_rate.min_interval
+    # A drop in usage means another account or a new month
+    burn_rate.record(200, now=110 * 60)
+    assert burn_rate.rate() is None
+
+
+def test_burn_rate_idle_line_waits_for_headroom_only():
+    burn_rate = BurnRateScheduler(11600, margin=100, max_interval=2000)
+    burn_rate.record(11000, now=0)
+    burn_rate.record(11000, now=60 * 60)
+    assert burn_rate.rate() == 0.0
+    assert burn_rate.next_check() == 600
+    assert burn_rate.next_check(limit=11300) == 300
+    # Switching happens at the target the schedule aims at
+    assert not burn_rate.due(11400)
+    assert burn_rate.due(11500)
+    assert burn_rate.due(11200, limit=11300)
+
+
+def test_scheduler_runs_checks_without_nesting(monkeypatch):
+    class Stop(Exception):
+        pass
+
+    delays, depths, scheduled = [10, None, 20], [], []
+
+    def main():
+        depths.append(len(inspect.stack()))
+        if not delays:
+            raise Stop
+        return delays.pop(0)
+
+    every = schedule.every
+    monkeypatch.setattr(project, "main", main)
+    monkeypatch.setattr(schedule, "every", lambda m: scheduled.append(m) or every(m))
+    monkeypatch.setattr(schedule, "run_pending", schedule.run_all)
+    monkeypatch.setattr(project.time, "sleep", lambda seconds: None)
+    with pytest.raises(Stop):
+        project.scheduler(5)
+    schedule.clear()
+    # A check that could not run is retried after the previous delay
+    assert scheduled == [5, 10, 10, 20]
+    assert len(set(depths)) == 1
+
+
+def test_plan_rotation():
+    now = datetime(2024, 3, 25)
+    # A week left, plenty of quota: spend every account to a common reserve
+    plan = plan_rotation([9000, 2000, 11900, None], 0, 11600, 1.0, now)
+    assert plan.month_end == datetime(2024, 4, 1)
+    assert plan.offline == 0
+    assert [step.account for step in plan.steps] == [0, 1]
+    assert sum(step.minutes for step in plan.steps) == 7 * 24 * 60
+    assert plan.reserve == 11600 - plan.switch_usage(0)
+    assert plan.steps[-1].end == plan.month_end
+    assert plan.next_account(0, 9000) is None
+    assert plan.next_account(0, plan.switch_usage(0) - 30, margin=60) == 1
+    # Too little quota: use every account up to the threshold
+    plan = plan_rotation([11000, 11500, 11600, 10000], 3, 11600, 1.0, now)
+    assert plan.reserve == 0
+    assert [step.account for step in plan.steps] == [3, 0, 1]
+    assert plan.offline == 7 * 24 * 60 - 2300
+    spent = plan_rotation([11600, 11600], 0, 11600, 1.0, now)
+    assert spent.steps == [] and spent.next_account(0, 11600) is None
+
+
+def test_plan_rotation_month_end_keeps_account():
+    # Three hours left and plenty of quota: equal slices would be 45
+    # minutes, under the margin, and every account would count as spent
+    now, usage, current = datetime(2026, 10, 31, 21), [11000] * 4, 0
+    plan = plan_rotation(usage, current, 11600, None, now, margin=60)
+    assert [step.account for step in plan.steps] == [0]
+    assert all(step.minutes >= 2 * 60 for step in plan.steps)
+    # Re-planning at every check until midnight never switches
+    for minutes in range(0, 180, 5):
+        plan = plan_rotation(
+            usage, current, 11600, None, now + timedelta(minutes=minutes), margin=60
+        )
+        assert plan.next_account(current, usage[current], 60) is None
+        usage[current] += 5
+    # Small slices are left in reserve rather than planned
+    plan = plan_rotation([11000, 11550], 1, 11600, 1.0, now, margin=60)
+    assert [step.account for step in plan.steps] == [0]
+
+
+def test_plan_rotation_keeps_account_below_reserve():
+    # The common reserve would be about 6576 minutes, above the 6600 - 6576
+    # = 24 minute slice left to account 0, which still has 6600 minutes
+    now = datetime(2026, 10, 11)
+    plan = plan_rotation([5000, 2000, 2000, 2000], 0, 11600, 0.3, now, margin=60)
+    assert plan.steps[0].account == 0
+    assert plan.next_account(0, 5000, 60) is None
+    assert sorted(step.account for step in plan.steps[1:]) == [1, 2, 3]
+    assert sum(step.minutes for step in plan.steps) == pytest.approx(0.3 * 21 * 24 * 60)
+    assert plan.offline == 0
+    # The decision does not depend on the measured rate
+    plan = plan_rotation([5000, 2000, 2000, 2000], 0, 11600, None, now, margin=60)
+    assert plan.next_account(0, 5000, 60) is None
+
+
+def test_burn_rate_backoff():
+    burn_rate = BurnRateScheduler(11600, min_interval=5, max_interval=60)
+    assert [burn_rate.backoff(n) for n in range(1, 6)] == [5, 10, 20, 40, 60]
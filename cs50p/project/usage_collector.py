@@ -0,0 +1,85 @@
+"""
+Concurrent usage checks of every configured account.
+
+collect_usage runs one check per account on a bounded thread pool. The
+checks spend their time waiting on the portal or a browser, so threads
+overlap them and a snapshot of all accounts takes about as long as the
+slowest single check. Failed checks are recorded in the snapshot rather
+than reported one by one, so callers can send a single summary.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 4
+# Each Selenium check drives its own Firefox, so fewer of them run at once
+SELENIUM_WORKERS = 2
+
+
+@dataclass
+class UsageSnapshot:
+    """Minutes used per account, in configuration order."""
+
+    usage: List[Optional[int]]
+    taken: float = field(default_factory=time.time)
+    errors: Dict[int, str] = field(default_factory=dict)  # failed checks
+
+    def least_used(
+        self, exclude: Optional[int] = None, below: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Return the index of the account with the fewest minutes used,
+        other than `exclude` and under `below`, or None if there is none.
+        """
+        candidates = [
+            (minutes, index)
+            for index, minutes in enumerate(self.usage)
+            if minutes is not None
+            and index != exclude
+            and (below is None or minutes < below)
+        ]
+        return min(candidates)[1] if candidates else None
+
+    def failure_report(self, names: Sequence[str]) -> str:
+        """Return one line per failed check, naming its account."""
+        return "\n".join(
+            f"{names[index]}: {error}" for index, error in sorted(self.errors.items())
+        )
+
+
+def worker_count(users: Sequence[Any], http: bool = False) -> int:
+    """
+    Return how many checks of `users` to run at once: up to MAX_WORKERS
+    over plain HTTP, and SELENIUM_WORKERS when they drive a browser.
+    """
+    limit = MAX_WORKERS if http else SELENIUM_WORKERS
+    return max(1, min(limit, len(users)))
+
+
+def collect_usage(
+    users: Sequence[Any],
+    check: Callable[[Any], Optional[int]],
+    max_workers: int = MAX_WORKERS,
+) -> UsageSnapshot:
+    """
+    Check every user in parallel with `check`, recording None for checks
+    that fail and the error of each one that raises.
+    """
+    errors = {}
+
+    def safe_check(index):
+        try:
+            return check(users[index])
+        except Exception as e:
+            logger.error(f"Usage check failed: {e}")
+            errors[index] = str(e).strip()
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(users)))) as pool:
+        usage = list(pool.map(safe_check, range(len(users))))
+    return UsageSnapshot(usage, errors=errors)